@@ -0,0 +1,256 @@
+import argparse
+import json
+import os
+import socket
+import socketserver
+import threading
+import time
+from collections import OrderedDict
+
+import db
+import spark_analysis
+from spark_analysis import (
+    PARQUET_PATH, JDBC_FETCH_SIZE, analyze_driver_speeds, create_analysis_table,
+    load_data_from_parquet, load_data_from_postgres, run_grid_tiles, run_incremental_analysis, run_safety_rollup,
+    run_speed_sketches, run_speed_timelines, save_incident_ranking, save_speed_percentile_ranking, save_to_postgres
+)
+
+# The service only listens on the loopback interface
+SERVICE_HOST = '127.0.0.1'
+SERVICE_PORT = int(os.getenv('ANALYSIS_SERVICE_PORT', 7071))
+
+# Input DataFrames kept cached between jobs, least recently used evicted first
+MAX_CACHED_INPUTS = 4
+
+class InputCache:
+    """
+    Cached (driver_id, speed) inputs keyed by source and date range
+
+    Each entry remembers the version of the source it was read from: the Parquet file
+    listing, or the reading counts of the days in its range (driving_record_days, kept
+    by the loaders), plus the undated readings when the range is unbounded. Loads into
+    other days and retention of days outside the range leave an entry valid; a job
+    whose range has changed since reads it again instead of reusing stale rows.
+    """
+
+    def __init__(self, spark, max_entries=MAX_CACHED_INPUTS):
+        self.spark = spark
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+
+    def source_version(self, source, parquet_path, start_date=None, end_date=None):
+        if source == 'parquet':
+            return frozenset(self.spark.read.parquet(parquet_path).inputFiles())
+        conn = db.connect()
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute("""
+                SELECT record_date, readings FROM driving_record_days
+                WHERE (%(start)s::date IS NULL OR record_date >= %(start)s::date)
+                  AND (%(end)s::date IS NULL OR record_date <= %(end)s::date)
+                ORDER BY record_date
+                """, {'start': start_date, 'end': end_date})
+                days = tuple(cursor.fetchall())
+                undated = None
+                if not start_date and not end_date:
+                    # Only the undated partition (or the record_time index) is read
+                    cursor.execute("SELECT count(*) FROM driving_records WHERE record_time IS NULL")
+                    undated = cursor.fetchone()[0]
+                return days, undated
+        finally:
+            conn.close()
+
+    def get(self, source, parquet_path, start_date=None, end_date=None,
+            num_partitions=None, fetch_size=JDBC_FETCH_SIZE):
+        """Return (DataFrame, hit) for the input of a job"""
+        key = (source, parquet_path if source == 'parquet' else None, start_date, end_date)
+        version = self.source_version(source, parquet_path, start_date, end_date)
+        entry = self.entries.pop(key, None)
+        if entry and entry[1] == version:
+            self.entries[key] = entry
+            return entry[0], True
+        if entry:
+            entry[0].unpersist()
+
+        if source == 'parquet':
+            df = load_data_from_parquet(self.spark, parquet_path, start_date, end_date, columns=['driver_id', 'speed'])
+        else:
+            df = load_data_from_postgres(self.spark, start_date, end_date, columns=['driver_id', 'speed'],
+                                         num_partitions=num_partitions, fetch_size=fetch_size)
+        # Materialized by the job's first action
+        df = df.cache()
+        self.entries[key] = (df, version)
+        while len(self.entries) > self.max_entries:
+            _, (evicted, _) = self.entries.popitem(last=False)
+            evicted.unpersist()
+        return df, False
+
+    def clear(self):
+        for df, _ in self.entries.values():
+            df.unpersist()
+        self.entries.clear()
+
+class AnalysisService:
+    """One warm SparkSession that runs analysis jobs one at a time"""
+
+    def __init__(self, spark):
+        self.spark = spark
+        self.cache = InputCache(spark)
+        self.started = time.time()
+        self.jobs_run = 0
+
+    def run_job(self, job):
+        """
+        Run one job and return its JSON-serializable result
+
+        A job is a dict with "command" ("analyze", "status", "clear_cache" or "shutdown")
+        and, for "analyze", the options of spark_analysis.main(): source, parquet_path,
+        start_date, end_date, num_partitions, fetch_size, incremental, safety_rollup,
+        incident_ranking, timeline_resolutions, grid_tiles, speed_percentiles.
+        """
+        command = job.get('command', 'analyze')
+        if command == 'status':
+            return {'status': 'ok', 'uptime_seconds': time.time() - self.started,
+                    'jobs_run': self.jobs_run, 'cached_inputs': len(self.cache.entries)}
+        if command == 'clear_cache':
+            self.cache.clear()
+            return {'status': 'ok'}
+        if command != 'analyze':
+            raise ValueError(f"Unknown command: {command}")
+
+        source = job.get('source', 'postgres')
+        parquet_path = job.get('parquet_path', PARQUET_PATH)
+        start_date = job.get('start_date')
+        end_date = job.get('end_date')
+        num_partitions = job.get('num_partitions')
+        fetch_size = job.get('fetch_size', JDBC_FETCH_SIZE)
+        incremental = job.get('incremental', False)
+
+        start = time.perf_counter()
+        cache_hit = None
+        if incremental:
+            analysis_df = run_incremental_analysis(self.spark, source, parquet_path, num_partitions, fetch_size)
+        else:
+            records_df, cache_hit = self.cache.get(source, parquet_path, start_date, end_date,
+                                                   num_partitions, fetch_size)
+            analysis_df = analyze_driver_speeds(records_df)
+        if not save_to_postgres(analysis_df):
+            raise RuntimeError("Saving the analysis results failed")
+        if job.get('safety_rollup'):
+            run_safety_rollup(self.spark, source, parquet_path, start_date, end_date,
+                              num_partitions, fetch_size, incremental)
+        if job.get('timeline_resolutions'):
+            run_speed_timelines(self.spark, source, parquet_path, start_date, end_date,
+                                num_partitions, fetch_size, incremental, job['timeline_resolutions'])
+        if job.get('grid_tiles'):
+            run_grid_tiles(self.spark, source, parquet_path, start_date, end_date,
+                           num_partitions, fetch_size, incremental)
+        if job.get('speed_percentiles'):
+            run_speed_sketches(self.spark, source, parquet_path, start_date, end_date,
+                               num_partitions, fetch_size, incremental)
+            save_speed_percentile_ranking(start_date, end_date)
+        if job.get('incident_ranking'):
+            save_incident_ranking(start_date, end_date)
+        self.jobs_run += 1
+        return {'status': 'ok', 'cache_hit': cache_hit, 'seconds': time.perf_counter() - start}
+
+class AnalysisRequestHandler(socketserver.StreamRequestHandler):
+    """Reads one JSON job per line and answers each with one JSON result line"""
+
+    def handle(self):
+        for line in self.rfile:
+            if not line.strip():
+                continue
+            try:
+                job = json.loads(line)
+                print(f"Job: {job}")
+                if job.get('command') == 'shutdown':
+                    response = {'status': 'ok'}
+                    threading.Thread(target=self.server.shutdown).start()
+                else:
+                    response = self.server.service.run_job(job)
+            except Exception as e:
+                print(f"Error running job: {e}")
+                response = {'status': 'error', 'error': str(e)}
+            print(f"Result: {response}")
+            self.wfile.write((json.dumps(response, default=str) + '\n').encode('utf-8'))
+            self.wfile.flush()
+
+def serve(host=SERVICE_HOST, port=SERVICE_PORT):
+    """
+    Start the warm session and serve jobs until a shutdown command arrives
+
+    Hadoop setup, the JDBC JAR and the SparkSession are resolved once here, so jobs only
+    pay for their own reads and aggregations. The JAR is never downloaded: it must exist
+    at JDBC_JAR_PATH. Connections are handled one at a time, so jobs queue in order.
+    """
+    try:
+        from setup_hadoop import setup_hadoop_for_windows
+        hadoop_home = setup_hadoop_for_windows()
+        print(f"Using Hadoop home: {hadoop_home}")
+    except Exception as e:
+        print(f"Warning: Could not set up Hadoop environment: {e}")
+
+    if not create_analysis_table():
+        return
+
+    print("Initializing Spark...")
+    spark = spark_analysis.initialize_spark(offline=True)
+    try:
+        with socketserver.TCPServer((host, port), AnalysisRequestHandler) as server:
+            server.service = AnalysisService(spark)
+            print(f"Analysis service listening on {host}:{port}")
+            server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        spark.stop()
+        print("Analysis service stopped")
+
+def submit_job(job, host=SERVICE_HOST, port=SERVICE_PORT, timeout=None):
+    """Send one job to a running service and return its result"""
+    with socket.create_connection((host, port), timeout=timeout) as connection:
+        connection.sendall((json.dumps(job) + '\n').encode('utf-8'))
+        with connection.makefile('r', encoding='utf-8') as response:
+            return json.loads(response.readline())
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Driver speed analysis service with a warm SparkSession")
+    parser.add_argument('command', choices=['serve', 'analyze', 'status', 'clear_cache', 'shutdown'])
+    parser.add_argument('--host', default=SERVICE_HOST)
+    parser.add_argument('--port', type=int, default=SERVICE_PORT)
+    parser.add_argument('--source', choices=['postgres', 'parquet'], default='postgres')
+    parser.add_argument('--parquet-path', default=PARQUET_PATH)
+    parser.add_argument('--start-date', help="First record_date to analyze (YYYY-MM-DD)")
+    parser.add_argument('--end-date', help="Last record_date to analyze (YYYY-MM-DD)")
+    parser.add_argument('--jdbc-partitions', type=int, default=None)
+    parser.add_argument('--fetch-size', type=int, default=JDBC_FETCH_SIZE)
+    parser.add_argument('--incremental', action='store_true')
+    parser.add_argument('--safety-rollup', action='store_true')
+    parser.add_argument('--incident-ranking', action='store_true')
+    parser.add_argument('--timelines', type=lambda value: [int(seconds) for seconds in value.split(',')],
+                        metavar='SECONDS', help="Comma-separated timeline bucket widths to rebuild")
+    parser.add_argument('--grid-tiles', action='store_true')
+    parser.add_argument('--speed-percentiles', action='store_true')
+    args = parser.parse_args()
+
+    if args.command == 'serve':
+        serve(args.host, args.port)
+    else:
+        job = {'command': args.command}
+        if args.command == 'analyze':
+            job.update({
+                'source': args.source,
+                'parquet_path': args.parquet_path,
+                'start_date': args.start_date,
+                'end_date': args.end_date,
+                'num_partitions': args.jdbc_partitions,
+                'fetch_size': args.fetch_size,
+                'incremental': args.incremental,
+                'safety_rollup': args.safety_rollup,
+                'incident_ranking': args.incident_ranking,
+                'timeline_resolutions': args.timelines,
+                'grid_tiles': args.grid_tiles,
+                'speed_percentiles': args.speed_percentiles
+            })
+        print(json.dumps(submit_job(job, args.host, args.port), indent=2))
@@ -0,0 +1,68 @@
+import argparse
+import os
+import time
+from psycopg2 import sql
+
+import db
+import load_data
+
+# Scratch schema the benchmark loads into, so the real tables are never touched
+BENCH_SCHEMA = 'ingest_benchmark'
+
+def reset_benchmark_schema():
+    """Drop and recreate the scratch schema used by the benchmark"""
+    conn = db.connect()
+    try:
+        with conn.cursor() as cursor:
+            cursor.execute(sql.SQL("DROP SCHEMA IF EXISTS {} CASCADE").format(sql.Identifier(BENCH_SCHEMA)))
+            cursor.execute(sql.SQL("CREATE SCHEMA {}").format(sql.Identifier(BENCH_SCHEMA)))
+        conn.commit()
+    finally:
+        conn.close()
+
+def run_ingest_benchmark(file_path, methods=('row', 'copy'), batch_size=1000, max_records=None):
+    """
+    Load the same file once per method into an empty scratch schema and time it
+
+    Returns a list of dicts with method, records, seconds and records_per_second
+    """
+    # Route every loader connection to the scratch schema
+    load_data.DB_PARAMS['options'] = f'-c search_path={BENCH_SCHEMA}'
+    results = []
+    try:
+        for method in methods:
+            reset_benchmark_schema()
+            start = time.perf_counter()
+            records = load_data.load_data(file_path, batch_size=batch_size, max_records=max_records, method=method)
+            seconds = time.perf_counter() - start
+            results.append({
+                'method': method,
+                'records': records or 0,
+                'seconds': seconds,
+                'records_per_second': (records or 0) / seconds if seconds > 0 else 0.0
+            })
+        return results
+    finally:
+        load_data.DB_PARAMS.pop('options', None)
+        reset_benchmark_schema()
+
+def print_results(results):
+    print(f"\n{'method':<8} {'records':>10} {'seconds':>10} {'records/s':>12}")
+    for result in results:
+        print(f"{result['method']:<8} {result['records']:>10} {result['seconds']:>10.2f} {result['records_per_second']:>12.0f}")
+    baseline = next((r for r in results if r['method'] == 'row'), None)
+    if baseline and baseline['records_per_second'] > 0:
+        for result in results:
+            if result is not baseline:
+                speedup = result['records_per_second'] / baseline['records_per_second']
+                print(f"{result['method']} is {speedup:.1f}x the row-at-a-time throughput")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare row-at-a-time and COPY ingestion throughput")
+    parser.add_argument('file', nargs='?', default=os.path.join('records', 'detail_record_2017_01_02_08_00_00'))
+    parser.add_argument('--methods', nargs='+', default=['row', 'copy'], choices=['row', 'copy'])
+    parser.add_argument('--batch-size', type=int, default=1000)
+    parser.add_argument('--max-records', type=int, default=None)
+    args = parser.parse_args()
+
+    print_results(run_ingest_benchmark(args.file, args.methods, args.batch_size, args.max_records))
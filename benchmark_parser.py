@@ -0,0 +1,116 @@
+import argparse
+import glob
+import os
+import time
+import pandas as pd
+
+from load_data import parse_line, parse_chunk
+
+# Lines where parse_line() and parse_chunk() have disagreed: whitespace around the line,
+# numbers float() takes but the tokenizer doesn't, digits int() refuses, malformed fields
+EDGE_CASE_READING = 'likun1000003,华AVM936,32.056444,118.777589,72,211,,2017-01-01 08:00:05'
+EDGE_CASE_WARNINGS = ',0,0,1,1,12,0,0,0,0,0,0'
+EDGE_CASE_LINES = [
+    EDGE_CASE_READING + ' \n',
+    '  ' + EDGE_CASE_READING + EDGE_CASE_WARNINGS + '  \n',
+    EDGE_CASE_READING.replace(',72,', ',1_000,') + '\n',
+    EDGE_CASE_READING.replace(',72,', ',１２,') + '\n',
+    EDGE_CASE_READING.replace('32.056444', '٣٢') + EDGE_CASE_WARNINGS + '\n',
+    EDGE_CASE_READING.replace(',72,', ',nan,') + '\n',
+    EDGE_CASE_READING.replace(',72,', ',72.5,') + '\n',
+    EDGE_CASE_READING.replace('32.056444', '91') + '\n',
+    EDGE_CASE_READING.replace('08:00:05', '8:00:05') + '\n',
+    EDGE_CASE_READING + EDGE_CASE_WARNINGS.replace(',12,', ',1²,') + '\n',
+    EDGE_CASE_READING + EDGE_CASE_WARNINGS.replace(',12,', ',99999999999,') + '\n',
+    EDGE_CASE_READING + EDGE_CASE_WARNINGS.replace(',12,', ',abc,') + '\n',
+    EDGE_CASE_READING.rsplit(',', 1)[0] + '\n',
+    '   \n'
+]
+
+def frame_to_records(frame):
+    """Convert parse_chunk() output back to parse_line()-style record dicts"""
+    records = []
+    for row in frame.to_dict('records'):
+        record = {}
+        for column, value in row.items():
+            if pd.isna(value):
+                value = None
+            elif isinstance(value, pd.Timestamp):
+                value = value.to_pydatetime()
+            elif hasattr(value, 'item'):
+                value = value.item()
+            record[column] = value
+        record['record_date'] = record['record_time'].date() if record['record_time'] else None
+        records.append(record)
+    return records
+
+def check_equivalence(lines, chunk_size):
+    """Return the number of lines where parse_chunk() and parse_line() disagree"""
+    expected = [parsed['driving_record'] for parsed in map(parse_line, lines) if parsed]
+    actual = []
+    for start in range(0, len(lines), chunk_size):
+        actual.extend(frame_to_records(parse_chunk(lines[start:start + chunk_size])))
+    if len(expected) != len(actual):
+        return abs(len(expected) - len(actual))
+    return sum(1 for left, right in zip(expected, actual) if left != right)
+
+def check_edge_cases():
+    """Return the EDGE_CASE_LINES that parse_line() and parse_chunk() treat differently"""
+    return [line for line in EDGE_CASE_LINES if check_equivalence([line], 1)]
+
+def time_parser(parse, repeat):
+    """Best wall-clock time of `repeat` runs of parse()"""
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        parse()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+def run_parser_benchmark(file_paths, chunk_size=5000, repeat=3, verify=True):
+    """
+    Time parse_line() against parse_chunk() over the given files
+
+    Returns a list of dicts with file, lines, parse_line_rows_per_second,
+    parse_chunk_rows_per_second and mismatches (None when verify is False)
+    """
+    results = []
+    for file_path in file_paths:
+        with open(file_path, 'r', encoding='utf-8') as file:
+            lines = file.readlines()
+
+        line_seconds = time_parser(lambda: [parse_line(line) for line in lines], repeat)
+        chunk_seconds = time_parser(
+            lambda: [parse_chunk(lines[start:start + chunk_size]) for start in range(0, len(lines), chunk_size)],
+            repeat
+        )
+        results.append({
+            'file': os.path.basename(file_path),
+            'lines': len(lines),
+            'parse_line_rows_per_second': len(lines) / line_seconds,
+            'parse_chunk_rows_per_second': len(lines) / chunk_seconds,
+            'mismatches': check_equivalence(lines, chunk_size) if verify else None
+        })
+    return results
+
+def print_results(results):
+    print(f"{'file':<36} {'lines':>8} {'parse_line/s':>14} {'parse_chunk/s':>14} {'speedup':>8} {'mismatches':>10}")
+    for result in results:
+        speedup = result['parse_chunk_rows_per_second'] / result['parse_line_rows_per_second']
+        print(f"{result['file']:<36} {result['lines']:>8} {result['parse_line_rows_per_second']:>14.0f} "
+              f"{result['parse_chunk_rows_per_second']:>14.0f} {speedup:>7.1f}x {str(result['mismatches']):>10}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare parse_line() and parse_chunk() throughput")
+    parser.add_argument('files', nargs='*', default=sorted(glob.glob(os.path.join('records', 'detail_record_*'))))
+    parser.add_argument('--chunk-size', type=int, default=5000)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--no-verify', action='store_true', help="Skip the value-by-value equivalence check")
+    args = parser.parse_args()
+
+    print_results(run_parser_benchmark(args.files, args.chunk_size, args.repeat, not args.no_verify))
+    if not args.no_verify:
+        disagreements = check_edge_cases()
+        print(f"Edge cases: {len(disagreements)} of {len(EDGE_CASE_LINES)} lines parsed differently")
+        for line in disagreements:
+            print(f"  {line!r}")
@@ -0,0 +1,331 @@
+import argparse
+import glob
+import json
+import os
+import threading
+import time
+from datetime import datetime
+import numpy as np
+import pandas as pd
+import psycopg2
+
+import db
+import load_data
+from benchmark_ingest import BENCH_SCHEMA, reset_benchmark_schema
+
+# The page read of my-app's getRealtimeRecordsByDriverId.ts, which the realtime monitor
+# issues for the driver and day on screen. The table is left unqualified so that it
+# resolves to the scratch schema
+REALTIME_PAGE_SQL = """
+SELECT
+    driver_id,
+    car_plate_number,
+    latitude,
+    longitude,
+    speed,
+    direction,
+    site_name,
+    to_char(record_time, 'YYYY-MM-DD HH24:MI:SS') as record_time,
+    is_rapidly_speedup,
+    is_rapidly_slowdown,
+    is_neutral_slide,
+    is_neutral_slide_finished,
+    neutral_slide_time,
+    is_overspeed,
+    is_overspeed_finished,
+    overspeed_time,
+    is_fatigue_driving,
+    is_throttle_stop,
+    is_oil_leak
+FROM
+    driving_records
+WHERE
+    driver_id = %s
+    AND record_time >= %s::date
+    AND record_time < %s::date + 1
+ORDER BY
+    record_time
+LIMIT %s OFFSET %s
+"""
+
+# Records per page and seconds between polls of the realtime monitor (useRealtimeMonitoring.ts)
+PAGE_SIZE = 100
+POLL_INTERVAL = 5.0
+
+# Wall-clock seconds between two deliveries of the replayed feed
+FLUSH_INTERVAL = 0.5
+
+# Percentiles reported for ingest lag and read latency
+PERCENTILES = (50, 90, 95, 99)
+
+class ReplayClock:
+    """Maps record_time to wall-clock time, running speedup times faster than the recording"""
+
+    def __init__(self, origin, speedup=1.0):
+        self.origin = pd.Timestamp(origin)
+        self.speedup = speedup
+        self.started = time.monotonic()
+
+    def replay_time(self):
+        """The record_time that is due now"""
+        return self.origin + pd.Timedelta(seconds=(time.monotonic() - self.started) * self.speedup)
+
+    def due_at(self, record_times):
+        """time.monotonic() at which each of record_times is due"""
+        return self.started + (record_times - self.origin).dt.total_seconds().to_numpy() / self.speedup
+
+class RecordFeed:
+    """
+    One data file parsed ahead of the replay clock, a chunk at a time
+
+    Readings within a file are in time order (bundled and generated files alike), so
+    a file is only read further once everything buffered from it is due. Readings
+    before start are dropped.
+    """
+
+    def __init__(self, file_path, chunk_size, start=None):
+        self.chunks = load_data.read_parsed_chunks(file_path, chunk_size)
+        self.start = start
+        self.buffer = None
+        self.exhausted = False
+
+    def read_until(self, until):
+        """Buffer chunks until one reading after until is buffered or the file ends"""
+        while not self.exhausted and (self.buffer is None or self.buffer.empty
+                                      or not (self.buffer['record_time'] > until).any()):
+            frame = next(self.chunks, None)
+            if frame is None:
+                self.exhausted = True
+                break
+            if self.start is not None:
+                frame = frame[~(frame['record_time'] < self.start)]
+            self.buffer = frame if self.buffer is None else pd.concat([self.buffer, frame])
+
+    def first_time(self):
+        self.read_until(pd.Timestamp.min)
+        if self.buffer is None or self.buffer.empty:
+            return None
+        return self.buffer['record_time'].min()
+
+    def take_due(self, now, limit):
+        """Remove and return up to limit buffered readings due by now (and any without a time)"""
+        self.read_until(now)
+        if self.buffer is None or self.buffer.empty:
+            return None
+        due = np.flatnonzero((self.buffer['record_time'] <= now).to_numpy() | self.buffer['record_time'].isna().to_numpy())
+        if len(due) == 0:
+            return None
+        due = due[:limit]
+        keep = np.ones(len(self.buffer), dtype=bool)
+        keep[due] = False
+        taken = self.buffer.iloc[due]
+        self.buffer = self.buffer[keep]
+        return taken
+
+    def done(self):
+        return self.exhausted and (self.buffer is None or self.buffer.empty)
+
+def read_page(conn, driver_id, day, start_index, page_size):
+    # Autocommit like node-postgres, so no transaction stays open between polls
+    conn.autocommit = True
+    with conn.cursor() as cursor:
+        cursor.execute(REALTIME_PAGE_SQL, (driver_id, day, day, page_size, start_index))
+        return cursor.fetchall()
+
+def monitor_driver(driver_id, clock, stop, reads, errors, poll_interval=POLL_INTERVAL, page_size=PAGE_SIZE):
+    """
+    Follow one driver like an open realtime monitor until stop is set
+
+    The monitor shows the day of the replay clock and pages through it: a full page
+    moves on to the next one straight away, a partial page is polled again after
+    poll_interval seconds. Each read is appended to reads as (latency in seconds, rows)
+    and each failed one to errors.
+    """
+    conn = db.connect()
+    day = None
+    start_index = 0
+    try:
+        while not stop.is_set():
+            today = clock.replay_time().date()
+            if today != day:
+                day, start_index = today, 0
+            started = time.perf_counter()
+            try:
+                conn, rows = db.retrying(conn, read_page, driver_id, day, start_index, page_size)
+            except psycopg2.Error as e:
+                errors.append(str(e).strip())
+                stop.wait(poll_interval)
+                continue
+            reads.append((time.perf_counter() - started, len(rows)))
+            if len(rows) == page_size:
+                start_index += page_size
+            else:
+                stop.wait(poll_interval)
+    finally:
+        conn.close()
+
+def summarize(seconds):
+    """Percentiles and maximum of a list of durations, or None if it is empty"""
+    if len(seconds) == 0:
+        return None
+    seconds = np.asarray(seconds)
+    summary = {f"p{percentile}_seconds": float(np.percentile(seconds, percentile)) for percentile in PERCENTILES}
+    summary['max_seconds'] = float(seconds.max())
+    return summary
+
+def run_replay(file_paths, speedup=1.0, readers=10, duration=None, start=None, batch_size=5000,
+               flush_interval=FLUSH_INTERVAL, poll_interval=POLL_INTERVAL, page_size=PAGE_SIZE):
+    """
+    Replay recorded files into the scratch schema while simulated monitors read it
+
+    Readings are written through load_data.write_batch() when the replay clock reaches
+    their record_time, speedup times faster than they were recorded. Every flush_interval
+    seconds the readings that came due are committed, in batches of at most batch_size;
+    a writer that falls behind catches up in full batches. Each of the readers follows
+    one driver with the realtime monitor's paged read (see monitor_driver()).
+
+    Ingest lag is the time from a reading being due to its batch committing. The replay
+    stops after duration wall-clock seconds, when the files run out, or on Ctrl+C.
+
+    Returns a JSON-serializable dict of results.
+    """
+    feeds = [RecordFeed(file_path, batch_size, start) for file_path in file_paths]
+    first_times = [first for first in (feed.first_time() for feed in feeds) if first is not None]
+    if not first_times:
+        print("No records to replay")
+        return None
+    # Readers follow the drivers reporting at the start of the replay
+    drivers = sorted(set().union(*(set(feed.buffer['driver_id']) for feed in feeds if feed.buffer is not None)))
+
+    # Route every connection to the scratch schema, with room for the writer and each reader
+    reset_benchmark_schema()
+    load_data.DB_PARAMS['options'] = f'-c search_path={BENCH_SCHEMA}'
+    pool_size = db.POOL_SIZE
+    db.POOL_SIZE = max(pool_size, readers + 1)
+    load_data.driver_registry = None
+    load_data.record_partitions = None
+    conn = db.connect()
+    stop = threading.Event()
+    threads = []
+    try:
+        load_data.create_tables(conn)
+
+        clock = ReplayClock(start or min(first_times), speedup)
+        reads = []
+        errors = []
+        for reader in range(readers):
+            thread = threading.Thread(target=monitor_driver, daemon=True,
+                                      args=(drivers[reader % len(drivers)], clock, stop, reads, errors,
+                                            poll_interval, page_size))
+            thread.start()
+            threads.append(thread)
+
+        lags = []
+        records = 0
+        batches = 0
+        failed_batches = 0
+        print(f"Replaying {len(file_paths)} files at {speedup:g}x from {clock.origin} with {readers} readers")
+        try:
+            while not all(feed.done() for feed in feeds):
+                if duration is not None and time.monotonic() - clock.started >= duration:
+                    break
+                now = clock.replay_time()
+                due = []
+                room = batch_size
+                for feed in feeds:
+                    frame = feed.take_due(now, room) if room else None
+                    if frame is not None:
+                        due.append(frame)
+                        room -= len(frame)
+                if due:
+                    frame = pd.concat(due)
+                    conn, count = db.retrying(conn, load_data.write_batch, frame)
+                    committed = time.monotonic()
+                    batches += 1
+                    if count is None:
+                        failed_batches += 1
+                    else:
+                        records += count
+                        timed = frame['record_time'].notna().to_numpy()
+                        lags.extend(committed - clock.due_at(frame.loc[timed, 'record_time']))
+                # A full batch means the writer is behind: carry on without waiting
+                if room:
+                    time.sleep(flush_interval)
+        except KeyboardInterrupt:
+            print("Stopping replay")
+        seconds = time.monotonic() - clock.started
+        replayed_until = clock.replay_time()
+    finally:
+        stop.set()
+        for thread in threads:
+            thread.join()
+        conn.close()
+        db.close_all()
+        db.POOL_SIZE = pool_size
+        load_data.DB_PARAMS.pop('options', None)
+        reset_benchmark_schema()
+
+    return {
+        'files': len(file_paths),
+        'monitored_drivers': len(set(drivers[reader % len(drivers)] for reader in range(readers))),
+        'speedup': speedup,
+        'readers': readers,
+        'replayed_from': str(clock.origin),
+        'replayed_until': str(replayed_until),
+        'seconds': seconds,
+        'records': records,
+        'batches': batches,
+        'failed_batches': failed_batches,
+        'records_per_second': records / seconds if seconds > 0 else 0.0,
+        'ingest_lag': summarize(lags),
+        'reads': len(reads),
+        'rows_read': sum(rows for _, rows in reads),
+        'read_errors': len(errors),
+        'reads_per_second': len(reads) / seconds if seconds > 0 else 0.0,
+        'read_latency': summarize([latency for latency, _ in reads])
+    }
+
+def print_results(results):
+    print(f"\nReplayed {results['records']} records in {results['seconds']:.1f}s "
+          f"at {results['speedup']:g}x ({results['records_per_second']:.0f} records/s, "
+          f"{results['failed_batches']} failed batches)")
+    print(f"{results['reads']} reads of {results['rows_read']} rows by {results['readers']} monitors of "
+          f"{results['monitored_drivers']} drivers ({results['reads_per_second']:.1f} reads/s, "
+          f"{results['read_errors']} errors)")
+    print(f"\n{'':<16}" + ''.join(f"{f'p{percentile}':>10}" for percentile in PERCENTILES) + f"{'max':>10}")
+    for name, key in (('ingest lag (s)', 'ingest_lag'), ('read latency (s)', 'read_latency')):
+        summary = results[key]
+        if summary is None:
+            print(f"{name:<16}{'n/a':>10}")
+            continue
+        print(f"{name:<16}" + ''.join(f"{summary[f'p{percentile}_seconds']:>10.3f}" for percentile in PERCENTILES)
+              + f"{summary['max_seconds']:>10.3f}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Replay recorded detail_record files in real time (or faster) while simulated "
+                    "realtime monitors read them, and report ingest lag and read latency"
+    )
+    parser.add_argument('folder', nargs='?', default='records',
+                        help="Folder of detail_record_* files, e.g. the output of generate_records.py for a bigger fleet")
+    parser.add_argument('--speedup', type=float, default=1.0, help="Replay this many times faster than recorded")
+    parser.add_argument('--readers', type=int, default=10, help="Simulated realtime monitors, one driver each")
+    parser.add_argument('--duration', type=float, default=None, help="Stop after this many seconds (default: all files)")
+    parser.add_argument('--start', type=datetime.fromisoformat, default=None,
+                        help="Start the replay at this record_time (YYYY-MM-DD HH:MM:SS), skipping earlier readings")
+    parser.add_argument('--batch-size', type=int, default=5000, help="Most records committed in one batch")
+    parser.add_argument('--flush-interval', type=float, default=FLUSH_INTERVAL)
+    parser.add_argument('--poll-interval', type=float, default=POLL_INTERVAL)
+    parser.add_argument('--page-size', type=int, default=PAGE_SIZE)
+    parser.add_argument('--output', help="Write the JSON results to this file")
+    args = parser.parse_args()
+
+    files = sorted(glob.glob(os.path.join(args.folder, 'detail_record_*')))
+    results = run_replay(files, args.speedup, args.readers, args.duration, args.start, args.batch_size,
+                         args.flush_interval, args.poll_interval, args.page_size)
+    if results:
+        print_results(results)
+        if args.output:
+            with open(args.output, 'w', encoding='utf-8') as file:
+                json.dump(results, file, indent=2)
+            print(f"Results written to {args.output}")
@@ -0,0 +1,212 @@
+import argparse
+import glob
+import json
+import os
+import platform
+import subprocess
+import time
+from datetime import datetime
+
+import benchmark_parser
+import generate_records
+import load_data
+from benchmark_ingest import BENCH_SCHEMA, reset_benchmark_schema
+
+# Size of the bundled records/ folder; --scale multiplies the driver count
+BASE_DRIVERS = 10
+BASE_DAYS = 9
+
+def git_revision():
+    """Commit the benchmark runs against, or None outside a git checkout"""
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=os.path.dirname(os.path.abspath(__file__)),
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except Exception:
+        return None
+
+def prepare_dataset(data_dir, num_drivers, num_days, interval, warning_rate, seed):
+    """Regenerate the synthetic records in data_dir and describe them"""
+    os.makedirs(data_dir, exist_ok=True)
+    for stale in glob.glob(os.path.join(data_dir, 'detail_record_*')):
+        os.remove(stale)
+    generated = generate_records.generate_records(data_dir, num_drivers, num_days, interval=interval,
+                                                  warning_rate=warning_rate, seed=seed)
+    return {
+        'drivers': num_drivers,
+        'days': num_days,
+        'interval': interval,
+        'warning_rate': warning_rate,
+        'seed': seed,
+        'files': len(generated['files']),
+        'records': generated['records'],
+        'bytes': sum(os.path.getsize(file_path) for file_path in generated['files']),
+        'generate_seconds': generated['seconds']
+    }, sorted(generated['files'])
+
+def bench_parse(files, chunk_size=5000, repeat=3):
+    """parse_line() and parse_chunk() throughput over all files"""
+    results = benchmark_parser.run_parser_benchmark(files, chunk_size, repeat, verify=False)
+    lines = sum(result['lines'] for result in results)
+    line_seconds = sum(result['lines'] / result['parse_line_rows_per_second'] for result in results)
+    chunk_seconds = sum(result['lines'] / result['parse_chunk_rows_per_second'] for result in results)
+    return {
+        'lines': lines,
+        'parse_line_rows_per_second': lines / line_seconds,
+        'parse_chunk_rows_per_second': lines / chunk_seconds
+    }
+
+def bench_ingest(files, batch_size=5000, method='copy'):
+    """load_data() rows/sec for all files into the empty scratch schema, which is left loaded"""
+    reset_benchmark_schema()
+    records = 0
+    start = time.perf_counter()
+    for file_path in files:
+        records += load_data.load_data(file_path, batch_size=batch_size, method=method) or 0
+    seconds = time.perf_counter() - start
+    return {
+        'method': method,
+        'batch_size': batch_size,
+        'records': records,
+        'seconds': seconds,
+        'records_per_second': records / seconds if seconds > 0 else 0.0
+    }
+
+def bench_local_analysis(repeat=3):
+    """Local engine runtime over the driving_records loaded by bench_ingest()"""
+    import local_analysis
+
+    seconds = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        analysis = local_analysis.analyze_driver_speeds_local('postgres')
+        seconds.append(time.perf_counter() - start)
+    return {'drivers': len(analysis), 'seconds': min(seconds)}
+
+def bench_spark_analysis(data_dir, repeat=3):
+    """analyze_driver_speeds() runtime on a cached input read from the raw files"""
+    import spark_analysis
+
+    start = time.perf_counter()
+    spark = spark_analysis.initialize_spark()
+    startup_seconds = time.perf_counter() - start
+    try:
+        start = time.perf_counter()
+        records_df = spark_analysis.read_raw_records(spark, data_dir).select('driver_id', 'speed').cache()
+        records = records_df.count()
+        read_seconds = time.perf_counter() - start
+
+        seconds = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            drivers = len(spark_analysis.analyze_driver_speeds(records_df).collect())
+            seconds.append(time.perf_counter() - start)
+        return {
+            'records': records,
+            'drivers': drivers,
+            'startup_seconds': startup_seconds,
+            'read_seconds': read_seconds,
+            'seconds': min(seconds)
+        }
+    finally:
+        spark.stop()
+
+def run_benchmark_suite(data_dir='benchmark_data', scale=1, num_drivers=None, num_days=BASE_DAYS, interval=10,
+                        warning_rate=generate_records.WARNING_RATE, seed=0, repeat=3, batch_size=5000,
+                        ingest=True, spark=True):
+    """
+    Generate a dataset and time parsing, ingestion and analysis over it
+
+    Ingestion goes into the scratch schema of benchmark_ingest.py, so the real tables
+    are never touched. The local engine is timed over that schema when ingestion runs.
+
+    Returns a JSON-serializable dict of results.
+    """
+    num_drivers = num_drivers or BASE_DRIVERS * scale
+    dataset, files = prepare_dataset(data_dir, num_drivers, num_days, interval, warning_rate, seed)
+    print(f"Generated {dataset['records']} records in {dataset['files']} files")
+
+    results = {
+        'revision': git_revision(),
+        'timestamp': datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'dataset': dataset,
+        'parse': bench_parse(files, repeat=repeat)
+    }
+    print(f"Parsing: {results['parse']['parse_chunk_rows_per_second']:.0f} rows/s")
+
+    if ingest:
+        import spark_analysis
+
+        # Route every loader and analysis connection to the scratch schema
+        options = f'-c search_path={BENCH_SCHEMA}'
+        load_data.DB_PARAMS['options'] = options
+        spark_analysis.DB_PARAMS['options'] = options
+        try:
+            results['ingest'] = bench_ingest(files, batch_size)
+            print(f"Ingest: {results['ingest']['records_per_second']:.0f} records/s")
+            results['local_analysis'] = bench_local_analysis(repeat)
+            print(f"Local analysis: {results['local_analysis']['seconds']:.2f}s")
+        finally:
+            load_data.DB_PARAMS.pop('options', None)
+            spark_analysis.DB_PARAMS.pop('options', None)
+            reset_benchmark_schema()
+
+    if spark:
+        results['spark_analysis'] = bench_spark_analysis(data_dir, repeat)
+        print(f"Spark analysis: {results['spark_analysis']['seconds']:.2f}s")
+
+    return results
+
+def flatten_metrics(results, prefix=''):
+    """Numeric rate and timing metrics of a results dict, keyed by dotted path"""
+    metrics = {}
+    for key, value in results.items():
+        path = f"{prefix}{key}"
+        if isinstance(value, dict):
+            metrics.update(flatten_metrics(value, f"{path}."))
+        elif isinstance(value, (int, float)) and (key.endswith('_per_second') or key.endswith('seconds')):
+            metrics[path] = value
+    return metrics
+
+def compare_results(baseline, current):
+    """Print each shared metric of two result dicts with its relative change"""
+    old_metrics = flatten_metrics(baseline)
+    new_metrics = flatten_metrics(current)
+    print(f"\n{'metric':<48} {'baseline':>14} {'current':>14} {'change':>8}")
+    for name in sorted(set(old_metrics) & set(new_metrics)):
+        old, new = old_metrics[name], new_metrics[name]
+        change = f"{(new - old) / old * 100:+.1f}%" if old else 'n/a'
+        print(f"{name:<48} {old:>14.2f} {new:>14.2f} {change:>8}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark parsing, ingestion and analysis on synthetic data")
+    parser.add_argument('--data-dir', default='benchmark_data')
+    parser.add_argument('--scale', type=int, default=1, help="Multiple of the bundled fleet size (10 drivers)")
+    parser.add_argument('--drivers', type=int, default=None, help="Driver count (overrides --scale)")
+    parser.add_argument('--days', type=int, default=BASE_DAYS)
+    parser.add_argument('--interval', type=int, default=10, help="Seconds between readings of a driver")
+    parser.add_argument('--warning-rate', type=float, default=generate_records.WARNING_RATE)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--batch-size', type=int, default=5000)
+    parser.add_argument('--skip-ingest', action='store_true', help="Skip the PostgreSQL ingest and local engine")
+    parser.add_argument('--skip-spark', action='store_true')
+    parser.add_argument('--output', help="Write the JSON results to this file")
+    parser.add_argument('--compare', help="Earlier JSON results to compare against")
+    args = parser.parse_args()
+
+    results = run_benchmark_suite(args.data_dir, args.scale, args.drivers, args.days, args.interval,
+                                  args.warning_rate, args.seed, args.repeat, args.batch_size,
+                                  not args.skip_ingest, not args.skip_spark)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as file:
+            json.dump(results, file, indent=2)
+        print(f"Results written to {args.output}")
+    else:
+        print(json.dumps(results, indent=2))
+
+    if args.compare:
+        with open(args.compare, 'r', encoding='utf-8') as file:
+            compare_results(json.load(file), results)
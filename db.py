@@ -0,0 +1,284 @@
+import os
+import random
+import re
+import select
+import threading
+import time
+import weakref
+import psycopg2
+from psycopg2.errors import QueryCanceled
+from psycopg2.extensions import TRANSACTION_STATUS_IDLE, TRANSACTION_STATUS_UNKNOWN, TransactionRollbackError
+from psycopg2.pool import PoolError
+from dotenv import load_dotenv
+
+import metrics
+
+# Load environment variables from .env file
+load_dotenv()
+
+# Database connection parameters from environment variables, shared by every script.
+# Changes (such as an 'options' search_path) apply to connections opened afterwards
+DB_PARAMS = {
+    'dbname': os.getenv('DB_NAME'),
+    'user': os.getenv('DB_USER'),
+    'password': os.getenv('DB_PASSWORD'),
+    'host': os.getenv('DB_HOST'),
+    'port': os.getenv('DB_PORT')
+}
+
+# Most connections one process keeps open; connect() waits for a returned one beyond that
+POOL_SIZE = int(os.getenv('DB_POOL_SIZE', 4))
+
+# Seconds connect() waits for a free connection before raising PoolError
+POOL_TIMEOUT = float(os.getenv('DB_POOL_TIMEOUT', 60))
+
+# Idle connections unused for longer than this (seconds) are pinged before they are reused
+HEALTH_CHECK_AFTER = float(os.getenv('DB_HEALTH_CHECK_AFTER', 30))
+
+# Server-side limit on a single statement in milliseconds (0 for none). Schema changes
+# and migrations lift it for their own transaction
+STATEMENT_TIMEOUT_MS = int(os.getenv('DB_STATEMENT_TIMEOUT_MS', 600000))
+
+# Retries after a transient error, waiting RETRY_BASE_DELAY * 2^attempt seconds (capped at
+# RETRY_MAX_DELAY, with jitter) in between: about a minute and a half in all, enough to
+# ride out a restart or failover
+RETRIES = int(os.getenv('DB_RETRIES', 8))
+RETRY_BASE_DELAY = 0.5
+RETRY_MAX_DELAY = 30.0
+
+# libpq settings so that a dead server is noticed within seconds instead of hanging on TCP
+CONNECT_SETTINGS = {
+    'connect_timeout': 10,
+    'keepalives': 1,
+    'keepalives_idle': 30,
+    'keepalives_interval': 10,
+    'keepalives_count': 3
+}
+
+# Connection failures that waiting won't fix
+PERMANENT_CONNECT_ERRORS = re.compile(r'authentication failed|does not exist|no pg_hba\.conf entry')
+
+# SQLSTATE of writes refused by a read-only server: a demoted primary during failover
+READ_ONLY_SQL_TRANSACTION = '25006'
+
+class PooledConnection(psycopg2.extensions.connection):
+    """psycopg2 connection whose close() hands it back to the pool instead of disconnecting"""
+
+    def close(self):
+        release(self)
+
+    def disconnect(self):
+        psycopg2.extensions.connection.close(self)
+
+# Process-local pool: idle connections (most recently returned last), every open one
+# (a borrowed connection that is dropped without close() frees its place once collected),
+# the number being opened and the process they belong to. After a fork the child starts
+# an empty pool
+idle = []
+connections = weakref.WeakSet()
+opening = 0
+pool_pid = os.getpid()
+pool_lock = threading.Condition()
+
+# Connections inherited through fork. Closing one would end the parent's session, so
+# they are kept referenced and never touched
+inherited = []
+
+def check_pool():
+    """Start an empty pool in a forked child"""
+    global connections, opening, pool_pid, pool_lock
+    if pool_pid != os.getpid():
+        inherited.extend(idle)
+        idle.clear()
+        connections = weakref.WeakSet()
+        opening = 0
+        pool_pid = os.getpid()
+        pool_lock = threading.Condition()
+
+def connect_params():
+    """DB_PARAMS with the keepalive settings and statement timeout added"""
+    params = {**CONNECT_SETTINGS, **DB_PARAMS}
+    if STATEMENT_TIMEOUT_MS:
+        params['options'] = ' '.join(
+            option for option in (DB_PARAMS.get('options'), f'-c statement_timeout={STATEMENT_TIMEOUT_MS}') if option
+        )
+    return params
+
+def backoff(attempt):
+    """Seconds to wait before retry number attempt (from 0)"""
+    return min(RETRY_MAX_DELAY, RETRY_BASE_DELAY * 2 ** attempt) * random.uniform(0.5, 1.0)
+
+def is_transient(error):
+    """
+    Whether an error is cured by retrying on a fresh connection
+
+    True for lost or refused connections, a server that is shutting down, starting up
+    or out of connection slots, and writes refused by a read-only (demoted) server.
+    Statement timeouts are not: the retry would time out again. Neither are deadlocks
+    and serialization failures, which the loaders retry on the same connection.
+    """
+    if isinstance(error, psycopg2.InterfaceError):
+        return True
+    if isinstance(error, (QueryCanceled, TransactionRollbackError)):
+        return False
+    if getattr(error, 'pgcode', None) == READ_ONLY_SQL_TRANSACTION:
+        return True
+    return isinstance(error, psycopg2.OperationalError) and not PERMANENT_CONNECT_ERRORS.search(str(error))
+
+def describe(error):
+    return str(error).strip().splitlines()[0] if str(error).strip() else type(error).__name__
+
+def open_connection(params):
+    """Open a new connection, retrying transient failures with backoff"""
+    attempt = 0
+    while True:
+        try:
+            conn = psycopg2.connect(connection_factory=PooledConnection, **params)
+            metrics.increment('db_connections_opened')
+            conn.connect_params = params
+            conn.owner_pid = os.getpid()
+            conn.last_used = time.monotonic()
+            conn.pooled = False
+            return conn
+        except psycopg2.OperationalError as e:
+            if attempt == RETRIES or not is_transient(e):
+                raise
+            delay = backoff(attempt)
+            attempt += 1
+            metrics.increment('db_connect_retries')
+            print(f"Database unavailable ({describe(e)}); retrying in {delay:.1f}s")
+            time.sleep(delay)
+
+def is_usable(conn, params):
+    """Whether an idle connection can be handed out; pings it if it sat idle for a while"""
+    if conn.closed or conn.connect_params != params:
+        return False
+    # An idle connection has nothing to read unless the server closed it or sent a
+    # termination notice (restart, failover, pg_terminate_backend)
+    if select.select([conn], [], [], 0)[0]:
+        return False
+    if time.monotonic() - conn.last_used < HEALTH_CHECK_AFTER:
+        return True
+    try:
+        with conn.cursor() as cursor:
+            cursor.execute("SELECT 1")
+        conn.rollback()
+        metrics.increment('db_health_checks')
+        return True
+    except psycopg2.Error:
+        return False
+
+def connect():
+    """
+    Borrow a connection from the process's pool, opening one if none is idle
+
+    Idle connections that the server has closed, or that don't answer a SELECT 1
+    after HEALTH_CHECK_AFTER seconds unused, are thrown away. Opening a connection is
+    retried with backoff on transient errors, and raises the last error once RETRIES
+    are used up. At most POOL_SIZE connections are open at once. close() returns the
+    connection; whatever it left uncommitted is rolled back.
+    """
+    global opening
+    check_pool()
+    params = connect_params()
+    deadline = time.monotonic() + POOL_TIMEOUT
+    while True:
+        with pool_lock:
+            while not idle and len(connections) + opening >= POOL_SIZE:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise PoolError(f"No database connection free after {POOL_TIMEOUT:.0f}s")
+                # Wake up now and then: dropped connections free their place without a notify
+                pool_lock.wait(min(remaining, 1.0))
+            conn = idle.pop() if idle else None
+            if conn is None:
+                opening += 1
+
+        if conn is None:
+            try:
+                conn = open_connection(params)
+                connections.add(conn)
+                return conn
+            finally:
+                with pool_lock:
+                    opening -= 1
+                    pool_lock.notify()
+        conn.pooled = False
+        if is_usable(conn, params):
+            metrics.increment('db_connections_reused')
+            return conn
+        discard(conn)
+
+def is_foreign(conn):
+    """Whether conn was inherited through fork; it is then set aside with the other inherited ones"""
+    if conn.owner_pid == os.getpid():
+        return False
+    inherited.append(conn)
+    return True
+
+def release(conn):
+    """Return a borrowed connection to the pool, rolling back an unfinished transaction"""
+    if conn.pooled or is_foreign(conn):
+        return
+    try:
+        if conn.get_transaction_status() not in (TRANSACTION_STATUS_IDLE, TRANSACTION_STATUS_UNKNOWN):
+            conn.rollback()
+        conn.autocommit = False
+    except psycopg2.Error:
+        pass
+    if conn.closed or conn.get_transaction_status() == TRANSACTION_STATUS_UNKNOWN:
+        discard(conn)
+        return
+    conn.pooled = True
+    conn.last_used = time.monotonic()
+    with pool_lock:
+        idle.append(conn)
+        pool_lock.notify()
+
+def discard(conn):
+    """Close a borrowed connection for good, freeing its place in the pool"""
+    if conn.pooled or is_foreign(conn):
+        return
+    conn.pooled = True
+    try:
+        conn.disconnect()
+    except psycopg2.Error:
+        pass
+    metrics.increment('db_connections_discarded')
+    with pool_lock:
+        connections.discard(conn)
+        pool_lock.notify()
+
+def close_all():
+    """Disconnect the idle connections, e.g. before forking worker processes"""
+    check_pool()
+    with pool_lock:
+        connections = list(idle)
+        idle.clear()
+    for conn in connections:
+        conn.pooled = False
+        discard(conn)
+
+def retrying(conn, operation, *args, retries=RETRIES, **kwargs):
+    """
+    Run operation(conn, *args, **kwargs), again on a fresh connection after a transient error
+
+    The operation must leave nothing behind when it raises (a single transaction that
+    is rolled back with the lost connection), so that running it again is safe. Errors
+    that are not transient, and the last transient one, are raised. Returns
+    (connection, result): the connection to carry on with may not be the one passed in.
+    """
+    attempt = 0
+    while True:
+        try:
+            return conn, operation(conn, *args, **kwargs)
+        except psycopg2.Error as e:
+            if attempt == retries or not is_transient(e):
+                raise
+            delay = backoff(attempt)
+            attempt += 1
+            metrics.increment('db_operation_retries')
+            print(f"Database connection lost ({describe(e)}); retrying in {delay:.1f}s")
+            discard(conn)
+            time.sleep(delay)
+            conn = connect()
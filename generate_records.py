@@ -0,0 +1,185 @@
+import argparse
+import multiprocessing
+import os
+import time
+from datetime import date, datetime, timedelta
+import numpy as np
+
+# Name stems for generated driver ids, as in the bundled records (likun1000003, ...)
+DRIVER_NAMES = ['zengpeng', 'xiexiao', 'hanhui', 'likun', 'shenxian', 'panxian', 'xiezhi', 'zouan', 'haowei', 'duxu']
+
+# City centres the generated drivers start from
+CITY_CENTRES = [
+    (32.056444, 118.777589), (30.678600, 104.070835), (29.543173, 106.529418),
+    (28.211549, 112.979477), (23.129110, 113.264385), (30.274085, 120.155070)
+]
+
+PLATE_CHARACTERS = np.array(list('ABCDEFGHJKLMNPQRSTUVWXYZ0123456789'))
+
+SITE_NAMES = ['广东省广州市越秀区:已到达目的地', '四川省成都市龙泉驿区:距离终点241.757km', '四川省资阳市简阳市:距离终点214.906km']
+
+# Share of readings that carry the 12 trailing warning columns in the bundled records
+WARNING_RATE = 0.25
+
+# Warning column -> probability among readings that carry warning columns, from the bundled
+# records. A slide or overspeed start sets only its flag; the reading that ends it sets
+# *_finished and the matching *_time duration instead.
+WARNING_PROBABILITIES = {
+    'is_rapidly_speedup': 0.030,
+    'is_rapidly_slowdown': 0.032,
+    'is_neutral_slide': 0.027,
+    'is_neutral_slide_finished': 0.027,
+    'is_overspeed': 0.284,
+    'is_overspeed_finished': 0.284,
+    'is_fatigue_driving': 0.333,
+    'is_throttle_stop': 0.032,
+    'is_oil_leak': 0.031
+}
+
+# Share of readings with a non-empty site_name
+SITE_NAME_RATE = 0.002
+
+# Bigger fleets are split over several files per day so one worker never holds a whole day
+DRIVERS_PER_FILE = 500
+
+def generate_fleet(num_drivers, seed=0):
+    """Return (driver_id, car_plate_number, latitude, longitude) for each generated driver"""
+    rng = np.random.default_rng(seed)
+    fleet = []
+    for index in range(num_drivers):
+        plate = '华A' + ''.join(rng.choice(PLATE_CHARACTERS, 5))
+        latitude, longitude = CITY_CENTRES[index % len(CITY_CENTRES)]
+        fleet.append((
+            f"{DRIVER_NAMES[index % len(DRIVER_NAMES)]}{1000000 + index}",
+            plate,
+            latitude + rng.uniform(-0.05, 0.05),
+            longitude + rng.uniform(-0.05, 0.05)
+        ))
+    return fleet
+
+def generate_driver_day(driver, day, interval, warning_rate, rng):
+    """
+    Return (record_time, line) pairs for one driver driving one shift on day
+
+    Readings arrive every `interval` seconds between 08:00 and midnight, with speed,
+    direction and position following random walks.
+    """
+    driver_id, plate, latitude, longitude = driver
+    shift_start = 8 * 3600 + int(rng.integers(0, 4 * 3600))
+    shift_seconds = int(rng.integers(4 * 3600, 14 * 3600))
+    offsets = np.arange(shift_start, min(shift_start + shift_seconds, 24 * 3600), interval)
+    count = len(offsets)
+    if count == 0:
+        return []
+
+    speeds = np.clip(80 + np.cumsum(rng.integers(-8, 9, count)), 0, 149)
+    directions = (rng.integers(0, 360) + np.cumsum(rng.integers(-15, 16, count))) % 360
+    latitudes = np.round(latitude + np.cumsum(rng.normal(0, 0.0002, count)), 6)
+    longitudes = np.round(longitude + np.cumsum(rng.normal(0, 0.0002, count)), 6)
+    has_warnings = rng.random(count) < warning_rate
+    has_site = rng.random(count) < SITE_NAME_RATE
+    names = list(WARNING_PROBABILITIES)
+    probabilities = np.array(list(WARNING_PROBABILITIES.values()))
+    flags = rng.random((count, len(names))) < probabilities
+    # Readings that carry warning columns always report at least one warning
+    empty = ~flags.any(axis=1)
+    flags[empty, rng.choice(len(names), int(empty.sum()), p=probabilities / probabilities.sum())] = True
+    flags = {name: flags[:, column] for column, name in enumerate(names)}
+    neutral_slide_times = rng.geometric(0.2, count) - 1
+    overspeed_times = rng.geometric(0.1, count) - 1
+
+    midnight = datetime(day.year, day.month, day.day)
+    records = []
+    for i in range(count):
+        record_time = (midnight + timedelta(seconds=int(offsets[i]))).strftime('%Y-%m-%d %H:%M:%S')
+        site_name = SITE_NAMES[i % len(SITE_NAMES)] if has_site[i] else ''
+        line = (f"{driver_id},{plate},{latitudes[i]},{longitudes[i]},{speeds[i]},{directions[i]},"
+                f"{site_name},{record_time}")
+        if has_warnings[i]:
+            neutral_slide_finished = flags['is_neutral_slide_finished'][i]
+            overspeed_finished = flags['is_overspeed_finished'][i]
+            warnings = [
+                '1' if flags['is_rapidly_speedup'][i] else '',
+                '1' if flags['is_rapidly_slowdown'][i] else '',
+                '1' if flags['is_neutral_slide'][i] else '',
+                '1' if neutral_slide_finished else '',
+                str(neutral_slide_times[i]) if neutral_slide_finished else '',
+                '1' if flags['is_overspeed'][i] else '',
+                '1' if overspeed_finished else '',
+                str(overspeed_times[i]) if overspeed_finished else '',
+                '1' if flags['is_fatigue_driving'][i] else '',
+                '1' if flags['is_throttle_stop'][i] else '',
+                '1' if flags['is_oil_leak'][i] else '',
+                ''
+            ]
+            line += ',' + ','.join(warnings)
+        records.append((record_time, line))
+    return records
+
+def record_file_name(day, shard=None):
+    """detail_record_* name of the file holding day's readings (stamped 08:00 the next day)"""
+    name = f"detail_record_{(day + timedelta(days=1)).strftime('%Y_%m_%d')}_08_00_00"
+    return name if shard is None else f"{name}_{shard:03d}"
+
+def write_day(task):
+    """Write one day file; task is (fleet, day, shard, output_dir, interval, warning_rate, seed)"""
+    fleet, day, shard, output_dir, interval, warning_rate, seed = task
+    rng = np.random.default_rng([seed, day.toordinal(), shard or 0])
+    records = []
+    for driver in fleet:
+        records.extend(generate_driver_day(driver, day, interval, warning_rate, rng))
+    # Readings of all drivers interleave in time order, like the bundled files
+    records.sort(key=lambda record: record[0])
+
+    file_path = os.path.join(output_dir, record_file_name(day, shard))
+    with open(file_path, 'w', encoding='utf-8', newline='\r\n') as file:
+        for _, line in records:
+            file.write(line + '\n')
+    return file_path, len(records)
+
+def generate_records(output_dir, num_drivers=10, num_days=9, start_date=date(2017, 1, 1), interval=10,
+                     warning_rate=WARNING_RATE, seed=0, workers=None, drivers_per_file=DRIVERS_PER_FILE):
+    """
+    Write num_days detail_record_* files for a fleet of num_drivers drivers
+
+    The same arguments always produce the same files. The bundled records are about
+    10 drivers, 9 days and one reading every 10 seconds; scale drivers, days or the
+    reporting interval for bigger datasets. Fleets larger than drivers_per_file get
+    one file per day and slice of drivers, suffixed _000, _001, ...
+
+    Returns a dict with files, records and seconds.
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    fleet = generate_fleet(num_drivers, seed)
+    shards = [fleet[first:first + drivers_per_file] for first in range(0, len(fleet), drivers_per_file)]
+    tasks = [(drivers, start_date + timedelta(days=offset), shard if len(shards) > 1 else None,
+              output_dir, interval, warning_rate, seed)
+             for offset in range(num_days) for shard, drivers in enumerate(shards)]
+
+    start = time.perf_counter()
+    with multiprocessing.Pool(processes=workers or min(len(tasks), os.cpu_count() or 1)) as pool:
+        written = pool.map(write_day, tasks)
+    return {
+        'files': [file_path for file_path, _ in written],
+        'records': sum(records for _, records in written),
+        'seconds': time.perf_counter() - start
+    }
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Generate synthetic detail_record_* files")
+    parser.add_argument('output_dir', nargs='?', default='generated_records')
+    parser.add_argument('--drivers', type=int, default=10)
+    parser.add_argument('--days', type=int, default=9)
+    parser.add_argument('--start-date', type=date.fromisoformat, default=date(2017, 1, 1))
+    parser.add_argument('--interval', type=int, default=10, help="Seconds between readings of a driver")
+    parser.add_argument('--warning-rate', type=float, default=WARNING_RATE,
+                        help="Share of readings that carry warning columns")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--drivers-per-file', type=int, default=DRIVERS_PER_FILE)
+    args = parser.parse_args()
+
+    result = generate_records(args.output_dir, args.drivers, args.days, args.start_date, args.interval,
+                              args.warning_rate, args.seed, args.workers,
+                              args.drivers_per_file)
+    print(f"Wrote {result['records']} records to {len(result['files'])} files in {result['seconds']:.1f}s")
@@ -1,29 +1,91 @@
+import argparse
+import csv
+import io
+import itertools
+import json
+import multiprocessing
 import os
+import queue
+import re
+import threading
+import time
+import numpy as np
+import pandas as pd
 import psycopg2
+from psycopg2 import DataError, IntegrityError
+from psycopg2.errors import CheckViolation, ForeignKeyViolation, LockNotAvailable
+from psycopg2.extensions import TransactionRollbackError
 from psycopg2 import sql
-from datetime import datetime
+from datetime import datetime, timedelta
 from dotenv import load_dotenv
 
+import db
+import metrics
+
 # Load environment variables from .env file
 load_dotenv()
 
-# Database connection parameters from environment variables
-DB_PARAMS = {
-    'dbname': os.getenv('DB_NAME'),
-    'user': os.getenv('DB_USER'),
-    'password': os.getenv('DB_PASSWORD'),
-    'host': os.getenv('DB_HOST'),
-    'port': os.getenv('DB_PORT')
-}
+# Database connection parameters from environment variables (the dict shared through db.py)
+DB_PARAMS = db.DB_PARAMS
+
+# Lines and records that can't be loaded are appended here as JSON lines (None to only count them)
+QUARANTINE_PATH = os.getenv('QUARANTINE_PATH', 'quarantine.jsonl')
+
+# Serializes appends to QUARANTINE_PATH: a pipelined load quarantines from its parser and writer threads
+quarantine_lock = threading.Lock()
 
 # Define the table structures
-CREATE_TABLES_SQL = """
+# Create new databases with driving_records split into daily partitions (see create_tables())
+PARTITIONED_STORAGE = os.getenv('PARTITIONED_STORAGE', '').lower() in ('1', 'true', 'yes')
+
+CREATE_DRIVERS_TABLE_SQL = """
 -- Create drivers table
 CREATE TABLE IF NOT EXISTS drivers (
     driver_id VARCHAR(50) PRIMARY KEY,
     car_plate_number VARCHAR(20) NOT NULL
 );
+"""
+
+# driving_records with one partition per record_date. record_date is a generated column,
+# which can't be a partition key, so each partition covers one day of record_time instead.
+# A unique index on a partitioned table must contain the partition key, so there is no
+# primary key on id; (driver_id, record_time) stays the natural key.
+CREATE_PARTITIONED_RECORDS_SQL = """
+CREATE TABLE IF NOT EXISTS driving_records (
+    id SERIAL,
+    driver_id VARCHAR(50) REFERENCES drivers(driver_id),
+    car_plate_number VARCHAR(20),
+    latitude FLOAT,
+    longitude FLOAT,
+    speed INT,
+    direction INT,
+    site_name VARCHAR(100),
+    record_time TIMESTAMP,
+    is_rapidly_speedup INT,
+    is_rapidly_slowdown INT,
+    is_neutral_slide INT,
+    is_neutral_slide_finished INT,
+    neutral_slide_time INT,
+    is_overspeed INT,
+    is_overspeed_finished INT,
+    overspeed_time INT,
+    is_fatigue_driving INT,
+    is_throttle_stop INT,
+    is_oil_leak INT,
+    record_date DATE GENERATED ALWAYS AS (record_time::date) STORED
+) PARTITION BY RANGE (record_time);
+
+-- Readings without a timestamp. Dated readings must find their day's partition, so a
+-- missing one fails the batch instead of filling this table
+CREATE TABLE IF NOT EXISTS driving_records_undated PARTITION OF driving_records (
+    CONSTRAINT driving_records_undated_check CHECK (record_time IS NULL)
+) DEFAULT;
+
+-- Readings arrive in time order, so block ranges of record_time stay narrow
+CREATE INDEX IF NOT EXISTS idx_driving_records_record_time_brin ON driving_records USING brin (record_time);
+"""
 
+CREATE_TABLES_SQL = """
 -- Create driving_records table
 CREATE TABLE IF NOT EXISTS driving_records (
     id SERIAL PRIMARY KEY,
@@ -35,53 +97,493 @@ CREATE TABLE IF NOT EXISTS driving_records (
     direction INT,
     site_name VARCHAR(100),
     record_time TIMESTAMP,
-    is_rapidly_speedup BOOLEAN,
-    is_rapidly_slowdown BOOLEAN,
-    is_neutral_slide BOOLEAN,
-    is_neutral_slide_finished BOOLEAN,
+    is_rapidly_speedup INT,
+    is_rapidly_slowdown INT,
+    is_neutral_slide INT,
+    is_neutral_slide_finished INT,
     neutral_slide_time INT,
-    is_overspeed BOOLEAN,
-    is_overspeed_finished BOOLEAN,
+    is_overspeed INT,
+    is_overspeed_finished INT,
     overspeed_time INT,
-    is_fatigue_driving BOOLEAN,
-    is_throttle_stop BOOLEAN,
-    is_oil_leak BOOLEAN,
-    record_date DATE
+    is_fatigue_driving INT,
+    is_throttle_stop INT,
+    is_oil_leak INT,
+    record_date DATE GENERATED ALWAYS AS (record_time::date) STORED
+);
+
+-- Streaming ingest progress, committed in the same transaction as the rows it covers
+CREATE TABLE IF NOT EXISTS ingest_checkpoints (
+    file_name VARCHAR(255) PRIMARY KEY,
+    byte_offset BIGINT NOT NULL,
+    last_driver_id VARCHAR(50),
+    last_record_time TIMESTAMP,
+    records_loaded BIGINT NOT NULL DEFAULT 0,
+    updated_at TIMESTAMP NOT NULL DEFAULT now()
+);
+
+-- One row per warning raised by a reading (see EVENT_TYPES), written with the readings,
+-- so alert and incident queries don't scan every GPS point
+CREATE TABLE IF NOT EXISTS driving_events (
+    driver_id VARCHAR(50) REFERENCES drivers(driver_id),
+    record_time TIMESTAMP,
+    event_type SMALLINT,
+    duration INT,
+    PRIMARY KEY (driver_id, record_time, event_type)
+);
+
+CREATE INDEX IF NOT EXISTS idx_driving_events_record_time ON driving_events(record_time);
+
+-- Readings per record_date, kept by the loaders in the statement that inserts them, so
+-- analysis jobs can tell which days changed without counting driving_records
+CREATE TABLE IF NOT EXISTS driving_record_days (
+    record_date DATE PRIMARY KEY,
+    readings BIGINT NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS driving_event_types (
+    event_type SMALLINT PRIMARY KEY,
+    name VARCHAR(50) NOT NULL
 );
 
--- Create indexes for better query performance
-CREATE INDEX IF NOT EXISTS idx_driving_records_driver_id ON driving_records(driver_id);
-CREATE INDEX IF NOT EXISTS idx_driving_records_car_plate_number ON driving_records(car_plate_number);
-CREATE INDEX IF NOT EXISTS idx_driving_records_record_time ON driving_records(record_time);
-CREATE INDEX IF NOT EXISTS idx_driving_records_record_date ON driving_records(record_date);
+-- Remove duplicate readings left by older loaders before enforcing the natural key
+DO $$
+BEGIN
+    IF to_regclass('uq_driving_records_driver_time') IS NULL THEN
+        DELETE FROM driving_records a
+        USING driving_records b
+        WHERE a.driver_id = b.driver_id AND a.record_time = b.record_time AND a.id > b.id;
+    END IF;
+END $$;
+
+-- Natural identity of a reading, used for ON CONFLICT deduplication.
+-- Its leading driver_id column also serves per-driver lookups.
+CREATE UNIQUE INDEX IF NOT EXISTS uq_driving_records_driver_time ON driving_records(driver_id, record_time);
+DROP INDEX IF EXISTS idx_driving_records_driver_id;
+
+-- Create indexes for better query performance. The partitioned layout skips them:
+-- date filters prune partitions and record_time has a BRIN index instead
+DO $$
+BEGIN
+    IF (SELECT relkind FROM pg_class WHERE oid = 'driving_records'::regclass) = 'r' THEN
+        CREATE INDEX IF NOT EXISTS idx_driving_records_car_plate_number ON driving_records(car_plate_number);
+        CREATE INDEX IF NOT EXISTS idx_driving_records_record_time ON driving_records(record_time);
+        CREATE INDEX IF NOT EXISTS idx_driving_records_record_date ON driving_records(record_date);
+    END IF;
+END $$;
 """
 
 # Function to connect to the database
 def connect_to_db():
+    # A connection from the process's pool, returned to it by close(); see db.connect()
     try:
-        conn = psycopg2.connect(**DB_PARAMS)
+        conn = db.connect()
         return conn
     except Exception as e:
         print(f"Error connecting to database: {e}")
         return None
 
+# driving_events type code of each warning flag. The *_finished events also carry the
+# duration of the slide or overspeed they end, and are raised by a non-zero duration alone.
+EVENT_TYPES = {
+    'is_rapidly_speedup': 1,
+    'is_rapidly_slowdown': 2,
+    'is_neutral_slide': 3,
+    'is_neutral_slide_finished': 4,
+    'is_overspeed': 5,
+    'is_overspeed_finished': 6,
+    'is_fatigue_driving': 7,
+    'is_throttle_stop': 8,
+    'is_oil_leak': 9
+}
+EVENT_DURATIONS = {'is_neutral_slide_finished': 'neutral_slide_time', 'is_overspeed_finished': 'overspeed_time'}
+
+# Columns of a reading that driving_events are derived from
+EVENT_SOURCE_COLUMNS = ['driver_id', 'record_time'] + list(EVENT_TYPES) + list(EVENT_DURATIONS.values())
+
+# Insert the events of the readings in {source}, any relation with EVENT_SOURCE_COLUMNS.
+# Each reading is unpivoted into one candidate row per type and only raised ones are kept.
+EVENTS_INSERT_SQL = """
+INSERT INTO driving_events (driver_id, record_time, event_type, duration)
+SELECT r.driver_id, r.record_time, e.event_type, e.duration
+FROM {source} r
+CROSS JOIN LATERAL (VALUES %s) AS e(event_type, raised, duration)
+WHERE e.raised AND r.record_time IS NOT NULL
+ON CONFLICT DO NOTHING
+""" % ', '.join(
+    f"({code}, r.{flag} = 1 OR r.{EVENT_DURATIONS[flag]} > 0, r.{EVENT_DURATIONS[flag]})"
+    if flag in EVENT_DURATIONS else f"({code}, r.{flag} = 1, NULL::int)"
+    for flag, code in EVENT_TYPES.items()
+)
+
+# Add the readings in {source} to their days' counts in driving_record_days. Days are
+# locked in date order, so concurrent loaders can't deadlock on them
+RECORD_DAYS_UPSERT_SQL = """
+INSERT INTO driving_record_days (record_date, readings)
+SELECT record_time::date, count(*) FROM {source}
+WHERE record_time IS NOT NULL
+GROUP BY 1 ORDER BY 1
+ON CONFLICT (record_date) DO UPDATE SET readings = driving_record_days.readings + EXCLUDED.readings
+"""
+
+# Function to make an INSERT INTO driving_records also write the events and day counts of the new rows
+def with_events(insert_sql):
+    """Wrap insert_sql so it returns one row: (readings inserted, events inserted)"""
+    return f"""
+    WITH inserted AS (
+        {insert_sql}
+        RETURNING {', '.join(EVENT_SOURCE_COLUMNS)}
+    ), events AS (
+        {EVENTS_INSERT_SQL.format(source='inserted')}
+        RETURNING 1
+    ), days AS (
+        {RECORD_DAYS_UPSERT_SQL.format(source='inserted')}
+    )
+    SELECT (SELECT count(*) FROM inserted), (SELECT count(*) FROM events)
+    """
+
+# Readings are bucketed into a fixed grid of 1/GRID_CELLS_PER_DEGREE degree cells, about
+# 1.1 km north-south at 100. grid_cell numbers the cells row by row from (-90, -180). It is
+# a stored generated column like record_date, so changing the grid means re-adding it.
+GRID_CELLS_PER_DEGREE = 100
+GRID_COLUMNS = 360 * GRID_CELLS_PER_DEGREE
+GRID_CELL_SQL = (f"floor((latitude + 90) * {GRID_CELLS_PER_DEGREE})::bigint * {GRID_COLUMNS} "
+                 f"+ floor((longitude + 180) * {GRID_CELLS_PER_DEGREE})::bigint")
+
+# Function to check whether driving_records has the grid_cell column
+def has_grid_cell(cursor):
+    # ALTER TABLE locks out readers even when there is nothing to change, so the catalog is asked instead
+    cursor.execute("""
+    SELECT 1 FROM pg_attribute
+    WHERE attrelid = 'driving_records'::regclass AND attname = 'grid_cell' AND NOT attisdropped
+    """)
+    return cursor.fetchone() is not None
+
+# Function to run the schema script for one driving_records layout
+def execute_schema(cursor, partitioned, grid_cell=False):
+    """
+    Create the tables and indexes that don't exist yet
+
+    grid_cell is computed by the server for every row written. It is only added here
+    when grid_cell is set, for a driving_records table that was just created; on a table
+    with rows it is a rewrite under an exclusive lock, see add_grid_cell().
+    """
+    cursor.execute(CREATE_DRIVERS_TABLE_SQL)
+    if partitioned:
+        cursor.execute(CREATE_PARTITIONED_RECORDS_SQL)
+    cursor.execute(CREATE_TABLES_SQL)
+    present = has_grid_cell(cursor)
+    if grid_cell and not present:
+        cursor.execute(f"""
+        ALTER TABLE driving_records
+        ADD COLUMN grid_cell BIGINT GENERATED ALWAYS AS ({GRID_CELL_SQL}) STORED
+        """)
+        present = True
+    if present:
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_driving_records_grid_cell ON driving_records(grid_cell)")
+    cursor.execute("""
+    INSERT INTO driving_event_types (event_type, name)
+    SELECT * FROM unnest(%s::smallint[], %s::varchar[])
+    ON CONFLICT (event_type) DO UPDATE SET name = EXCLUDED.name
+    """, (list(EVENT_TYPES.values()), [flag[3:] for flag in EVENT_TYPES]))
+
 # Function to create the tables if they don't exist
-def create_tables(conn):
+def create_tables(conn, partitioned=None):
+    """
+    Create the tables if they don't exist
+
+    partitioned (default PARTITIONED_STORAGE) only matters when driving_records doesn't
+    exist yet; an existing table keeps its layout (see migrate_to_partitioned()).
+    When driving_events or driving_record_days is new, it is filled from the readings
+    already loaded.
+    """
+    if partitioned is None:
+        partitioned = PARTITIONED_STORAGE
     try:
         with conn.cursor() as cursor:
-            cursor.execute(CREATE_TABLES_SQL)
+            # Backfilling events and day counts scans whole tables
+            cursor.execute("SET LOCAL statement_timeout = 0")
+            cursor.execute("""
+            SELECT to_regclass('driving_records') IS NOT NULL, to_regclass('driving_events') IS NULL,
+                   to_regclass('driving_record_days') IS NULL
+            """)
+            records_exist, events_missing, days_missing = cursor.fetchone()
+            if records_exist:
+                partitioned = False
+            execute_schema(cursor, partitioned, grid_cell=not records_exist)
+            if records_exist and events_missing:
+                cursor.execute(EVENTS_INSERT_SQL.format(source='driving_records'))
+                print(f"Backfilled {cursor.rowcount} driving events")
+            if records_exist and days_missing:
+                cursor.execute(RECORD_DAYS_UPSERT_SQL.format(source='driving_records'))
+                print(f"Backfilled reading counts of {cursor.rowcount} days")
         conn.commit()
         print("Tables created or already exist")
     except Exception as e:
         print(f"Error creating tables: {e}")
         conn.rollback()
 
+# Function to name the partition holding one record_date
+def partition_name(day):
+    return f"driving_records_{day.strftime('%Y%m%d')}"
+
+# Function to list the daily partitions of driving_records
+def get_record_partitions(conn):
+    """Return {partition name: record_date} of the partitions; empty for the plain table"""
+    with conn.cursor() as cursor:
+        cursor.execute("""
+        SELECT c.relname
+        FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid
+        WHERE i.inhparent = to_regclass('driving_records')
+        """)
+        names = [row[0] for row in cursor.fetchall()]
+    partitions = {}
+    for name in names:
+        match = re.search(r'_(\d{8})$', name)
+        partitions[name] = datetime.strptime(match.group(1), '%Y%m%d').date() if match else None
+    return partitions
+
+# Function to create the partitions for a set of dates
+def create_partitions(cursor, days):
+    # CREATE TABLE ... PARTITION OF locks driving_records against readers, while
+    # attaching a separately created table only blocks other schema changes. The
+    # undated partition is still locked, briefly: its CHECK spares it the scan
+    for day in sorted(days):
+        start = datetime(day.year, day.month, day.day)
+        name = sql.Identifier(partition_name(day))
+        cursor.execute(sql.SQL("""
+        CREATE TABLE {} (LIKE driving_records INCLUDING DEFAULTS INCLUDING GENERATED)
+        """).format(name))
+        cursor.execute(sql.SQL("""
+        ALTER TABLE driving_records ATTACH PARTITION {} FOR VALUES FROM (%s) TO (%s)
+        """).format(name), (start, start + timedelta(days=1)))
+
+# Daily partitions of driving_records known to exist, loaded once per process
+record_partitions = None
+
+# How long attaching a partition waits behind a reader of driving_records_undated before
+# it gives way and tries again, so that new readers don't queue up behind it
+PARTITION_LOCK_TIMEOUT = '500ms'
+PARTITION_LOCK_RETRIES = 10
+
+# Function to make sure the partitions for a batch exist before writing it
+def ensure_partitions(conn, record_times, reload=False):
+    """
+    Create the missing daily partitions for the dates in record_times
+
+    Does nothing for the plain table. New partitions are committed in their own short
+    transaction, serialized across loaders by an advisory lock, so call this between
+    batches rather than inside one. A transaction that can't get its locks within
+    PARTITION_LOCK_TIMEOUT is rolled back and retried.
+    """
+    global record_partitions
+    if record_partitions is None or reload:
+        record_partitions = get_record_partitions(conn)
+        metrics.increment('db_round_trips')
+    if not record_partitions:
+        return
+    days = set(pd.to_datetime(pd.Series(record_times, dtype=object)).dropna().dt.date)
+    missing = days - set(record_partitions.values())
+    if not missing:
+        return
+    attempt = 0
+    while True:
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute("SELECT pg_advisory_xact_lock(hashtext('driving_records partitions'))")
+                cursor.execute("SET LOCAL lock_timeout = %s", (PARTITION_LOCK_TIMEOUT,))
+                # Another loader may have created some of them while this one waited
+                record_partitions = get_record_partitions(conn)
+                missing = days - set(record_partitions.values())
+                create_partitions(cursor, missing)
+            conn.commit()
+            break
+        except LockNotAvailable:
+            conn.rollback()
+            if attempt == PARTITION_LOCK_RETRIES:
+                raise
+            attempt += 1
+            metrics.increment('partition_lock_retries')
+            time.sleep(db.backoff(attempt))
+    metrics.increment('db_round_trips', 2 * len(missing) + 3)
+    metrics.increment('partitions_created', len(missing))
+    record_partitions.update((partition_name(day), day) for day in missing)
+
+# Function to drop whole days of readings from the partitioned layout
+def drop_partitions_before(conn, before):
+    """
+    Drop the daily partitions of record_dates before the given date
+
+    Retention costs one catalog change per day instead of a DELETE over the table.
+    The events and reading counts of those days go too; daily rollups written by
+    spark_analysis.py are kept. Returns the dropped dates.
+    """
+    dropped = []
+    with conn.cursor() as cursor:
+        cursor.execute("SET LOCAL statement_timeout = 0")
+        for name, day in sorted(get_record_partitions(conn).items()):
+            if day is not None and day < before:
+                cursor.execute(sql.SQL("DROP TABLE {}").format(sql.Identifier(name)))
+                dropped.append(day)
+        if dropped:
+            cursor.execute("DELETE FROM driving_events WHERE record_time < %s", (max(dropped) + timedelta(days=1),))
+            cursor.execute("DELETE FROM driving_record_days WHERE record_date = ANY(%s)", (dropped,))
+    conn.commit()
+    if record_partitions is not None:
+        for day in dropped:
+            record_partitions.pop(partition_name(day), None)
+    return dropped
+
+# Function to rebuild an existing plain driving_records table as daily partitions
+def migrate_to_partitioned(conn):
+    """
+    Move the rows of a plain driving_records table into the partitioned layout
+
+    Rows keep their ids and the id sequence carries on where it was. They are copied
+    in record_time order so the BRIN ranges start out tight. Everything happens in one
+    transaction: readers keep seeing the old table until the commit, and writers wait,
+    so stop the loaders first.
+
+    Returns the number of rows migrated, or None if nothing was migrated
+    """
+    columns = ', '.join(('id',) + DRIVING_RECORD_COLUMNS)
+    try:
+        with conn.cursor() as cursor:
+            cursor.execute("SET LOCAL statement_timeout = 0")
+            cursor.execute("SELECT relkind FROM pg_class WHERE oid = to_regclass('driving_records')")
+            row = cursor.fetchone()
+            if not row or row[0] != 'r':
+                print("driving_records is missing or already partitioned")
+                return None
+            
+            # Move the old table, and the names of its sequence and foreign key, out of the way
+            cursor.execute("SELECT pg_get_serial_sequence('driving_records', 'id')")
+            sequence = cursor.fetchone()[0]
+            grid_cell = has_grid_cell(cursor)
+            cursor.execute("ALTER TABLE driving_records RENAME TO driving_records_unpartitioned")
+            cursor.execute(f"ALTER SEQUENCE {sequence} RENAME TO driving_records_unpartitioned_id_seq")
+            cursor.execute("ALTER TABLE driving_records_unpartitioned DROP CONSTRAINT IF EXISTS driving_records_driver_id_fkey")
+            for index in ('uq_driving_records_driver_time', 'idx_driving_records_car_plate_number',
+                          'idx_driving_records_record_time', 'idx_driving_records_grid_cell'):
+                cursor.execute(sql.SQL("DROP INDEX IF EXISTS {}").format(sql.Identifier(index)))
+            
+            cursor.execute("SELECT DISTINCT record_date FROM driving_records_unpartitioned WHERE record_date IS NOT NULL")
+            days = [row[0] for row in cursor.fetchall()]
+            cursor.execute("DROP INDEX IF EXISTS idx_driving_records_record_date")
+            execute_schema(cursor, partitioned=True, grid_cell=grid_cell)
+            create_partitions(cursor, days)
+            
+            cursor.execute(f"""
+            INSERT INTO driving_records ({columns})
+            SELECT {columns} FROM driving_records_unpartitioned
+            ORDER BY record_time
+            ON CONFLICT (driver_id, record_time) DO NOTHING
+            """)
+            migrated = cursor.rowcount
+            cursor.execute("""
+            SELECT setval(pg_get_serial_sequence('driving_records', 'id'), last_value, is_called)
+            FROM driving_records_unpartitioned_id_seq
+            """)
+            cursor.execute("DROP TABLE driving_records_unpartitioned")
+        conn.commit()
+        print(f"Migrated {migrated} records into {len(days)} daily partitions")
+        return migrated
+    except Exception as e:
+        print(f"Error migrating driving_records: {e}")
+        conn.rollback()
+        return None
+
+# Function to add the grid_cell column to an existing driving_records table
+def add_grid_cell(conn):
+    """
+    Add the generated grid_cell column and its index to driving_records
+
+    The server computes the column for every stored row, rewriting the table under an
+    ACCESS EXCLUSIVE lock that blocks readers and loaders until the commit, so this only
+    runs when asked for (--add-grid-cell). Tables created by create_tables() have it
+    from the start.
+
+    Returns True if the column was added
+    """
+    try:
+        with conn.cursor() as cursor:
+            cursor.execute("SET LOCAL statement_timeout = 0")
+            if has_grid_cell(cursor):
+                print("driving_records already has grid_cell")
+                return False
+            execute_schema(cursor, partitioned=False, grid_cell=True)
+        conn.commit()
+        print("Added grid_cell to driving_records")
+        return True
+    except Exception as e:
+        print(f"Error adding grid_cell: {e}")
+        conn.rollback()
+        return False
+
+# Values the INT columns of driving_records can hold
+INT_RANGE = (-2 ** 31, 2 ** 31 - 1)
+
+# Raw CSV positions of the numeric fields: column, lowest and highest value, whole numbers only
+NUMERIC_FIELDS = {
+    2: ('latitude', -90, 90, False),
+    3: ('longitude', -180, 180, False),
+    4: ('speed', *INT_RANGE, True),
+    5: ('direction', *INT_RANGE, True)
+}
+
+# Raw CSV positions of the VARCHAR fields and their length limits
+TEXT_FIELDS = {0: ('driver_id', 50), 1: ('car_plate_number', 20), 6: ('site_name', 100)}
+
+# Function to check a split CSV line against what driving_records can store
+def line_problem(fields):
+    """Return why a line's fields can't be loaded, or None if they can"""
+    if len(fields) < 8:
+        return "fewer than 8 fields"
+    for position, (column, limit) in TEXT_FIELDS.items():
+        if len(fields[position]) > limit:
+            return f"{column} longer than {limit} characters"
+    for position, (column, lowest, highest, whole) in NUMERIC_FIELDS.items():
+        text = fields[position]
+        if not text:
+            continue
+        # float() also takes '1_000' and non-ASCII digits, which the chunk tokenizer refuses
+        if not text.isascii() or '_' in text:
+            return f"{column} is not a number: {text!r}"
+        try:
+            value = float(text)
+        except ValueError:
+            return f"{column} is not a number: {text!r}"
+        if not lowest <= value <= highest:
+            return f"{column} out of range: {text!r}"
+        if whole and not value.is_integer():
+            return f"{column} is not a whole number: {text!r}"
+    if fields[7]:
+        try:
+            datetime.strptime(fields[7], '%Y-%m-%d %H:%M:%S')
+        except ValueError:
+            return f"record_time is not YYYY-MM-DD HH:MM:SS: {fields[7]!r}"
+    for position, column in DURATION_WARNING_FIELDS.items():
+        text = fields[position] if position < len(fields) else ''
+        # str.isdigit() also accepts digits such as '²' that int() refuses
+        if text.isdigit() and not text.isascii():
+            return f"{column} is not a number: {text!r}"
+        if text.isdigit() and int(text) > INT_RANGE[1]:
+            return f"{column} out of range: {text!r}"
+    return None
+
 # Function to parse a CSV line into a record
-def parse_line(line):
+def parse_line(line, rejects=None):
+    """
+    Parse one CSV line into driver and driving_record dicts
+    
+    Returns None for a line that can't be loaded; when rejects is a list, the reason
+    (see line_problem()) is appended to it. Blank lines are skipped without a reason.
+    """
     fields = line.strip().split(',')
     
-    # Ensure we have at least 8 fields (required fields)
-    if len(fields) < 8:
+    problem = line_problem(fields)
+    if problem:
+        if rejects is not None and line.strip():
+            rejects.append(problem)
         return None
     
     # Extract the basic fields
@@ -98,8 +600,8 @@ def parse_line(line):
         'car_plate_number': car_plate_number,
         'latitude': float(fields[2]) if fields[2] else None,
         'longitude': float(fields[3]) if fields[3] else None,
-        'speed': int(fields[4]) if fields[4] else None,
-        'direction': int(fields[5]) if fields[5] else None,
+        'speed': int(float(fields[4])) if fields[4] else None,
+        'direction': int(float(fields[5])) if fields[5] else None,
         'site_name': fields[6],
         'record_time': timestamp,
         'record_date': record_date
@@ -128,7 +630,7 @@ def parse_line(line):
                 record[field_name] = fields[i] == '1'
             # For numeric fields
             else:
-                record[field_name] = int(fields[i]) if fields[i].isdigit() else 0
+                record[field_name] = int(fields[i]) if fields[i].isascii() and fields[i].isdigit() else 0
         else:
             # Set default values: False for boolean fields, 0 for numeric fields
             if field_name.startswith('is_'):
@@ -144,54 +646,141 @@ def parse_line(line):
         'driving_record': record
     }
 
-# Function to insert or update driver
-def insert_driver(conn, driver):
-    insert_sql = """
-    INSERT INTO drivers (driver_id, car_plate_number)
-    VALUES (%s, %s)
-    ON CONFLICT (driver_id) 
-    DO UPDATE SET car_plate_number = EXCLUDED.car_plate_number
+# Columns written by the loaders, in COPY order (record_date is a generated column)
+DRIVING_RECORD_COLUMNS = (
+    'driver_id', 'car_plate_number', 'latitude', 'longitude', 'speed', 'direction', 'site_name',
+    'record_time', 'is_rapidly_speedup', 'is_rapidly_slowdown', 'is_neutral_slide',
+    'is_neutral_slide_finished', 'neutral_slide_time', 'is_overspeed', 'is_overspeed_finished',
+    'overspeed_time', 'is_fatigue_driving', 'is_throttle_stop', 'is_oil_leak'
+)
+
+# Raw CSV positions of the optional warning columns
+BOOLEAN_WARNING_FIELDS = {
+    8: 'is_rapidly_speedup',
+    9: 'is_rapidly_slowdown',
+    10: 'is_neutral_slide',
+    11: 'is_neutral_slide_finished',
+    13: 'is_overspeed',
+    14: 'is_overspeed_finished',
+    16: 'is_fatigue_driving',
+    17: 'is_throttle_stop',
+    18: 'is_oil_leak'
+}
+DURATION_WARNING_FIELDS = {
+    12: 'neutral_slide_time',
+    15: 'overspeed_time'
+}
+
+# Function to read a chunk of CSV lines into one raw column per field
+def read_raw_chunk(text, numbers_as_text=False):
     """
+    Tokenize a chunk with the C parser; row i of the result is line i of the chunk
     
-    try:
-        with conn.cursor() as cursor:
-            cursor.execute(insert_sql, (
-                driver['driver_id'],
-                driver['car_plate_number']
-            ))
-        return True
-    except Exception as e:
-        print(f"Error inserting driver: {e}")
-        return False
+    Coordinates, speed and direction are converted to float64 by the tokenizer unless
+    numbers_as_text is set, warning flags become categoricals so each test runs once per
+    distinct value, and blank lines are kept. The trailing all-empty row keeps usecols
+    valid when no line in the chunk carries the warning columns.
+    """
+    numeric = object if numbers_as_text else 'float64'
+    return pd.read_csv(
+        io.StringIO(text + ',' * 18 + '\n'),
+        header=None,
+        names=range(19),
+        usecols=range(19),
+        dtype={position: numeric if position in NUMERIC_FIELDS else 'category' if position >= 8 else object
+               for position in range(19)},
+        keep_default_na=False,
+        na_values={position: [''] for position in NUMERIC_FIELDS},
+        skip_blank_lines=False,
+        quoting=csv.QUOTE_NONE
+    ).iloc[:-1]
 
-# Function to check if a driving record already exists
-def record_exists(conn, record):
-    """Check if a driving record already exists in the database"""
-    check_sql = """
-    SELECT 1 FROM driving_records 
-    WHERE driver_id = %s AND record_time = %s
+# Function to parse a chunk of CSV lines into typed columns
+def parse_chunk(lines, rejects=None):
     """
+    Parse many CSV lines at once into a DataFrame with one typed column per field
     
+    Accepts the same lines as parse_line() and produces the same values for them:
+    missing warning columns become False/0, record_time is a datetime64 column (NaT
+    when empty) and empty numeric fields are NaN/<NA>. record_date is left to the
+    database, which generates it from record_time. The frame's index is each row's
+    position in lines. When rejects is a list, (position, reason) is appended for every
+    non-blank line that is dropped.
+    """
+    # parse_line() strips each line, which also drops spaces around the first and last field
+    text = ''.join(line.strip() + '\n' for line in lines)
     try:
-        with conn.cursor() as cursor:
-            cursor.execute(check_sql, (
-                record['driver_id'],
-                record['record_time']
-            ))
-            return cursor.fetchone() is not None
-    except Exception as e:
-        print(f"Error checking if record exists: {e}")
-        return False
+        raw = read_raw_chunk(text)
+        unreadable = np.zeros(len(raw), dtype=bool)
+    except ValueError:
+        # A field that is not a number fails the whole chunk in the tokenizer; only such
+        # chunks pay for converting their numbers from text
+        raw = read_raw_chunk(text, numbers_as_text=True)
+        unreadable = np.zeros(len(raw), dtype=bool)
+        for position in NUMERIC_FIELDS:
+            values = pd.to_numeric(raw[position], errors='coerce')
+            unreadable |= (values.isna() & raw[position].notna()).to_numpy()
+            raw[position] = values
+    
+    # Lines with fewer than 8 fields parse here with an empty timestamp, so only lines
+    # without a timestamp need their fields counted
+    timestamps = raw[7]
+    empty_times = (timestamps == '').to_numpy()
+    record_times = pd.to_datetime(timestamps.where(~empty_times), format='%Y-%m-%d %H:%M:%S', errors='coerce')
+    bad = unreadable | (record_times.isna().to_numpy() & ~empty_times)
+    for index in np.flatnonzero(empty_times):
+        bad[index] |= lines[index].count(',') < 7
+    for position, (column, lowest, highest, whole) in NUMERIC_FIELDS.items():
+        values = raw[position].to_numpy(dtype='float64')
+        bad |= (values < lowest) | (values > highest)
+        if whole:
+            bad |= np.isfinite(values) & (np.floor(values) != values)
+    for position, (column, limit) in TEXT_FIELDS.items():
+        bad |= np.fromiter(map(len, raw[position].to_numpy()), dtype='int64', count=len(raw)) > limit
+    durations = {}
+    for position, column in DURATION_WARNING_FIELDS.items():
+        values = raw[position].cat
+        # Non-ASCII digits ('²') map to -1 and reject their line, as in line_problem()
+        lookup = np.array([(int(value) if value.isascii() else -1) if value.isdigit() else 0
+                           for value in values.categories] + [0], dtype='int64')
+        durations[column] = lookup[values.codes.to_numpy()]
+        bad |= (durations[column] > INT_RANGE[1]) | (durations[column] < 0)
+    
+    if bad.any():
+        # Rare, so the reasons come from the same per-line checks as parse_line()
+        for index in np.flatnonzero(bad):
+            line = lines[index].strip()
+            if rejects is not None and line:
+                rejects.append((index, line_problem(line.split(',')) or "not parseable"))
+        keep = ~bad
+        raw = raw[keep]
+        record_times = record_times[keep]
+        durations = {column: values[keep] for column, values in durations.items()}
+    
+    frame = pd.DataFrame({
+        'driver_id': raw[0],
+        'car_plate_number': raw[1],
+        'latitude': raw[2].astype('float64'),
+        'longitude': raw[3].astype('float64'),
+        'speed': pd.array(raw[4].to_numpy(dtype='float64'), dtype='Int64'),
+        'direction': pd.array(raw[5].to_numpy(dtype='float64'), dtype='Int64'),
+        'site_name': raw[6],
+        'record_time': record_times
+    })
+    for position, column in BOOLEAN_WARNING_FIELDS.items():
+        frame[column] = (raw[position] == '1').to_numpy()
+    for column, values in durations.items():
+        frame[column] = values
+    
+    return frame[list(DRIVING_RECORD_COLUMNS)]
 
 # Function to insert driving record
 def insert_driving_record(conn, record):
-    # First check if the record already exists
-    if record_exists(conn, record):
-        # Skip this record as it already exists
-        return True
-        
+    # Readings already loaded for (driver_id, record_time) are skipped by ON CONFLICT,
+    # and the events of a new reading are written by the same statement. A record the
+    # database refuses raises psycopg2.Error and leaves the transaction aborted
     # Remove record_date from the SQL as it's a generated column
-    insert_sql = """
+    insert_sql = with_events("""
     INSERT INTO driving_records (
         driver_id, car_plate_number, latitude, longitude, speed, direction, site_name, 
         record_time, is_rapidly_speedup, is_rapidly_slowdown, is_neutral_slide, 
@@ -200,44 +789,518 @@ def insert_driving_record(conn, record):
     ) VALUES (
         %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s
     )
-    """
+    ON CONFLICT (driver_id, record_time) DO NOTHING
+    """)
     
     # Convert boolean values to integers (0 or 1) for database compatibility
     for key in record:
         if key.startswith('is_') and record[key] is not None:
             record[key] = 1 if record[key] else 0
     
-    try:
+    with conn.cursor() as cursor:
+        cursor.execute(insert_sql, (
+            record['driver_id'],
+            record['car_plate_number'],
+            record['latitude'],
+            record['longitude'],
+            record['speed'],
+            record['direction'],
+            record['site_name'],
+            record['record_time'],
+            record['is_rapidly_speedup'],
+            record['is_rapidly_slowdown'],
+            record['is_neutral_slide'],
+            record['is_neutral_slide_finished'],
+            record['neutral_slide_time'],
+            record['is_overspeed'],
+            record['is_overspeed_finished'],
+            record['overspeed_time'],
+            record['is_fatigue_driving'],
+            record['is_throttle_stop'],
+            record['is_oil_leak']
+            # Removed record_date as it's a generated column
+        ))
+        inserted, events = cursor.fetchone()
+        metrics.increment('db_round_trips')
+        metrics.increment('records_inserted' if inserted else 'records_duplicate')
+        metrics.increment('events_inserted', events)
+    return True
+
+# Known drivers and their plates, loaded from the drivers table once per process
+driver_registry = None
+
+# Function to get the process-wide driver registry
+def get_driver_registry(conn, reload=False):
+    """Return the driver_id -> car_plate_number registry, reading the drivers table on first use"""
+    global driver_registry
+    if driver_registry is None or reload:
         with conn.cursor() as cursor:
-            cursor.execute(insert_sql, (
-                record['driver_id'],
-                record['car_plate_number'],
-                record['latitude'],
-                record['longitude'],
-                record['speed'],
-                record['direction'],
-                record['site_name'],
-                record['record_time'],
-                record['is_rapidly_speedup'],
-                record['is_rapidly_slowdown'],
-                record['is_neutral_slide'],
-                record['is_neutral_slide_finished'],
-                record['neutral_slide_time'],
-                record['is_overspeed'],
-                record['is_overspeed_finished'],
-                record['overspeed_time'],
-                record['is_fatigue_driving'],
-                record['is_throttle_stop'],
-                record['is_oil_leak']
-                # Removed record_date as it's a generated column
-            ))
-        return True
+            cursor.execute("SELECT driver_id, car_plate_number FROM drivers")
+            driver_registry = dict(cursor.fetchall())
+        metrics.increment('db_round_trips')
+        metrics.increment('driver_registry_loads')
+    return driver_registry
+
+# Function to install a registry loaded elsewhere (pool worker initializer)
+def set_driver_registry(registry):
+    global driver_registry
+    driver_registry = registry
+
+# Function to pick the drivers of a parsed chunk that need an upsert
+def drivers_to_upsert(frame, registry):
+    """(driver_id, car_plate_number) of drivers that are new or whose latest plate in the frame changed"""
+    lasts = frame.drop_duplicates('driver_id', keep='last')
+    return [
+        (driver_id, car_plate_number)
+        for driver_id, car_plate_number in zip(lasts['driver_id'], lasts['car_plate_number'])
+        if registry.get(driver_id) != car_plate_number
+    ]
+
+# Function to insert or update many drivers in one statement
+def upsert_drivers(conn, drivers):
+    """Upsert (driver_id, car_plate_number) pairs in driver_id order, in the caller's transaction"""
+    if not drivers:
+        return
+    drivers = sorted(drivers)
+    with conn.cursor() as cursor:
+        cursor.execute("""
+        INSERT INTO drivers (driver_id, car_plate_number)
+        SELECT * FROM unnest(%s::varchar[], %s::varchar[])
+        ON CONFLICT (driver_id)
+        DO UPDATE SET car_plate_number = EXCLUDED.car_plate_number
+        WHERE drivers.car_plate_number IS DISTINCT FROM EXCLUDED.car_plate_number
+        """, ([driver_id for driver_id, _ in drivers], [plate for _, plate in drivers]))
+    metrics.increment('db_round_trips')
+    metrics.increment('drivers_upserted', len(drivers))
+
+# Function to render records as the CSV rows sent to COPY
+def records_to_csv(frame, buffer=None):
+    """Write frame's DRIVING_RECORD_COLUMNS as headerless CSV to buffer, or return it as a string"""
+    flags = [column for column in DRIVING_RECORD_COLUMNS if column.startswith('is_')]
+    return frame.astype({column: 'int8' for column in flags}).to_csv(
+        buffer, header=False, index=False, na_rep='\\N', date_format='%Y-%m-%d %H:%M:%S'
+    )
+
+# Function to bulk insert a batch of driving records through a staging table
+def copy_driving_records(conn, frame):
+    """
+    Stream a parsed chunk (see parse_chunk()) into driving_records with COPY FROM STDIN
+
+    The batch is copied into a temporary staging table and merged with a single
+    INSERT ... SELECT ... ON CONFLICT DO NOTHING against the (driver_id, record_time)
+    unique key, so readings that are already loaded are skipped. The same statement
+    writes the driving_events of the readings it inserted. Duplicates inside the
+    batch are dropped here, keeping the first reading as the row-at-a-time path does.
+    Rows are merged in key order so concurrent loaders lock keys in the same order.
+
+    Returns the number of records handled (inserted or skipped as duplicates), or None on error.
+    Deadlocks, serialization failures, lost connections and rows the database refuses
+    (DataError, IntegrityError, including missing drivers and partitions) are raised so
+    the caller can retry the batch or isolate the bad rows.
+    """
+    columns = ', '.join(DRIVING_RECORD_COLUMNS)
+    unique = frame[~frame.duplicated(['driver_id', 'record_time']) | frame['record_time'].isna()]
+    buffer = io.StringIO()
+    records_to_csv(unique, buffer)
+    buffer.seek(0)
+
+    try:
+        with metrics.timer('copy'), conn.cursor() as cursor:
+            cursor.execute(f"""
+            CREATE TEMP TABLE IF NOT EXISTS driving_records_staging
+            ON COMMIT DELETE ROWS
+            AS SELECT {columns} FROM driving_records WITH NO DATA
+            """)
+            cursor.copy_expert(
+                f"COPY driving_records_staging ({columns}) FROM STDIN WITH (FORMAT csv, NULL '\\N')", buffer
+            )
+            cursor.execute(with_events(f"""
+            INSERT INTO driving_records ({columns})
+            SELECT {columns} FROM driving_records_staging
+            ORDER BY driver_id, record_time
+            ON CONFLICT (driver_id, record_time) DO NOTHING
+            """))
+            inserted, events = cursor.fetchone()
+            # Readings skipped by the unique key or as in-batch repeats count as duplicates
+            metrics.increment('db_round_trips', 3)
+            metrics.increment('records_inserted', inserted)
+            metrics.increment('records_duplicate', len(frame) - inserted)
+            metrics.increment('events_inserted', events)
+        return len(frame)
+    except (TransactionRollbackError, DataError, IntegrityError):
+        raise
     except Exception as e:
-        print(f"Error inserting driving record: {e}")
+        if db.is_transient(e):
+            raise
+        print(f"Error copying driving records: {e}")
+        return None
+
+# Function to COPY a batch the database refused, skipping only the rows it refuses
+def copy_isolating_rows(conn, frame, rejects=None):
+    """
+    COPY frame in halves under savepoints until every refused row is on its own
+    
+    Good rows stay in the caller's transaction. A refused row is skipped and, when
+    rejects is a list, appended as (frame index, reason, CSV row). Each bad row costs
+    about 2 * log2(len(frame)) extra COPYs. Returns the number of records handled,
+    or None on an error that is not about the rows.
+    """
+    handled = 0
+    pieces = [frame]
+    with conn.cursor() as cursor:
+        while pieces:
+            piece = pieces.pop()
+            cursor.execute("SAVEPOINT isolate_rows")
+            try:
+                count = copy_driving_records(conn, piece)
+            except (DataError, IntegrityError) as e:
+                cursor.execute("ROLLBACK TO SAVEPOINT isolate_rows")
+                if len(piece) > 1:
+                    # First half on top, so in-batch repeats keep their first reading
+                    half = len(piece) // 2
+                    pieces.extend([piece.iloc[half:], piece.iloc[:half]])
+                    continue
+                metrics.increment('records_refused')
+                if rejects is not None:
+                    reason = e.diag.message_primary or str(e).strip()
+                    rejects.append((piece.index[0], reason, records_to_csv(piece).rstrip('\n')))
+                continue
+            if count is None:
+                return None
+            # The copied rows stay in the staging table until commit; clear them so the
+            # next piece doesn't merge them again
+            cursor.execute("RELEASE SAVEPOINT isolate_rows; DELETE FROM driving_records_staging")
+            handled += count
+    return handled
+
+# Function to record how far into a file the loader has committed
+def save_checkpoint(conn, checkpoint):
+    """Upsert an ingest_checkpoints row; runs inside the caller's open transaction"""
+    upsert_sql = """
+    INSERT INTO ingest_checkpoints (file_name, byte_offset, last_driver_id, last_record_time, records_loaded, updated_at)
+    VALUES (%s, %s, %s, %s, %s, now())
+    ON CONFLICT (file_name)
+    DO UPDATE SET byte_offset = EXCLUDED.byte_offset,
+                  last_driver_id = COALESCE(EXCLUDED.last_driver_id, ingest_checkpoints.last_driver_id),
+                  last_record_time = COALESCE(EXCLUDED.last_record_time, ingest_checkpoints.last_record_time),
+                  records_loaded = ingest_checkpoints.records_loaded + EXCLUDED.records_loaded,
+                  updated_at = now()
+    """
+    with conn.cursor() as cursor:
+        cursor.execute(upsert_sql, (
+            checkpoint['file_name'],
+            checkpoint['byte_offset'],
+            checkpoint.get('last_driver_id'),
+            checkpoint.get('last_record_time'),
+            checkpoint.get('records_loaded', 0)
+        ))
+    metrics.increment('db_round_trips')
+
+# Function to read the committed checkpoints of all files
+def get_checkpoints(conn):
+    """Return {file_name: byte_offset} for every file the streaming loader has touched"""
+    with conn.cursor() as cursor:
+        cursor.execute("SELECT file_name, byte_offset FROM ingest_checkpoints")
+        return dict(cursor.fetchall())
+
+# Number of times a batch is retried after a deadlock with another loader
+BATCH_RETRIES = 3
+
+# Function to write one batch of drivers and records in a single transaction
+def write_batch(conn, frame, checkpoint=None, retries=BATCH_RETRIES, rejects=None):
+    """
+    Upsert the batch's new or changed drivers and COPY its records, then commit
+
+    Drivers are checked against the process-wide registry, so known drivers cost no
+    round trip; the rest go out in one statement and enter the registry once committed.
+    Loaders running in parallel can deadlock on overlapping readings or shared
+    drivers; Postgres aborts one side and the whole batch is retried here. A record
+    whose driver or daily partition is missing means the registry or partition list
+    is stale, so both are reloaded and the batch retried. Any other row the database
+    refuses is isolated by copy_isolating_rows() and skipped (appended to rejects,
+    when it is a list, once the rest of the batch commits). When a checkpoint is given
+    it is saved in the same transaction, so the data and the recorded file position
+    are committed together or not at all. A lost connection is raised; the batch can
+    then be run again on a new one with db.retrying().
+
+    Returns the number of records handled, or None if the batch was rolled back
+    """
+    registry = get_driver_registry(conn)
+    ensure_partitions(conn, frame['record_time'])
+    attempt = 0
+    isolate = False
+    while True:
+        try:
+            drivers = drivers_to_upsert(frame, registry)
+            with metrics.timer('driver_upsert'):
+                upsert_drivers(conn, drivers)
+            refused = []
+            if isolate:
+                count = copy_isolating_rows(conn, frame, refused)
+            else:
+                count = copy_driving_records(conn, frame)
+            if count is None:
+                conn.rollback()
+                metrics.increment('batches_failed')
+                return None
+            if checkpoint:
+                save_checkpoint(conn, checkpoint)
+            with metrics.timer('commit'):
+                conn.commit()
+            metrics.increment('db_round_trips')
+            metrics.increment('batches_committed')
+            registry.update(drivers)
+            if rejects is not None:
+                rejects.extend(refused)
+            return count
+        except TransactionRollbackError as e:
+            conn.rollback()
+            if attempt == retries:
+                print(f"Giving up on batch after {retries} retries: {e}")
+                metrics.increment('batches_failed')
+                return None
+            attempt += 1
+            metrics.increment('batch_retries')
+            time.sleep(0.1 * attempt)
+        except (DataError, IntegrityError) as e:
+            conn.rollback()
+            if isinstance(e, (ForeignKeyViolation, CheckViolation)) and attempt < retries and not isolate:
+                attempt += 1
+                registry = get_driver_registry(conn, reload=True)
+                ensure_partitions(conn, frame['record_time'], reload=True)
+                continue
+            if isolate:
+                print(f"Giving up on batch: {e}")
+                metrics.increment('batches_failed')
+                return None
+            metrics.increment('batches_isolated')
+            isolate = True
+
+# Function to set aside lines and records that can't be loaded
+def quarantine(file_path, rejects, location='line'):
+    """
+    Append (position, reason, text) rejects of file_path to QUARANTINE_PATH as JSON lines
+    
+    position is stored under the location key ('line' number or 'byte_offset'); text is
+    the raw line, or the CSV row sent to COPY for rows the database refused.
+    """
+    if not rejects:
+        return
+    metrics.increment('lines_quarantined', len(rejects))
+    if not QUARANTINE_PATH:
+        return
+    timestamp = datetime.now().isoformat(timespec='milliseconds')
+    entries = ''.join(
+        json.dumps({'timestamp': timestamp, 'file': file_path, location: int(position), 'reason': reason,
+                    'text': text}, ensure_ascii=False) + '\n'
+        for position, reason, text in rejects
+    )
+    with quarantine_lock, open(QUARANTINE_PATH, 'a', encoding='utf-8') as file:
+        file.write(entries)
+
+# Function to read and parse a file one batch at a time
+def read_parsed_chunks(file_path, batch_size=5000, max_records=None):
+    """
+    Yield parse_chunk() frames of batch_size lines, stopping after max_records rows
+    
+    Frames are indexed by line number in the file; lines that can't be parsed are
+    quarantined here.
+    """
+    parsed = 0
+    line_number = 1
+    with open(file_path, 'r', encoding='utf-8') as file:
+        while max_records is None or parsed < max_records:
+            with metrics.timer('read'):
+                lines = list(itertools.islice(file, batch_size))
+            if not lines:
+                break
+            
+            rejects = []
+            with metrics.timer('parse'):
+                frame = parse_chunk(lines, rejects)
+            metrics.increment('lines_read', len(lines))
+            metrics.increment('lines_parsed', len(frame))
+            metrics.increment('lines_rejected', len(lines) - len(frame))
+            quarantine(file_path, [(line_number + index, reason, lines[index].rstrip('\r\n'))
+                                   for index, reason in rejects])
+            frame.index += line_number
+            line_number += len(lines)
+            if max_records is not None:
+                frame = frame.iloc[:max_records - parsed]
+            parsed += len(frame)
+            if not frame.empty:
+                yield frame
+
+# Parsed batches buffered between the parse and write stages of a pipelined load
+PIPELINE_QUEUE_DEPTH = 4
+
+# Function to run a batch producer in a background thread
+def prefetch(batches, depth=PIPELINE_QUEUE_DEPTH):
+    """
+    Yield the items of batches while a background thread produces the next ones
+    
+    At most depth items wait in the queue, so a fast producer blocks instead of
+    reading the whole file ahead. An exception in the producer is re-raised here;
+    when the consumer stops early the producer is told to stop and is joined.
+    """
+    handoff = queue.Queue(maxsize=depth)
+    stop = threading.Event()
+    done = object()
+    
+    def hand_over(item):
+        while not stop.is_set():
+            try:
+                handoff.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
         return False
+    
+    def produce():
+        try:
+            for item in batches:
+                if not hand_over(item):
+                    return
+            hand_over(done)
+        except BaseException as e:
+            hand_over(e)
+        finally:
+            batches.close()
+    
+    producer = threading.Thread(target=produce, name='load_data-parser', daemon=True)
+    producer.start()
+    try:
+        while True:
+            with metrics.timer('pipeline_wait'):
+                item = handoff.get()
+            if item is done:
+                break
+            if isinstance(item, BaseException):
+                raise item
+            yield item
+    finally:
+        stop.set()
+        producer.join()
+
+# Function to load a file with one COPY round trip per batch
+def bulk_load_data(file_path, batch_size=5000, max_records=None, create_schema=True, pipeline=False):
+    """
+    Load data from a file into the database using COPY FROM STDIN
+    
+    Args:
+        file_path: Path to the data file
+        batch_size: Number of lines parsed together and sent in each COPY/commit
+        max_records: Maximum number of records to process from the file (None for all records)
+        create_schema: Run create_tables() first; parallel workers skip it
+        pipeline: Read and parse the next batches in a background thread while the
+            current one is written, with at most PIPELINE_QUEUE_DEPTH batches buffered
+
+    Returns:
+        Number of records processed, or None if the database is unreachable, a batch
+        was given up on or the load stopped part way through the file
+    """
+    conn = connect_to_db()
+    if not conn:
+        return None
+    
+    if create_schema:
+        create_tables(conn)
+    
+    drivers_seen = set()
+    total_records = 0
+    failed_batches = 0
+    
+    batches = read_parsed_chunks(file_path, batch_size, max_records)
+    if pipeline:
+        batches = prefetch(batches)
+    try:
+        for frame in batches:
+            rejects = []
+            conn, count = db.retrying(conn, write_batch, frame, rejects=rejects)
+            quarantine(file_path, rejects)
+            if count is None:
+                failed_batches += 1
+                continue
+            drivers_seen.update(frame['driver_id'].unique())
+            total_records += count
+            print(f"Processed {total_records} records successfully")
+        
+        print(f"Total records processed: {total_records}")
+        print(f"Total unique drivers: {len(drivers_seen)}")
+        if failed_batches:
+            print(f"{failed_batches} batches of {file_path} were not loaded")
+            return None
+        return total_records
+    except Exception as e:
+        print(f"Error processing file after {total_records} records: {e}")
+        return None
+    finally:
+        batches.close()
+        conn.close()
+
+# Function to insert a batch of parsed lines one statement at a time in one transaction
+def insert_record_batch(conn, batch, rejects=None, retries=BATCH_RETRIES):
+    """
+    Insert (line number, line, parse_line() result) entries with one INSERT per record, then commit
+    
+    New or re-plated drivers are upserted first. A record the database refuses aborts
+    the transaction, so the batch is rolled back and replayed without it; once the
+    rest commits, the record is appended to rejects as (line number, reason, line) when
+    rejects is a list. A bad record costs one replay instead of a reconnect and the
+    rest of the batch. Returns the number of records inserted or skipped as duplicates.
+    """
+    registry = get_driver_registry(conn)
+    ensure_partitions(conn, [parsed['driving_record']['record_time'] for _, _, parsed in batch])
+    batch = list(batch)
+    refused = []
+    attempt = 0
+    while batch:
+        drivers = {}
+        for _, _, parsed in batch:
+            driver = parsed['driver']
+            if registry.get(driver['driver_id']) != driver['car_plate_number']:
+                drivers[driver['driver_id']] = driver['car_plate_number']
+        position = None
+        try:
+            upsert_drivers(conn, list(drivers.items()))
+            for position, (_, _, parsed) in enumerate(batch):
+                insert_driving_record(conn, parsed['driving_record'])
+            position = None
+            with metrics.timer('commit'):
+                conn.commit()
+            metrics.increment('db_round_trips')
+            registry.update(drivers)
+            if rejects is not None:
+                rejects.extend(refused)
+            return len(batch)
+        except TransactionRollbackError:
+            conn.rollback()
+            if attempt == retries:
+                raise
+            attempt += 1
+            metrics.increment('batch_retries')
+            time.sleep(0.1 * attempt)
+        except (DataError, IntegrityError) as e:
+            conn.rollback()
+            if isinstance(e, (ForeignKeyViolation, CheckViolation)) and attempt < retries:
+                # A missing driver or partition usually means the registry or partition list is stale
+                attempt += 1
+                registry = get_driver_registry(conn, reload=True)
+                ensure_partitions(conn, [parsed['driving_record']['record_time'] for _, _, parsed in batch],
+                                  reload=True)
+                continue
+            if position is None:
+                raise
+            line_number, line, _ = batch.pop(position)
+            metrics.increment('records_refused')
+            metrics.increment('batch_replays')
+            refused.append((line_number, e.diag.message_primary or str(e).strip(), line.rstrip('\r\n')))
+    if rejects is not None:
+        rejects.extend(refused)
+    return 0
 
 # Main function to process the file and load data
-def load_data(file_path, batch_size=1000, max_records=None):
+def load_data(file_path, batch_size=1000, max_records=None, method='copy', create_schema=True, pipeline=False):
     """
     Load data from a file into the database
     
@@ -245,92 +1308,297 @@ def load_data(file_path, batch_size=1000, max_records=None):
         file_path: Path to the data file
         batch_size: Number of records to process in a single batch before committing
         max_records: Maximum number of records to process from the file (None for all records)
+        method: 'copy' to send each batch with COPY FROM STDIN, 'row' for one INSERT per record
+        create_schema: Create the tables if they don't exist before loading
+        pipeline: With method 'copy', parse ahead in a background thread (see bulk_load_data())
+
+    Returns:
+        Number of records processed, or None if the database is unreachable or part of
+        the file could not be loaded
     """
+    if method == 'copy':
+        return bulk_load_data(file_path, batch_size=batch_size, max_records=max_records,
+                              create_schema=create_schema, pipeline=pipeline)
+    
     # Connect to the database
     conn = connect_to_db()
     if not conn:
-        return
+        return None
     
     # Create the tables if they don't exist
-    create_tables(conn)
+    if create_schema:
+        create_tables(conn)
     
     try:
         # Process the file
-        drivers_processed = set()
-        records = []
+        drivers_seen = set()
+        batch = []
+        rejects = []
+        parsed = 0
         total_records = 0
         
         with open(file_path, 'r', encoding='utf-8') as file:
-            for line in file:
+            for line_number, line in enumerate(file, 1):
                 # Stop if we've reached the maximum number of records
-                if max_records is not None and total_records >= max_records:
+                if max_records is not None and parsed >= max_records:
                     break
                 
-                parsed_data = parse_line(line)
+                problems = []
+                parsed_data = parse_line(line, problems)
+                metrics.increment('lines_read')
+                metrics.increment('lines_parsed' if parsed_data else 'lines_rejected')
+                if problems:
+                    rejects.append((line_number, problems[0], line.rstrip('\r\n')))
                 if parsed_data:
-                    driver = parsed_data['driver']
-                    record = parsed_data['driving_record']
-                    
-                    # Insert driver if not already processed
-                    if driver['driver_id'] not in drivers_processed:
-                        if insert_driver(conn, driver):
-                            drivers_processed.add(driver['driver_id'])
-                    
-                    # Add record to batch
-                    records.append(record)
-                    
-                    # Insert in batches
-                    if len(records) >= batch_size:
-                        success_count = 0
-                        for rec in records:
-                            if insert_driving_record(conn, rec):
-                                success_count += 1
-                            else:
-                                # If insertion fails, commit what we have so far to avoid losing all records
-                                conn.rollback()
-                                conn = connect_to_db()  # Reconnect to start a fresh transaction
-                                if not conn:
-                                    return
-                        
-                        if success_count > 0:
-                            conn.commit()
-                            total_records += success_count
-                            print(f"Processed {total_records} records successfully")
-                        
-                        records = []
-                        
-                        # Stop if we've reached the maximum number of records
-                        if max_records is not None and total_records >= max_records:
-                            break
+                    drivers_seen.add(parsed_data['driver']['driver_id'])
+                    batch.append((line_number, line, parsed_data))
+                    parsed += 1
+                
+                # Insert in batches
+                if len(batch) >= batch_size:
+                    with metrics.timer('insert_batch'):
+                        conn, count = db.retrying(conn, insert_record_batch, batch, rejects)
+                    total_records += count
+                    quarantine(file_path, rejects)
+                    batch = []
+                    rejects = []
+                    print(f"Processed {total_records} records successfully")
             
             # Insert any remaining records
-            if records:
-                success_count = 0
-                for rec in records:
-                    # Stop if we've reached the maximum number of records
-                    if max_records is not None and total_records >= max_records:
-                        break
-                        
-                    if insert_driving_record(conn, rec):
-                        success_count += 1
-                        # Commit after each successful insert for the remaining records
-                        conn.commit()
-                    else:
-                        conn.rollback()
-                        conn = connect_to_db()  # Reconnect to start a fresh transaction
-                        if not conn:
-                            break
-                
-                total_records += success_count
+            if batch:
+                with metrics.timer('insert_batch'):
+                    conn, count = db.retrying(conn, insert_record_batch, batch, rejects)
+                total_records += count
+            quarantine(file_path, rejects)
         
         print(f"Total records processed: {total_records}")
-        print(f"Total unique drivers: {len(drivers_processed)}")
+        print(f"Total unique drivers: {len(drivers_seen)}")
+        return total_records
     except Exception as e:
-        print(f"Error processing file: {e}")
-        conn.rollback()
+        print(f"Error processing file after {total_records} records: {e}")
+        return None
+    finally:
+        conn.close()
+
+# Function to read the complete lines that follow a byte offset
+def read_complete_lines(file, offset, max_lines):
+    """
+    Read up to max_lines newline-terminated lines starting at offset
+
+    A trailing line without a newline is still being written and is left for the
+    next read. Returns the decoded lines and the offset just past the last one.
+    """
+    file.seek(offset)
+    lines = []
+    for _ in range(max_lines):
+        line = file.readline()
+        if not line.endswith(b'\n'):
+            break
+        lines.append(line.decode('utf-8'))
+        offset += len(line)
+    return lines, offset
+
+# Function to load everything appended to a file since its last checkpoint
+def tail_file(file_path, offset, batch_size=5000):
+    """
+    Load the complete lines after offset, committing a checkpoint with every batch
+
+    Returns the new committed offset and the number of records handled. Stops early
+    (without advancing past the failed batch) if a batch is rolled back. Lines and
+    records that can't be loaded are quarantined with their byte offsets. A batch
+    whose connection is lost is retried on a new one (see db.retrying()); if the
+    database stays away, the error is raised and everything up to the last committed
+    checkpoint stays loaded.
+    """
+    file_name = os.path.basename(file_path)
+    total_records = 0
+    conn = db.connect()
+    try:
+        with open(file_path, 'rb') as file:
+            while True:
+                with metrics.timer('read'):
+                    lines, next_offset = read_complete_lines(file, offset, batch_size)
+                if not lines:
+                    break
+                
+                rejects = []
+                with metrics.timer('parse'):
+                    frame = parse_chunk(lines, rejects)
+                metrics.increment('lines_read', len(lines))
+                metrics.increment('lines_parsed', len(frame))
+                metrics.increment('lines_rejected', len(lines) - len(frame))
+                checkpoint = {'file_name': file_name, 'byte_offset': next_offset, 'records_loaded': len(frame)}
+                if not frame.empty:
+                    last = frame.iloc[-1]
+                    checkpoint['last_driver_id'] = last['driver_id']
+                    checkpoint['last_record_time'] = None if pd.isna(last['record_time']) else last['record_time'].to_pydatetime()
+                
+                refused = []
+                conn, count = db.retrying(conn, write_batch, frame, checkpoint=checkpoint, rejects=refused)
+                if count is None:
+                    print(f"Stopping {file_name} at byte {offset}; the batch will be retried on the next poll")
+                    break
+                # Rejects are quarantined once their batch is committed, so a retried batch
+                # doesn't quarantine them twice
+                if rejects or refused:
+                    starts = list(itertools.accumulate((len(line.encode('utf-8')) for line in lines), initial=offset))
+                    quarantine(file_path, [(starts[index], reason, lines[index].rstrip('\r\n')) for index, reason in rejects]
+                               + [(starts[index], reason, text) for index, reason, text in refused],
+                               location='byte_offset')
+                total_records += count
+                offset = next_offset
     finally:
-        if conn:
-            conn.close()
+        conn.close()
+    return offset, total_records
+
+# Function to continuously load new and growing files from a directory
+def stream_directory(folder_path, poll_interval=5.0, batch_size=5000, prefix='detail_record_', once=False):
+    """
+    Watch a directory and tail every data file in it, resuming from committed checkpoints
+    
+    Each batch is committed together with its file's byte offset in ingest_checkpoints,
+    so after a crash or restart only data past the last checkpoint is read again.
+    A file that shrinks below its checkpoint is treated as replaced and reloaded from
+    the start; the (driver_id, record_time) key keeps that reload free of duplicates.
+    If the database stays unreachable past the retries of a batch, the scan is
+    abandoned and the next poll starts again from the committed checkpoints.
+    
+    Args:
+        folder_path: Directory containing the data files
+        poll_interval: Seconds to wait between directory scans
+        batch_size: Number of lines parsed together and committed with one checkpoint
+        prefix: Only files whose name starts with this prefix are loaded
+        once: Drain whatever is available and return instead of polling forever
+
+    Returns:
+        Number of records handled, or None if the database is unreachable
+    """
+    conn = connect_to_db()
+    if not conn:
+        return None
+    create_tables(conn)
+    conn.close()
+    
+    total_records = 0
+    offsets = None
+    try:
+        while True:
+            try:
+                if offsets is None:
+                    conn = db.connect()
+                    try:
+                        offsets = get_checkpoints(conn)
+                    finally:
+                        conn.close()
+                for file_name in sorted(os.listdir(folder_path)):
+                    if not file_name.startswith(prefix):
+                        continue
+                    file_path = os.path.join(folder_path, file_name)
+                    size = os.path.getsize(file_path)
+                    offset = offsets.get(file_name, 0)
+                    if size < offset:
+                        print(f"{file_name} shrank below its checkpoint; reloading from the start")
+                        offset = 0
+                    if size == offset:
+                        continue
+                    
+                    offsets[file_name], count = tail_file(file_path, offset, batch_size)
+                    if count:
+                        total_records += count
+                        print(f"{file_name}: +{count} records (offset {offsets[file_name]})")
+            except psycopg2.Error as e:
+                if not db.is_transient(e):
+                    raise
+                print(f"Database unavailable ({e}); resuming from the checkpoints on the next poll")
+                offsets = None
+            
+            metrics.flush(job='load_data_stream')
+            if once:
+                break
+            time.sleep(poll_interval)
+    except KeyboardInterrupt:
+        print("Stopping stream")
+    
+    print(f"Total records processed: {total_records}")
+    return total_records
+
+# Function to load one file inside a worker process
+def load_file_task(task):
+    file_path, batch_size, max_records, method, pipeline = task
+    # Worker processes are reused, so each task reports only its own metrics
+    metrics.reset()
+    start = time.perf_counter()
+    try:
+        records = load_data(file_path, batch_size=batch_size, max_records=max_records,
+                            method=method, create_schema=False, pipeline=pipeline)
+    except Exception as e:
+        print(f"Error loading {file_path}: {e}")
+        records = None
+    seconds = time.perf_counter() - start
+    metrics.observe('file_load', seconds)
+    return file_path, records, seconds, metrics.snapshot()
+
+# Function to load many files at once with a pool of worker processes
+def load_files_parallel(file_paths, workers=None, batch_size=5000, max_records=None, method='copy',
+                        pipeline=False):
+    """
+    Load several data files concurrently, one database connection per worker process
+
+    Overlapping readings in different files are still stored once: every worker merges
+    through the (driver_id, record_time) unique key and retries batches that deadlock.
+    
+    Args:
+        file_paths: Paths of the data files to load
+        workers: Number of worker processes (defaults to the number of CPU cores)
+        batch_size: Number of records per batch in each worker
+        max_records: Maximum number of records to process from each file (None for all records)
+        method: Load method passed to load_data() ('copy' or 'row')
+        pipeline: Overlap parsing and database writes inside each worker
+
+    Returns:
+        Summary dict with files, records, failed_files and seconds, or None if the database is unreachable
+    """
+    # Create the schema once so workers don't race on DDL, and load the driver
+    # registry once for all workers
+    conn = connect_to_db()
+    if not conn:
+        return None
+    create_tables(conn)
+    registry = get_driver_registry(conn, reload=True)
+    conn.close()
+    # Forked workers open their own connections; don't leave them the parent's
+    db.close_all()
+    
+    workers = max(1, min(workers or os.cpu_count() or 1, len(file_paths) or 1))
+    tasks = [(file_path, batch_size, max_records, method, pipeline) for file_path in file_paths]
+    summary = {'files': 0, 'records': 0, 'failed_files': [], 'seconds': 0.0}
+    start = time.perf_counter()
+    
+    print(f"Loading {len(tasks)} files with {workers} workers")
+    with multiprocessing.Pool(processes=workers, initializer=set_driver_registry, initargs=(registry,)) as pool:
+        for done, (file_path, records, seconds, worker_metrics) in enumerate(
+                pool.imap_unordered(load_file_task, tasks), 1):
+            metrics.merge(worker_metrics)
+            if records is None:
+                # Unreachable database, an abort part way through or batches given up on:
+                # whatever did load stays, and reloading the file merges the rest
+                metrics.increment('files_failed')
+                summary['failed_files'].append(file_path)
+                print(f"[{done}/{len(tasks)}] {os.path.basename(file_path)}: failed")
+                continue
+            metrics.increment('files_loaded')
+            summary['files'] += 1
+            summary['records'] += records
+            print(f"[{done}/{len(tasks)}] {os.path.basename(file_path)}: {records} records in {seconds:.1f}s")
+    
+    summary['seconds'] = time.perf_counter() - start
+    rate = summary['records'] / summary['seconds'] if summary['seconds'] > 0 else 0.0
+    print(f"Loaded {summary['records']} records from {summary['files']} files "
+          f"in {summary['seconds']:.1f}s ({rate:.0f} records/s)")
+    if summary['failed_files']:
+        print(f"Failed files: {', '.join(summary['failed_files'])}")
+    metrics.flush(job='load_data')
+    return summary
 
 # Create a function to create the database if it doesn't exist
 def create_database():
@@ -360,26 +1628,59 @@ def create_database():
         return False
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Load detail_record files into PostgreSQL")
     # Path to your data folder
-    folder_path = r"c:\School Stuff\Homework\COMP4442\Term Project\detail-records\detail-records\records"
+    parser.add_argument('folder', nargs='?',
+                        default=r"c:\School Stuff\Homework\COMP4442\Term Project\detail-records\detail-records\records")
+    parser.add_argument('--workers', type=int, default=os.cpu_count(), help="Number of files loaded in parallel")
+    parser.add_argument('--batch-size', type=int, default=5000)
+    parser.add_argument('--max-records', type=int, default=None, help="Records to process from each file (default: all)")
+    parser.add_argument('--method', choices=['copy', 'row'], default='copy')
+    parser.add_argument('--follow', action='store_true',
+                        help="Keep tailing the folder, resuming from committed checkpoints")
+    parser.add_argument('--poll-interval', type=float, default=5.0)
+    parser.add_argument('--pipeline', action='store_true',
+                        help="Parse the next batches in a background thread while the current one is written")
+    parser.add_argument('--metrics-jsonl', help="Append run metrics as JSON lines to this file")
+    parser.add_argument('--metrics-prom', help="Write run metrics to this Prometheus textfile")
+    parser.add_argument('--quarantine', default=QUARANTINE_PATH,
+                        help="JSON lines file receiving lines and records that can't be loaded (default: %(default)s)")
+    parser.add_argument('--partitioned', action='store_true',
+                        help="Create driving_records with one partition per record_date (new databases only)")
+    parser.add_argument('--migrate-partitioned', action='store_true',
+                        help="Rebuild an existing driving_records table as daily partitions, then exit")
+    parser.add_argument('--add-grid-cell', action='store_true',
+                        help="Add the grid_cell column to an existing driving_records table (rewrites it), then exit")
+    parser.add_argument('--drop-before', type=lambda value: datetime.strptime(value, '%Y-%m-%d').date(),
+                        help="Drop the daily partitions of record_dates before this date (YYYY-MM-DD), then exit")
+    args = parser.parse_args()
+    metrics.configure(args.metrics_jsonl, args.metrics_prom)
+    # Through the environment too, so worker processes started by spawn see it
+    os.environ['QUARANTINE_PATH'] = QUARANTINE_PATH = args.quarantine
+    if args.partitioned:
+        PARTITIONED_STORAGE = True
     
     # Create the database if it doesn't exist
     if create_database():
-        # Find all files in the folder
-        csv_files = [f for f in os.listdir(folder_path)]
-        
-        if csv_files:
-            # Number of records to process from each file
-            records_per_file = 100
-            
-            # Process each file
-            for file_name in csv_files:
-                file_path = os.path.join(folder_path, file_name)
-                print(f"\nProcessing file: {file_name}")
-                
-                # Load specified number of records from each file
-                # batch_size=20 means process 20 records at a time
-                # max_records=records_per_file means stop after processing that many records
-                load_data(file_path, batch_size=100, max_records=records_per_file)
+        if args.migrate_partitioned or args.add_grid_cell or args.drop_before:
+            conn = connect_to_db()
+            if conn:
+                if args.migrate_partitioned:
+                    migrate_to_partitioned(conn)
+                if args.add_grid_cell:
+                    add_grid_cell(conn)
+                if args.drop_before:
+                    dropped = drop_partitions_before(conn, args.drop_before)
+                    print(f"Dropped {len(dropped)} daily partitions")
+                conn.close()
+        elif args.follow:
+            stream_directory(args.folder, poll_interval=args.poll_interval, batch_size=args.batch_size)
         else:
-            print("No files found in the specified folder")
+            # Find all files in the folder
+            csv_files = sorted(os.path.join(args.folder, f) for f in os.listdir(args.folder))
+            
+            if csv_files:
+                load_files_parallel(csv_files, workers=args.workers, batch_size=args.batch_size,
+                                    max_records=args.max_records, method=args.method, pipeline=args.pipeline)
+            else:
+                print("No files found in the specified folder")
@@ -0,0 +1,240 @@
+import argparse
+import glob
+import io
+import json
+import os
+import re
+import time
+from datetime import date
+import numpy as np
+import pandas as pd
+
+import db
+from spark_analysis import (
+    PARQUET_PATH, ANALYSIS_COLUMNS, build_records_query, create_analysis_table, publish_staging, staging_lock
+)
+
+# Runs whose input is estimated below this many rows skip Spark in engine="auto"
+LOCAL_ENGINE_MAX_ROWS = int(os.getenv('LOCAL_ENGINE_MAX_ROWS', 5000000))
+
+# Rows pulled from the server-side cursor per group-by step
+LOCAL_CHUNK_SIZE = 100000
+
+def aggregate_chunk(chunk):
+    """Per-driver speed_sum, speed_count and top_speed of one chunk of (driver_id, speed) rows"""
+    speeds = pd.to_numeric(chunk['speed'], errors='coerce')
+    grouped = speeds.groupby(chunk['driver_id'], sort=False)
+    return pd.DataFrame({
+        'speed_sum': grouped.sum(),
+        'speed_count': grouped.count(),
+        'top_speed': grouped.max()
+    })
+
+def merge_partials(partials):
+    """Combine per-driver partials; sums and counts add up and top speeds take the max"""
+    if not partials:
+        return pd.DataFrame({'speed_sum': [], 'speed_count': [], 'top_speed': []},
+                            index=pd.Index([], name='driver_id'))
+    combined = pd.concat(partials)
+    return combined.groupby(level=0, sort=False).agg({'speed_sum': 'sum', 'speed_count': 'sum', 'top_speed': 'max'})
+
+def read_partials_from_postgres(start_date=None, end_date=None, chunk_size=LOCAL_CHUNK_SIZE):
+    """Stream driver_id and speed from driving_records through a server-side cursor"""
+    query = build_records_query(start_date, end_date, ['driver_id', 'speed'])
+    conn = db.connect()
+    try:
+        with conn.cursor(name='local_analysis_records') as cursor:
+            cursor.itersize = chunk_size
+            cursor.execute(query)
+            partials = []
+            while True:
+                rows = cursor.fetchmany(chunk_size)
+                if not rows:
+                    break
+                chunk = pd.DataFrame(rows, columns=['id', 'driver_id', 'speed'])
+                # Keep the running partials small: at most one row per driver per step
+                partials = [merge_partials(partials + [aggregate_chunk(chunk)])]
+        return merge_partials(partials)
+    finally:
+        conn.close()
+
+def list_parquet_files(parquet_path=PARQUET_PATH, start_date=None, end_date=None):
+    """Return the Parquet files of the record_date partitions inside the date range"""
+    files = []
+    for partition in sorted(glob.glob(os.path.join(parquet_path, 'record_date=*'))):
+        match = re.search(r'record_date=(\d{4}-\d{2}-\d{2})$', partition)
+        if not match:
+            continue
+        day = date.fromisoformat(match.group(1))
+        if start_date and day < date.fromisoformat(str(start_date)):
+            continue
+        if end_date and day > date.fromisoformat(str(end_date)):
+            continue
+        files.extend(sorted(glob.glob(os.path.join(partition, '*.parquet'))))
+    return files
+
+def read_partials_from_parquet(parquet_path=PARQUET_PATH, start_date=None, end_date=None):
+    """Read driver_id and speed one Parquet file at a time (needs pyarrow)"""
+    partials = []
+    for file_path in list_parquet_files(parquet_path, start_date, end_date):
+        chunk = pd.read_parquet(file_path, columns=['driver_id', 'speed'])
+        partials = [merge_partials(partials + [aggregate_chunk(chunk)])]
+    return merge_partials(partials)
+
+def rank_partials(totals):
+    """
+    Turn per-driver partials into driver_speed_analysis rows
+
+    Ranks follow analyze_driver_speeds(): descending speed with NULLs last, ties broken
+    by driver_id.
+    """
+    totals = totals.rename_axis('driver_id').reset_index()
+    totals['avg_speed'] = totals['speed_sum'] / totals['speed_count'].replace(0, np.nan)
+    totals['top_speed'] = totals['top_speed'].astype('Int64')
+    for value_column, rank_column in [('avg_speed', 'avg_speed_rank'), ('top_speed', 'top_speed_rank')]:
+        order = totals.sort_values([value_column, 'driver_id'], ascending=[False, True], na_position='last').index
+        totals.loc[order, rank_column] = np.arange(1, len(totals) + 1)
+    for rank_column in ['avg_speed_rank', 'top_speed_rank']:
+        totals[rank_column] = totals[rank_column].astype('int64')
+    return totals[ANALYSIS_COLUMNS].sort_values('avg_speed_rank').reset_index(drop=True)
+
+def analyze_driver_speeds_local(source='postgres', parquet_path=PARQUET_PATH, start_date=None, end_date=None):
+    """Compute driver_speed_analysis rows without Spark"""
+    if source == 'parquet':
+        totals = read_partials_from_parquet(parquet_path, start_date, end_date)
+    else:
+        totals = read_partials_from_postgres(start_date, end_date)
+    return rank_partials(totals)
+
+def save_analysis_local(analysis, table='driver_speed_analysis'):
+    """COPY the rows into the staging table and publish them like save_to_postgres()"""
+    buffer = io.StringIO()
+    analysis[ANALYSIS_COLUMNS].to_csv(buffer, index=False, header=False, na_rep='\\N')
+    buffer.seek(0)
+    try:
+        conn = db.connect()
+        with staging_lock(conn, f"{table}_staging"):
+            with conn.cursor() as cursor:
+                cursor.execute(f"TRUNCATE TABLE {table}_staging")
+                cursor.copy_expert(
+                    f"COPY {table}_staging ({', '.join(ANALYSIS_COLUMNS)}) FROM STDIN WITH (FORMAT csv, NULL '\\N')",
+                    buffer
+                )
+            saved = publish_staging(conn, table, ANALYSIS_COLUMNS)
+        print(f"Successfully saved {saved} records to {table} table")
+        conn.close()
+        return True
+    except Exception as e:
+        print(f"Error saving to PostgreSQL: {e}")
+        return False
+
+def run_local_analysis(source='postgres', parquet_path=PARQUET_PATH, start_date=None, end_date=None):
+    """Run the driver speed analysis with the local engine and store the rankings"""
+    if not create_analysis_table():
+        return None
+    start = time.perf_counter()
+    analysis = analyze_driver_speeds_local(source, parquet_path, start_date, end_date)
+    print(f"Analyzed {len(analysis)} drivers locally in {time.perf_counter() - start:.2f}s")
+    print("\nSample analysis results (top 10 by average speed):")
+    print(analysis.head(10).to_string(index=False))
+    save_analysis_local(analysis)
+    return analysis
+
+def estimate_row_count(source='postgres', parquet_path=PARQUET_PATH, start_date=None, end_date=None):
+    """Cheap estimate of the rows a run would read: planner estimate or Parquet footers"""
+    if source == 'parquet':
+        import pyarrow.parquet as pq
+        return sum(pq.ParquetFile(file_path).metadata.num_rows
+                   for file_path in list_parquet_files(parquet_path, start_date, end_date))
+
+    conn = db.connect()
+    try:
+        with conn.cursor() as cursor:
+            cursor.execute("EXPLAIN (FORMAT JSON) " + build_records_query(start_date, end_date, ['driver_id', 'speed']))
+            plan = cursor.fetchone()[0]
+            if isinstance(plan, str):
+                plan = json.loads(plan)
+            return int(plan[0]['Plan']['Plan Rows'])
+    finally:
+        conn.close()
+
+def choose_engine(engine='auto', source='postgres', parquet_path=PARQUET_PATH, start_date=None, end_date=None,
+                  incremental=False, spark_stages=False, max_rows=LOCAL_ENGINE_MAX_ROWS):
+    """
+    Resolve engine="auto" to "local" or "spark"
+
+    Incremental runs and the stages that only exist on Spark (spark_stages: the safety
+    rollup, speed timelines, grid tiles, speed sketches) use Spark. Otherwise inputs estimated at max_rows or fewer
+    run locally; Parquet inputs also need pyarrow installed. Asking for engine="local"
+    together with those raises ValueError rather than silently skipping them.
+    """
+    if engine == 'local' and (incremental or spark_stages):
+        raise ValueError("The local engine only ranks drivers by speed and incidents; incremental runs, "
+                         "the safety rollup, speed timelines, grid tiles and speed percentiles need Spark")
+    if engine != 'auto':
+        return engine
+    if incremental or spark_stages:
+        return 'spark'
+    try:
+        rows = estimate_row_count(source, parquet_path, start_date, end_date)
+    except Exception as e:
+        print(f"Could not size the input ({e}), using Spark")
+        return 'spark'
+    print(f"Estimated {rows} input rows (local engine limit {max_rows})")
+    return 'local' if rows <= max_rows else 'spark'
+
+def check_engine_parity(source='postgres', parquet_path=PARQUET_PATH, start_date=None, end_date=None,
+                        tolerance=1e-9):
+    """
+    Run both engines on the same input and compare their driver_speed_analysis rows
+
+    Returns a dict with drivers (per engine) and mismatches: driver_ids missing from one
+    side or whose ranks, top speed or average (beyond tolerance) differ.
+    """
+    import spark_analysis
+
+    local = analyze_driver_speeds_local(source, parquet_path, start_date, end_date)
+    spark = spark_analysis.initialize_spark()
+    try:
+        if source == 'parquet':
+            records_df = spark_analysis.load_data_from_parquet(
+                spark, parquet_path, start_date, end_date, columns=['driver_id', 'speed'])
+        else:
+            records_df = spark_analysis.load_data_from_postgres(
+                spark, start_date, end_date, columns=['driver_id', 'speed'])
+        remote = spark_analysis.analyze_driver_speeds(records_df).toPandas()
+    finally:
+        spark.stop()
+
+    merged = local.merge(remote, on='driver_id', how='outer', suffixes=('_local', '_spark'), indicator=True)
+    both = merged['_merge'] == 'both'
+    avg_local = merged['avg_speed_local'].astype('float64')
+    avg_spark = merged['avg_speed_spark'].astype('float64')
+    avg_equal = np.isclose(avg_local, avg_spark, rtol=tolerance, atol=0) | (avg_local.isna() & avg_spark.isna())
+    equal = both & avg_equal
+    for column in ['avg_speed_rank', 'top_speed', 'top_speed_rank']:
+        left = merged[f'{column}_local'].astype('Int64')
+        right = merged[f'{column}_spark'].astype('Int64')
+        equal &= (left == right).fillna(left.isna() & right.isna()).astype(bool)
+    return {
+        'drivers_local': len(local),
+        'drivers_spark': len(remote),
+        'mismatches': int((~equal).sum())
+    }
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Driver speed analysis without Spark")
+    parser.add_argument('--source', choices=['postgres', 'parquet'], default='postgres')
+    parser.add_argument('--parquet-path', default=PARQUET_PATH)
+    parser.add_argument('--start-date', help="First record_date to analyze (YYYY-MM-DD)")
+    parser.add_argument('--end-date', help="Last record_date to analyze (YYYY-MM-DD)")
+    parser.add_argument('--check-parity', action='store_true',
+                        help="Compare the local and Spark engines on the same input instead of saving results")
+    args = parser.parse_args()
+
+    if args.check_parity:
+        result = check_engine_parity(args.source, args.parquet_path, args.start_date, args.end_date)
+        print(f"local: {result['drivers_local']} drivers, spark: {result['drivers_spark']} drivers, "
+              f"mismatches: {result['mismatches']}")
+    else:
+        run_local_analysis(args.source, args.parquet_path, args.start_date, args.end_date)
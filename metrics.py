@@ -0,0 +1,142 @@
+import bisect
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+
+# Upper bounds (seconds) of the timer histogram buckets, Prometheus style
+TIMER_BUCKETS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 300.0)
+
+# Default sinks; flush() writes to whichever are set
+JSONL_PATH = os.getenv('METRICS_JSONL_PATH')
+PROMETHEUS_PATH = os.getenv('METRICS_PROM_PATH')
+
+# Prefix of every metric name in the Prometheus textfile
+PROMETHEUS_PREFIX = 'sdm_'
+
+# Process-local registry: counter name -> value, timer name -> [count, sum, bucket counts]
+counters = {}
+timers = {}
+
+# Guards the registry: pipelined loads update it from the parser and the writer thread
+lock = threading.Lock()
+
+def configure(jsonl_path=None, prometheus_path=None):
+    """Set the sinks used by flush(); None keeps the current setting"""
+    global JSONL_PATH, PROMETHEUS_PATH
+    if jsonl_path:
+        JSONL_PATH = jsonl_path
+    if prometheus_path:
+        PROMETHEUS_PATH = prometheus_path
+
+def increment(name, value=1):
+    """Add value to a counter"""
+    with lock:
+        counters[name] = counters.get(name, 0) + value
+
+def observe(name, seconds):
+    """Record one duration in a timer histogram"""
+    with lock:
+        timer = timers.get(name)
+        if timer is None:
+            timer = timers[name] = [0, 0.0, [0] * (len(TIMER_BUCKETS) + 1)]
+        timer[0] += 1
+        timer[1] += seconds
+        timer[2][bisect.bisect_left(TIMER_BUCKETS, seconds)] += 1
+
+@contextmanager
+def timer(name):
+    """Time the enclosed block into the named histogram"""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe(name, time.perf_counter() - start)
+
+def snapshot():
+    """Copy of the registry that can cross process boundaries and be merge()d"""
+    with lock:
+        return {
+            'counters': dict(counters),
+            'timers': {name: [count, total, list(buckets)] for name, (count, total, buckets) in timers.items()}
+        }
+
+def merge(other):
+    """Add a snapshot() from another process into this registry"""
+    with lock:
+        for name, value in other['counters'].items():
+            counters[name] = counters.get(name, 0) + value
+        for name, (count, total, buckets) in other['timers'].items():
+            timer = timers.get(name)
+            if timer is None:
+                timer = timers[name] = [0, 0.0, [0] * (len(TIMER_BUCKETS) + 1)]
+            timer[0] += count
+            timer[1] += total
+            timer[2] = [mine + theirs for mine, theirs in zip(timer[2], buckets)]
+
+def reset():
+    with lock:
+        counters.clear()
+        timers.clear()
+
+def write_jsonl(path, **labels):
+    """Append the registry as one JSON line, with labels such as job= at the top level"""
+    registry = snapshot()
+    entry = {'timestamp': datetime.now().isoformat(timespec='milliseconds'), **labels}
+    entry['counters'] = registry['counters']
+    entry['timers'] = {
+        name: {
+            'count': count,
+            'sum_seconds': total,
+            'buckets': {str(bound): hits for bound, hits in zip(TIMER_BUCKETS + ('+Inf',), buckets)}
+        }
+        for name, (count, total, buckets) in registry['timers'].items()
+    }
+    with open(path, 'a', encoding='utf-8') as file:
+        file.write(json.dumps(entry) + '\n')
+
+def format_labels(labels, **extra):
+    pairs = {**labels, **extra}
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{key}="{value}"' for key, value in pairs.items()) + '}'
+
+def write_prometheus(path, **labels):
+    """
+    Replace a Prometheus textfile-collector file with the registry
+
+    Counters become <name>_total and timers become <name>_seconds histograms. The file
+    is written next to its target and renamed, so the collector never reads half a file.
+    """
+    registry = snapshot()
+    lines = []
+    for name, value in sorted(registry['counters'].items()):
+        metric = f"{PROMETHEUS_PREFIX}{name}_total"
+        lines.append(f"# TYPE {metric} counter")
+        lines.append(f"{metric}{format_labels(labels)} {value}")
+    for name, (count, total, buckets) in sorted(registry['timers'].items()):
+        metric = f"{PROMETHEUS_PREFIX}{name}_seconds"
+        lines.append(f"# TYPE {metric} histogram")
+        cumulative = 0
+        for bound, hits in zip(TIMER_BUCKETS + ('+Inf',), buckets):
+            cumulative += hits
+            lines.append(f"{metric}_bucket{format_labels(labels, le=bound)} {cumulative}")
+        lines.append(f"{metric}_sum{format_labels(labels)} {total}")
+        lines.append(f"{metric}_count{format_labels(labels)} {count}")
+
+    temp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(temp_path, 'w', encoding='utf-8') as file:
+        file.write('\n'.join(lines) + '\n')
+    os.replace(temp_path, path)
+
+def flush(**labels):
+    """Write the registry to the configured sinks; failures are printed, never raised"""
+    try:
+        if JSONL_PATH:
+            write_jsonl(JSONL_PATH, **labels)
+        if PROMETHEUS_PATH:
+            write_prometheus(PROMETHEUS_PATH, **labels)
+    except Exception as e:
+        print(f"Error writing metrics: {e}")
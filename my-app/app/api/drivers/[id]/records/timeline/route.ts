@@ -0,0 +1,57 @@
+import { NextRequest, NextResponse } from "next/server";
+import { getSpeedTimelineByDriverId, TIMELINE_RESOLUTIONS } from "@/lib/db/queries/getSpeedTimelineByDriverId";
+
+// GET /api/drivers/[id]/records/timeline - Downsampled speed series of a driver for one day
+export async function GET(
+    request: NextRequest,
+    { params }: { params: Promise<{ id: string }> }
+) {
+    const { id: driverId } = await params;
+    const { searchParams } = new URL(request.url);
+
+    const date = searchParams.get("date");
+    const resolution = searchParams.get("resolution")
+        ? parseInt(searchParams.get("resolution") as string)
+        : 10;
+    const after = searchParams.get("after");
+    const limit = searchParams.get("limit")
+        ? parseInt(searchParams.get("limit") as string)
+        : 100;
+
+    if (!date) {
+        return NextResponse.json(
+            { error: "Date parameter is required" },
+            { status: 400 }
+        );
+    }
+
+    if (!TIMELINE_RESOLUTIONS.includes(resolution)) {
+        return NextResponse.json(
+            { error: `Resolution must be one of ${TIMELINE_RESOLUTIONS.join(", ")} seconds` },
+            { status: 400 }
+        );
+    }
+
+    try {
+        const points = await getSpeedTimelineByDriverId(driverId, date, resolution, after, limit);
+        return NextResponse.json({
+            data: points,
+            metadata: {
+                driverId,
+                date,
+                resolution,
+                after,
+                limit,
+                count: points.length,
+                // Pass as "after" to fetch the next page
+                next: points.length === limit ? points[points.length - 1].bucket_start : null
+            }
+        });
+    } catch (error) {
+        console.error("Error fetching speed timeline:", error);
+        return NextResponse.json(
+            { error: "Failed to fetch speed timeline" },
+            { status: 500 }
+        );
+    }
+}
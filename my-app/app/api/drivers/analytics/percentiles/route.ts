@@ -0,0 +1,28 @@
+import { NextRequest, NextResponse } from 'next/server';
+import { getSpeedPercentiles } from '@/lib/db/queries/getSpeedPercentiles';
+
+// GET /api/drivers/analytics/percentiles - p50/p95/p99 speed of all drivers, ranked by p95
+export async function GET(request: NextRequest) {
+    const { searchParams } = new URL(request.url);
+    const startDate = searchParams.get('startDate');
+    const endDate = searchParams.get('endDate');
+
+    try {
+        const percentiles = await getSpeedPercentiles(startDate, endDate);
+
+        return NextResponse.json({
+            data: percentiles,
+            metadata: {
+                startDate,
+                endDate,
+                count: percentiles.length
+            }
+        }, { status: 200 });
+    } catch (error) {
+        console.error('Error fetching speed percentiles:', error);
+        return NextResponse.json(
+            { error: 'Failed to fetch speed percentiles' },
+            { status: 500 }
+        );
+    }
+}
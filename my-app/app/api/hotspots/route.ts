@@ -0,0 +1,52 @@
+import { NextRequest, NextResponse } from "next/server";
+import { getHotspots } from "@/lib/db/queries/getHotspots";
+
+// GET /api/hotspots - Grid cells with the most warnings over a date range
+export async function GET(request: NextRequest) {
+    const { searchParams } = new URL(request.url);
+
+    const startDate = searchParams.get("startDate");
+    const endDate = searchParams.get("endDate") ?? startDate;
+    // south,west,north,east
+    const bbox = searchParams.get("bbox");
+    const limit = searchParams.get("limit")
+        ? parseInt(searchParams.get("limit") as string)
+        : 100;
+
+    if (!startDate || !endDate) {
+        return NextResponse.json(
+            { error: "startDate parameter is required" },
+            { status: 400 }
+        );
+    }
+
+    const bounds = bbox ? bbox.split(",").map(Number) : null;
+    if (bounds && (bounds.length !== 4 || bounds.some(isNaN))) {
+        return NextResponse.json(
+            { error: "bbox must be south,west,north,east" },
+            { status: 400 }
+        );
+    }
+
+    try {
+        const tiles = await getHotspots(
+            startDate, endDate, bounds as [number, number, number, number] | null, limit
+        );
+        return NextResponse.json({
+            data: tiles,
+            metadata: {
+                startDate,
+                endDate,
+                bbox: bounds,
+                limit,
+                count: tiles.length
+            }
+        });
+    } catch (error) {
+        console.error("Error fetching hotspots:", error);
+        return NextResponse.json(
+            { error: "Failed to fetch hotspots" },
+            { status: 500 }
+        );
+    }
+}
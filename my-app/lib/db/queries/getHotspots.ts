@@ -0,0 +1,49 @@
+import pool from "@/lib/db/connection";
+import { GridTile } from "@/lib/types";
+
+export async function getHotspots(
+    startDate: string,
+    endDate: string,
+    bounds: [number, number, number, number] | null = null,
+    limit: number = 100
+): Promise<GridTile[]> {
+    const client = await pool.connect();
+    try {
+        // Cells of driving_grid_tiles (spark_analysis.py --grid-tiles) summed over the
+        // days, busiest for warnings first. Daily speeds are weighted by the readings that
+        // have one. bounds is [south, west, north, east]
+        const query = `
+            SELECT
+                grid_cell,
+                latitude,
+                longitude,
+                SUM(readings) AS readings,
+                SUM(avg_speed * speed_readings) / NULLIF(SUM(speed_readings), 0) AS avg_speed,
+                MAX(max_speed) AS max_speed,
+                SUM(neutral_slide_incidents + overspeed_incidents + rapidly_speedup_incidents
+                    + rapidly_slowdown_incidents + fatigue_driving_incidents + oil_leak_incidents
+                    + throttle_stop_incidents) AS incidents,
+                SUM(overspeed_incidents) AS overspeed_incidents,
+                SUM(rapidly_speedup_incidents + rapidly_slowdown_incidents) AS rapid_speed_change_incidents
+            FROM
+                driving_grid_tiles
+            WHERE
+                record_date BETWEEN $1::date AND $2::date
+                AND ($3::float8 IS NULL OR latitude BETWEEN $3 AND $5)
+                AND ($4::float8 IS NULL OR longitude BETWEEN $4 AND $6)
+            GROUP BY
+                grid_cell, latitude, longitude
+            ORDER BY
+                incidents DESC, readings DESC
+            LIMIT $7
+        `;
+
+        const [south, west, north, east] = bounds ?? [null, null, null, null];
+        const result = await client.query(query, [
+            startDate.split('T')[0], endDate.split('T')[0], south, west, north, east, limit
+        ]);
+        return result.rows;
+    } finally {
+        client.release();
+    }
+}
@@ -35,7 +35,8 @@ export async function getRealtimeRecordsByDriverId(
                 public.driving_records
             WHERE 
                 driver_id = $1
-                AND record_time::date = $2::date
+                AND record_time >= $2::date
+                AND record_time < $2::date + 1
             ORDER BY 
                 record_time
             LIMIT $3 OFFSET $4
@@ -0,0 +1,54 @@
+import pool from "@/lib/db/connection";
+import { SpeedPercentiles } from "@/lib/types";
+
+export async function getSpeedPercentiles(
+    startDate: string | null = null,
+    endDate: string | null = null
+): Promise<SpeedPercentiles[]> {
+    const client = await pool.connect();
+    try {
+        // Merges the daily speed sketches of driver_daily_speed_sketches (spark_analysis.py
+        // --speed-percentiles) over the range, so any range costs one small histogram per
+        // driver-day. Percentiles are nearest-rank, as in SPEED_PERCENTILES_SQL
+        const query = `
+            WITH merged AS (
+                SELECT driver_id, speed, SUM(n) AS n
+                FROM driver_daily_speed_sketches, unnest(speeds, counts) AS bucket(speed, n)
+                WHERE record_date >= COALESCE($1::date, '-infinity')
+                    AND record_date <= COALESCE($2::date, 'infinity')
+                GROUP BY driver_id, speed
+            ),
+            cumulative AS (
+                SELECT driver_id, speed,
+                    SUM(n) OVER (PARTITION BY driver_id ORDER BY speed) AS running,
+                    SUM(n) OVER (PARTITION BY driver_id) AS readings
+                FROM merged
+            ),
+            percentiles AS (
+                SELECT driver_id, readings,
+                    MIN(speed) FILTER (WHERE running >= CEIL(0.50 * readings)) AS p50_speed,
+                    MIN(speed) FILTER (WHERE running >= CEIL(0.95 * readings)) AS p95_speed,
+                    MIN(speed) FILTER (WHERE running >= CEIL(0.99 * readings)) AS p99_speed
+                FROM cumulative
+                GROUP BY driver_id, readings
+            )
+            SELECT
+                driver_id,
+                readings,
+                p50_speed,
+                p95_speed,
+                p99_speed,
+                ROW_NUMBER() OVER (ORDER BY p95_speed DESC, driver_id) AS p95_speed_rank
+            FROM percentiles
+            ORDER BY p95_speed_rank
+        `;
+
+        const result = await client.query(query, [
+            startDate ? startDate.split('T')[0] : null,
+            endDate ? endDate.split('T')[0] : null
+        ]);
+        return result.rows;
+    } finally {
+        client.release();
+    }
+}
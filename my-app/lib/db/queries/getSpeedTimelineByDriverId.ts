@@ -0,0 +1,47 @@
+import pool from "@/lib/db/connection";
+import { SpeedTimelinePoint } from "@/lib/types";
+
+// Bucket widths (seconds) built by spark_analysis.py --timelines
+export const TIMELINE_RESOLUTIONS = [1, 10, 60];
+
+export async function getSpeedTimelineByDriverId(
+    driverId: string,
+    date: string,
+    resolution: number = 10,
+    after: string | null = null,
+    limit: number = 100
+): Promise<SpeedTimelinePoint[]> {
+    const client = await pool.connect();
+    try {
+        const datePart = date.split('T')[0];
+
+        // Pages continue after the last bucket_start seen, so every page is one index
+        // range scan no matter how far into the day it is
+        const query = `
+            SELECT
+                to_char(bucket_start, 'YYYY-MM-DD HH24:MI:SS') as bucket_start,
+                readings,
+                avg_speed,
+                max_speed,
+                latitude,
+                longitude,
+                direction,
+                warnings
+            FROM
+                driver_speed_timelines
+            WHERE
+                driver_id = $1
+                AND record_date = $2::date
+                AND resolution = $3
+                AND bucket_start > COALESCE($4::timestamp, '-infinity')
+            ORDER BY
+                bucket_start
+            LIMIT $5
+        `;
+
+        const result = await client.query(query, [driverId, datePart, resolution, after, limit]);
+        return result.rows;
+    } finally {
+        client.release();
+    }
+}
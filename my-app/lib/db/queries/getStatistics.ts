@@ -4,37 +4,87 @@ import { DriverStatistics } from "@/lib/types";
 export default async function getDriverStatistics(driverId: string): Promise<DriverStatistics | null> {
     const client = await pool.connect();
     try {
-        const checkRecordsQuery = `
-            SELECT COUNT(*) as record_count 
+        // Days come from the daily rollup written by spark_analysis.py when the readings it
+        // was rolled up from (safety_rollup_watermark) still match the day's count kept by
+        // the loaders (driving_record_days). Days never rolled up (skipped runs, --start-date),
+        // days that gained readings since, and undated readings are aggregated from
+        // driving_records; only the driver's readings of those days are read, through the
+        // (driver_id, record_time) index
+        const query = `
+        WITH stale AS (
+            SELECT days.record_date
+            FROM driving_record_days days
+            LEFT JOIN safety_rollup_watermark rolled_up ON rolled_up.record_date = days.record_date
+            WHERE rolled_up.record_count IS DISTINCT FROM days.readings
+        ),
+        raw AS (
+            SELECT r.speed, r.is_neutral_slide, r.neutral_slide_time, r.is_overspeed, r.overspeed_time,
+                r.is_rapidly_speedup, r.is_rapidly_slowdown, r.is_fatigue_driving, r.is_oil_leak, r.is_throttle_stop
+            FROM stale
+            JOIN driving_records r
+                ON r.driver_id = $1
+                AND r.record_time >= stale.record_date
+                AND r.record_time < stale.record_date + 1
+            UNION ALL
+            SELECT speed, is_neutral_slide, neutral_slide_time, is_overspeed, overspeed_time,
+                is_rapidly_speedup, is_rapidly_slowdown, is_fatigue_driving, is_oil_leak, is_throttle_stop
             FROM driving_records
+            WHERE driver_id = $1 AND record_time IS NULL
+        ),
+        daily AS (
+            SELECT
+                record_count,
+                neutral_slide_incidents,
+                neutral_slide_duration,
+                overspeed_incidents,
+                overspeed_duration,
+                rapidly_speedup_incidents,
+                rapidly_slowdown_incidents,
+                fatigue_driving_incidents,
+                oil_leak_incidents,
+                throttle_stop_incidents,
+                max_speed
+            FROM driver_daily_safety_stats
             WHERE driver_id = $1
+                AND record_date NOT IN (SELECT record_date FROM stale)
+            UNION ALL
+            SELECT
+                COUNT(*),
+                COUNT(CASE WHEN is_neutral_slide = 1 THEN 1 END),
+                SUM(neutral_slide_time),
+                COUNT(CASE WHEN is_overspeed = 1 THEN 1 END),
+                SUM(overspeed_time),
+                COUNT(CASE WHEN is_rapidly_speedup = 1 THEN 1 END),
+                COUNT(CASE WHEN is_rapidly_slowdown = 1 THEN 1 END),
+                COUNT(CASE WHEN is_fatigue_driving = 1 THEN 1 END),
+                COUNT(CASE WHEN is_oil_leak = 1 THEN 1 END),
+                COUNT(CASE WHEN is_throttle_stop = 1 THEN 1 END),
+                MAX(speed)
+            FROM raw
+        )
+        SELECT 
+            SUM(record_count) AS record_count,
+            SUM(neutral_slide_incidents) AS total_neutral_slide_incidents,
+            SUM(neutral_slide_duration) AS total_neutral_slide_duration,
+            SUM(overspeed_incidents) AS total_overspeed_incidents,
+            SUM(overspeed_duration) AS total_overspeed_duration,
+            SUM(rapidly_speedup_incidents) AS total_rapidly_speedup_incidents,
+            SUM(rapidly_slowdown_incidents) AS total_rapidly_slowdown_incidents,
+            SUM(fatigue_driving_incidents) AS total_fatigue_driving_incidents,
+            SUM(oil_leak_incidents) AS total_oil_leak_incidents,
+            SUM(throttle_stop_incidents) AS total_throttle_stop_incidents,
+            MAX(max_speed) AS max_speed
+        FROM daily
         `;
 
-        const recordCheck = await client.query(checkRecordsQuery, [driverId]);
+        const result = await client.query<DriverStatistics & { record_count: string }>(query, [driverId]);
 
-        if (recordCheck.rows[0].record_count === '0') {
+        const { record_count, ...statistics } = result.rows[0];
+        if (record_count === '0') {
             return null;
         }
 
-        const query = `
-        SELECT 
-            COUNT(CASE WHEN is_neutral_slide = 1 THEN 1 END) AS total_neutral_slide_incidents,
-            SUM(neutral_slide_time) AS total_neutral_slide_duration,
-            COUNT(CASE WHEN is_overspeed = 1 THEN 1 END) AS total_overspeed_incidents,
-            SUM(overspeed_time) AS total_overspeed_duration,
-            COUNT(CASE WHEN is_rapidly_speedup = 1 THEN 1 END) AS total_rapidly_speedup_incidents,
-            COUNT(CASE WHEN is_rapidly_slowdown = 1 THEN 1 END) AS total_rapidly_slowdown_incidents,
-            COUNT(CASE WHEN is_fatigue_driving = 1 THEN 1 END) AS total_fatigue_driving_incidents,
-            COUNT(CASE WHEN is_oil_leak = 1 THEN 1 END) AS total_oil_leak_incidents,
-            COUNT(CASE WHEN is_throttle_stop = 1 THEN 1 END) AS total_throttle_stop_incidents,
-            MAX(speed) AS max_speed
-        FROM driving_records
-        WHERE driver_id = $1
-        `;
-
-        const result = await client.query<DriverStatistics>(query, [driverId]);
-
-        return result.rows[0];
+        return statistics;
     } finally {
         client.release();
     }
@@ -54,6 +54,43 @@ export interface SpeedAnalytics {
 }
 
 
+// Speed percentiles (km/h) of one driver over a date range, merged from the daily sketches
+export interface SpeedPercentiles {
+    driver_id: string;
+    readings: string;
+    p50_speed: number;
+    p95_speed: number;
+    p99_speed: number;
+    p95_speed_rank: string;
+}
+
+// One bucket of driver_speed_timelines. warnings has bit (code - 1) set for each
+// driving_events type raised in the bucket (1 rapid speedup ... 9 oil leak, see load_data.py)
+export interface SpeedTimelinePoint {
+    bucket_start: string;
+    readings: number;
+    avg_speed: number;
+    max_speed: number;
+    latitude: number | null;
+    longitude: number | null;
+    direction: number | null;
+    warnings: number;
+}
+
+// One cell of driving_grid_tiles summed over a date range. Cells are 1/100 degree;
+// latitude and longitude are the cell centre
+export interface GridTile {
+    grid_cell: string;
+    latitude: number;
+    longitude: number;
+    readings: string;
+    avg_speed: number;
+    max_speed: number;
+    incidents: string;
+    overspeed_incidents: string;
+    rapid_speed_change_incidents: string;
+}
+
 export interface RealtimeMonitoringOptions {
     pollingInterval: number;
     batchSize: number;
@@ -1,23 +1,60 @@
+import argparse
+import builtins
+import json
 import os
+import re
+import urllib.request
+from contextlib import contextmanager
+from datetime import date, datetime, timedelta
 from pyspark.sql import SparkSession
-from pyspark.sql.functions import col, avg, max, row_number, desc
+from pyspark.sql.functions import (
+    col, avg, max, sum, count, row_number, desc, lit, when, to_timestamp, to_date, coalesce,
+    monotonically_increasing_id, spark_partition_id, shiftleft, broadcast, floor, struct, expr, explode, array,
+    countDistinct, collect_list, sort_array
+)
+from pyspark.sql.types import StructType, StructField, StringType
 from pyspark.sql.window import Window
 import psycopg2
 from psycopg2 import sql
-from tqdm import tqdm
 from dotenv import load_dotenv
 
+import db
+import metrics
+from load_data import EVENT_DURATIONS, EVENT_TYPES, GRID_CELLS_PER_DEGREE, GRID_COLUMNS, get_record_partitions
+
 # Load environment variables from .env file
 load_dotenv()
 
-# Database connection parameters from environment variables
-DB_PARAMS = {
-    'dbname': os.getenv('DB_NAME'),
-    'user': os.getenv('DB_USER'),
-    'password': os.getenv('DB_PASSWORD'),
-    'host': os.getenv('DB_HOST'),
-    'port': os.getenv('DB_PORT')
-}
+# Database connection parameters from environment variables (the dict shared through db.py)
+DB_PARAMS = db.DB_PARAMS
+
+# Location of the Parquet copy of driving_records, partitioned by record_date
+PARQUET_PATH = os.getenv('PARQUET_PATH', 'driving_records_parquet')
+
+# Raw detail_record_* layout: 8 required columns followed by the optional warning columns
+RAW_RECORD_SCHEMA = StructType([
+    StructField(name, StringType(), True) for name in [
+        'driver_id', 'car_plate_number', 'latitude', 'longitude', 'speed', 'direction', 'site_name',
+        'record_time', 'is_rapidly_speedup', 'is_rapidly_slowdown', 'is_neutral_slide',
+        'is_neutral_slide_finished', 'neutral_slide_time', 'is_overspeed', 'is_overspeed_finished',
+        'overspeed_time', 'is_fatigue_driving', 'is_throttle_stop', 'is_oil_leak'
+    ]
+])
+
+# Warning columns stored as 0/1 flags and as durations, matching load_data.parse_line()
+FLAG_COLUMNS = [
+    'is_rapidly_speedup', 'is_rapidly_slowdown', 'is_neutral_slide', 'is_neutral_slide_finished',
+    'is_overspeed', 'is_overspeed_finished', 'is_fatigue_driving', 'is_throttle_stop', 'is_oil_leak'
+]
+DURATION_COLUMNS = ['neutral_slide_time', 'overspeed_time']
+
+# Columns of driving_records kept in the Parquet dataset, in table order
+DRIVING_RECORD_COLUMNS = [
+    'driver_id', 'car_plate_number', 'latitude', 'longitude', 'speed', 'direction', 'site_name',
+    'record_time', 'is_rapidly_speedup', 'is_rapidly_slowdown', 'is_neutral_slide',
+    'is_neutral_slide_finished', 'neutral_slide_time', 'is_overspeed', 'is_overspeed_finished',
+    'overspeed_time', 'is_fatigue_driving', 'is_throttle_stop', 'is_oil_leak', 'record_date'
+]
 
 # Create the analysis table in PostgreSQL
 CREATE_ANALYSIS_TABLE_SQL = """
@@ -31,12 +68,237 @@ CREATE TABLE IF NOT EXISTS driver_speed_analysis (
 
 CREATE INDEX IF NOT EXISTS idx_driver_speed_analysis_avg_rank ON driver_speed_analysis(avg_speed_rank);
 CREATE INDEX IF NOT EXISTS idx_driver_speed_analysis_top_rank ON driver_speed_analysis(top_speed_rank);
+
+-- Executors write new results here before they are published in one transaction
+CREATE UNLOGGED TABLE IF NOT EXISTS driver_speed_analysis_staging (
+    driver_id VARCHAR(50),
+    avg_speed FLOAT,
+    avg_speed_rank INT,
+    top_speed INT,
+    top_speed_rank INT
+);
+
+-- Mergeable per-driver, per-day speed partials kept between incremental runs
+CREATE TABLE IF NOT EXISTS driver_daily_speed_stats (
+    driver_id VARCHAR(50) REFERENCES drivers(driver_id),
+    record_date DATE,
+    speed_sum BIGINT,
+    speed_count BIGINT,
+    top_speed INT,
+    PRIMARY KEY (driver_id, record_date)
+);
+
+CREATE UNLOGGED TABLE IF NOT EXISTS driver_daily_speed_stats_staging (
+    driver_id VARCHAR(50),
+    record_date DATE,
+    speed_sum BIGINT,
+    speed_count BIGINT,
+    top_speed INT
+);
+
+-- record_date values already folded into driver_daily_speed_stats, with the number of
+-- readings the day had when it was counted; a day whose count has changed is redone
+CREATE TABLE IF NOT EXISTS speed_analysis_watermark (
+    record_date DATE PRIMARY KEY,
+    processed_at TIMESTAMP NOT NULL DEFAULT now(),
+    record_count BIGINT
+);
+
+-- Watermarks from before record_count have none, so their days are redone once
+DO $$
+BEGIN
+    IF NOT EXISTS (SELECT 1 FROM pg_attribute
+                   WHERE attrelid = 'speed_analysis_watermark'::regclass AND attname = 'record_count') THEN
+        ALTER TABLE speed_analysis_watermark ADD COLUMN record_count BIGINT;
+    END IF;
+END $$;
+
+-- Per-driver, per-day warning counts, durations and top speed read by the dashboard
+CREATE TABLE IF NOT EXISTS driver_daily_safety_stats (
+    driver_id VARCHAR(50) REFERENCES drivers(driver_id),
+    record_date DATE,
+    record_count BIGINT,
+    neutral_slide_incidents BIGINT,
+    neutral_slide_duration BIGINT,
+    overspeed_incidents BIGINT,
+    overspeed_duration BIGINT,
+    rapidly_speedup_incidents BIGINT,
+    rapidly_slowdown_incidents BIGINT,
+    fatigue_driving_incidents BIGINT,
+    oil_leak_incidents BIGINT,
+    throttle_stop_incidents BIGINT,
+    max_speed INT,
+    PRIMARY KEY (driver_id, record_date)
+);
+
+CREATE INDEX IF NOT EXISTS idx_driver_daily_safety_stats_date ON driver_daily_safety_stats(record_date);
+
+-- Days in driver_daily_safety_stats with the number of readings they were rolled up from,
+-- written with the rows. A day whose driving_record_days count differs has changed since;
+-- a new watermark starts from the rollup rows already there
+DO $$
+BEGIN
+    IF to_regclass('safety_rollup_watermark') IS NULL THEN
+        CREATE TABLE safety_rollup_watermark (
+            record_date DATE PRIMARY KEY,
+            record_count BIGINT NOT NULL
+        );
+        INSERT INTO safety_rollup_watermark (record_date, record_count)
+        SELECT record_date, sum(record_count) FROM driver_daily_safety_stats GROUP BY record_date;
+    END IF;
+END $$;
+
+-- Per-cell, per-day speed and warning counts over the load_data grid, for regional and
+-- heatmap queries. latitude and longitude are the centre of the cell. avg_speed is over
+-- the speed_readings readings that have a speed, the weight for merging days
+CREATE TABLE IF NOT EXISTS driving_grid_tiles (
+    record_date DATE,
+    grid_cell BIGINT,
+    latitude FLOAT,
+    longitude FLOAT,
+    readings BIGINT,
+    speed_readings BIGINT,
+    drivers BIGINT,
+    avg_speed FLOAT,
+    max_speed INT,
+    neutral_slide_incidents BIGINT,
+    overspeed_incidents BIGINT,
+    rapidly_speedup_incidents BIGINT,
+    rapidly_slowdown_incidents BIGINT,
+    fatigue_driving_incidents BIGINT,
+    oil_leak_incidents BIGINT,
+    throttle_stop_incidents BIGINT,
+    PRIMARY KEY (record_date, grid_cell)
+);
+
+CREATE INDEX IF NOT EXISTS idx_driving_grid_tiles_cell ON driving_grid_tiles(grid_cell);
+
+CREATE UNLOGGED TABLE IF NOT EXISTS driving_grid_tiles_staging (
+    record_date DATE,
+    grid_cell BIGINT,
+    latitude FLOAT,
+    longitude FLOAT,
+    readings BIGINT,
+    speed_readings BIGINT,
+    drivers BIGINT,
+    avg_speed FLOAT,
+    max_speed INT,
+    neutral_slide_incidents BIGINT,
+    overspeed_incidents BIGINT,
+    rapidly_speedup_incidents BIGINT,
+    rapidly_slowdown_incidents BIGINT,
+    fatigue_driving_incidents BIGINT,
+    oil_leak_incidents BIGINT,
+    throttle_stop_incidents BIGINT
+);
+
+-- Tiles from before speed_readings have none; get_tiled_dates() leaves their days out,
+-- so incremental runs tile them again
+DO $$
+BEGIN
+    IF NOT EXISTS (SELECT 1 FROM pg_attribute
+                   WHERE attrelid = 'driving_grid_tiles'::regclass AND attname = 'speed_readings') THEN
+        ALTER TABLE driving_grid_tiles ADD COLUMN speed_readings BIGINT;
+        ALTER TABLE driving_grid_tiles_staging ADD COLUMN speed_readings BIGINT;
+    END IF;
+END $$;
+
+-- Per-driver, per-day speed histograms: counts[i] readings in the SPEED_SKETCH_BUCKET_WIDTH
+-- km/h bucket starting at speeds[i], ascending. Histograms of any days merge by summing
+-- the counts of equal speeds
+CREATE TABLE IF NOT EXISTS driver_daily_speed_sketches (
+    driver_id VARCHAR(50) REFERENCES drivers(driver_id),
+    record_date DATE,
+    readings BIGINT,
+    speeds INT[],
+    counts BIGINT[],
+    PRIMARY KEY (driver_id, record_date)
+);
+
+CREATE INDEX IF NOT EXISTS idx_driver_daily_speed_sketches_date ON driver_daily_speed_sketches(record_date);
+
+CREATE UNLOGGED TABLE IF NOT EXISTS driver_daily_speed_sketches_staging (
+    driver_id VARCHAR(50),
+    record_date DATE,
+    readings BIGINT,
+    speeds INT[],
+    counts BIGINT[]
+);
+
+-- Drivers ranked by 95th percentile speed, merged from driver_daily_speed_sketches
+CREATE TABLE IF NOT EXISTS driver_speed_percentile_analysis (
+    driver_id VARCHAR(50) PRIMARY KEY REFERENCES drivers(driver_id),
+    readings BIGINT,
+    p50_speed INT,
+    p95_speed INT,
+    p99_speed INT,
+    p95_speed_rank INT
+);
+
+CREATE INDEX IF NOT EXISTS idx_driver_speed_percentile_analysis_rank ON driver_speed_percentile_analysis(p95_speed_rank);
+
+-- Drivers ranked by warnings raised, from the driving_events written by the loader
+CREATE TABLE IF NOT EXISTS driver_incident_analysis (
+    driver_id VARCHAR(50) PRIMARY KEY REFERENCES drivers(driver_id),
+    incidents BIGINT,
+    incident_rank INT
+);
+
+-- Downsampled per-driver, per-day speed and position series, one row per bucket of each
+-- resolution (seconds). warnings has bit (code - 1) set for each load_data.EVENT_TYPES
+-- event raised by a reading in the bucket
+CREATE TABLE IF NOT EXISTS driver_speed_timelines (
+    driver_id VARCHAR(50) REFERENCES drivers(driver_id),
+    record_date DATE,
+    resolution INT,
+    bucket_start TIMESTAMP,
+    readings INT,
+    avg_speed FLOAT,
+    max_speed INT,
+    latitude FLOAT,
+    longitude FLOAT,
+    direction INT,
+    warnings INT,
+    PRIMARY KEY (driver_id, record_date, resolution, bucket_start)
+);
+
+CREATE INDEX IF NOT EXISTS idx_driver_speed_timelines_date ON driver_speed_timelines(record_date);
+
+CREATE UNLOGGED TABLE IF NOT EXISTS driver_speed_timelines_staging (
+    driver_id VARCHAR(50),
+    record_date DATE,
+    resolution INT,
+    bucket_start TIMESTAMP,
+    readings INT,
+    avg_speed FLOAT,
+    max_speed INT,
+    latitude FLOAT,
+    longitude FLOAT,
+    direction INT,
+    warnings INT
+);
+
+CREATE UNLOGGED TABLE IF NOT EXISTS driver_daily_safety_stats_staging (
+    driver_id VARCHAR(50),
+    record_date DATE,
+    record_count BIGINT,
+    neutral_slide_incidents BIGINT,
+    neutral_slide_duration BIGINT,
+    overspeed_incidents BIGINT,
+    overspeed_duration BIGINT,
+    rapidly_speedup_incidents BIGINT,
+    rapidly_slowdown_incidents BIGINT,
+    fatigue_driving_incidents BIGINT,
+    oil_leak_incidents BIGINT,
+    throttle_stop_incidents BIGINT,
+    max_speed INT
+);
 """
 
 def create_analysis_table():
     """Create the analysis table in PostgreSQL if it doesn't exist"""
     try:
-        conn = psycopg2.connect(**DB_PARAMS)
+        conn = db.connect()
         with conn.cursor() as cursor:
             cursor.execute(CREATE_ANALYSIS_TABLE_SQL)
         conn.commit()
@@ -47,35 +309,57 @@ def create_analysis_table():
         print(f"Error creating analysis table: {e}")
         return False
 
-def analyze_driver_speeds(df):
-    """Analyze driver speeds and return a DataFrame with rankings"""
-    # Calculate average speed by driver
-    avg_speeds = df.groupBy("driver_id").agg(avg("speed").alias("avg_speed"))
-    
-    # Calculate top speed by driver
-    top_speeds = df.groupBy("driver_id").agg(max("speed").alias("top_speed"))
+def add_global_rank(df, order_columns, rank_column):
+    """
+    Add a 1-based global rank following order_columns without a single-partition window
     
-    # Join the two DataFrames
-    combined_df = avg_speeds.join(top_speeds, "driver_id")
+    The sort range-partitions the rows, so partition i holds the i-th slice of the order.
+    Each partition's row count gives its starting offset, and a row's rank is that offset
+    plus its position inside the partition (the low bits of monotonically_increasing_id).
+    Only one small row per partition comes back to the driver.
+    """
+    # Checkpoint the sorted rows so counts and ranks are computed from the same partitions
+    positioned = df.orderBy(*order_columns) \
+        .withColumn("_partition", spark_partition_id()) \
+        .withColumn("_position", monotonically_increasing_id() - shiftleft(spark_partition_id().cast("long"), 33)) \
+        .localCheckpoint()
     
-    # Create window specifications for ranking WITH PARTITIONING
-    # By adding partitionBy("driver_id"), we avoid the "No Partition Defined" warning
-    # However, since we want global rankings, we'll keep it as is but suppress the warnings
-    window_avg = Window.orderBy(desc("avg_speed"))
-    window_top = Window.orderBy(desc("top_speed"))
+    counts = dict(positioned.groupBy("_partition").count().collect())
+    offsets = []
+    running = 0
+    for partition in sorted(counts):
+        offsets.append((partition, running))
+        running += counts[partition]
+    if not offsets:
+        return positioned.withColumn(rank_column, lit(None).cast("int")).drop("_partition", "_position")
     
-    # Add rankings
-    result_df = combined_df \
-        .withColumn("avg_speed_rank", row_number().over(window_avg)) \
-        .withColumn("top_speed_rank", row_number().over(window_top))
+    offsets_df = df.sparkSession.createDataFrame(offsets, "_partition INT, _offset LONG")
+    return positioned \
+        .join(broadcast(offsets_df), "_partition") \
+        .withColumn(rank_column, (col("_offset") + col("_position") + 1).cast("int")) \
+        .drop("_partition", "_position", "_offset")
+
+def analyze_driver_speeds(df):
+    """Analyze driver speeds and return a DataFrame with rankings"""
+    # Average and top speed per driver in a single aggregation
+    combined_df = df.groupBy("driver_id").agg(
+        avg("speed").alias("avg_speed"),
+        max("speed").alias("top_speed")
+    )
     
-    return result_df
+    return rank_driver_speeds(combined_df)
+
+# PostgreSQL JDBC driver used by the Spark session
+JDBC_JAR_PATH = os.getenv('JDBC_JAR_PATH', 'postgresql-42.5.1.jar')
 
-def initialize_spark():
-    """Initialize and return a Spark session"""
+def initialize_spark(offline=False):
+    """Initialize and return a Spark session; with offline set the JDBC JAR must already exist"""
     # Download PostgreSQL JDBC driver if it doesn't exist
-    jdbc_jar_path = "postgresql-42.5.1.jar"
+    jdbc_jar_path = JDBC_JAR_PATH
     if not os.path.exists(jdbc_jar_path):
+        if offline:
+            raise FileNotFoundError(f"JDBC driver not found at {os.path.abspath(jdbc_jar_path)}; "
+                                    "place the JAR there or set JDBC_JAR_PATH")
         import urllib.request
         print(f"Downloading PostgreSQL JDBC driver to {jdbc_jar_path}...")
         url = "https://jdbc.postgresql.org/download/postgresql-42.5.1.jar"
@@ -107,60 +391,1005 @@ def initialize_spark():
     
     return spark
 
-def load_data_from_postgres(spark):
-    """Load driving records data from PostgreSQL into a Spark DataFrame"""
-    jdbc_url = f"jdbc:postgresql://{DB_PARAMS['host']}:{DB_PARAMS['port']}/{DB_PARAMS['dbname']}"
+# Default number of rows the JDBC driver fetches per round trip
+JDBC_FETCH_SIZE = 10000
+
+def get_jdbc_url():
+    """Return the JDBC URL of the PostgreSQL database in DB_PARAMS"""
+    return f"jdbc:postgresql://{DB_PARAMS['host']}:{DB_PARAMS['port']}/{DB_PARAMS['dbname']}"
+
+def record_time_ranges(dates):
+    """SQL condition selecting the readings of the given record_date values, one record_time range per run of consecutive days"""
+    ranges = []
+    for day in sorted(date.fromisoformat(str(day)) for day in dates):
+        if ranges and ranges[-1][1] == day:
+            ranges[-1][1] = day + timedelta(days=1)
+        else:
+            ranges.append([day, day + timedelta(days=1)])
+    return " OR ".join(f"(record_time >= TIMESTAMP '{first.isoformat()}' AND record_time < TIMESTAMP '{end.isoformat()}')"
+                       for first, end in ranges) or "FALSE"
+
+def build_records_query(start_date=None, end_date=None, columns=None, dates=None):
+    """Return the SELECT pushed down to PostgreSQL for a date range (or list of dates) and column list"""
+    columns = list(columns) if columns else list(DRIVING_RECORD_COLUMNS)
+    unknown = [name for name in columns if name not in DRIVING_RECORD_COLUMNS and name != "id"]
+    if unknown:
+        raise ValueError(f"Unknown driving_records columns: {unknown}")
+    # id splits reads of the plain table, so it is always selected
+    if "id" not in columns:
+        columns = ["id"] + columns
+    
+    # Dates become record_time ranges (record_date is generated from record_time), which
+    # prune the daily partitions of the partitioned layout
+    conditions = []
+    if start_date:
+        conditions.append(f"record_time >= TIMESTAMP '{date.fromisoformat(str(start_date)).isoformat()}'")
+    if end_date:
+        end = date.fromisoformat(str(end_date)) + timedelta(days=1)
+        conditions.append(f"record_time < TIMESTAMP '{end.isoformat()}'")
+    if dates is not None:
+        conditions.append(f"({record_time_ranges(dates)})")
+    where = f" WHERE {' AND '.join(conditions)}" if conditions else ""
+    return f"SELECT {', '.join(columns)} FROM driving_records{where}"
+
+def get_id_bounds(query):
+    """Return (min id, max id) of the rows selected by query, or None if it selects nothing"""
+    conn = db.connect()
+    try:
+        with conn.cursor() as cursor:
+            cursor.execute(f"SELECT min(id), max(id) FROM ({query}) AS selected")
+            lower, upper = cursor.fetchone()
+        return None if lower is None else (lower, upper)
+    finally:
+        conn.close()
+
+def get_record_time_predicates(start_date=None, end_date=None, num_partitions=1, dates=None):
+    """
+    Split a read of the partitioned layout into at most num_partitions record_time ranges
+
+    Each range covers whole days of the daily partitions, so every JDBC query prunes to
+    its own partitions; with dates, only those days' partitions are covered. Undated
+    readings get a query of their own when no dates are given. Returns the WHERE clauses,
+    or None for the plain table (split on id instead) or when there is nothing to split.
+    """
+    conn = db.connect()
+    try:
+        partitions = get_record_partitions(conn)
+    finally:
+        conn.close()
+    if not partitions:
+        return None
+    first = date.fromisoformat(str(start_date)) if start_date else date.min
+    last = date.fromisoformat(str(end_date)) if end_date else date.max
+    wanted = None if dates is None else {date.fromisoformat(str(day)) for day in dates}
+    days = sorted(day for day in partitions.values()
+                  if day and first <= day <= last and (wanted is None or day in wanted))
+    predicates = ["record_time IS NULL"] if not start_date and not end_date and dates is None else []
+    per_query = -(-len(days) // builtins.max(1, num_partitions)) if days else 1
+    for position in range(0, len(days), per_query):
+        predicates.append(record_time_ranges(days[position:position + per_query]))
+    return predicates or None
+
+def load_data_from_postgres(spark, start_date=None, end_date=None, columns=None,
+                            num_partitions=None, fetch_size=JDBC_FETCH_SIZE, dates=None):
+    """
+    Load driving records data from PostgreSQL into a Spark DataFrame
+    
+    The date range and column list are pushed down into the SQL, and the read is split
+    into num_partitions parallel JDBC queries: over record_time ranges of whole daily
+    partitions for the partitioned layout (which has no index on id), otherwise over
+    id ranges discovered from the data.
     
-    # Load driving records
-    driving_records_df = spark.read \
+    Args:
+        spark: Active SparkSession
+        start_date: First record_date to read, inclusive ('YYYY-MM-DD', None for no lower bound)
+        end_date: Last record_date to read, inclusive ('YYYY-MM-DD', None for no upper bound)
+        columns: Columns to read (None for all)
+        num_partitions: Number of parallel JDBC reads (defaults to Spark's default parallelism)
+        fetch_size: Rows fetched per round trip by each JDBC reader
+        dates: record_date values to read (None for every date in the range)
+    """
+    num_partitions = num_partitions or spark.sparkContext.defaultParallelism
+    predicates = get_record_time_predicates(start_date, end_date, num_partitions, dates)
+    # The predicates are applied to the query's output, so it must carry record_time
+    selected = columns
+    if predicates and columns and "record_time" not in columns:
+        selected = list(columns) + ["record_time"]
+    query = build_records_query(start_date, end_date, selected, dates)
+    
+    reader = spark.read \
         .format("jdbc") \
-        .option("url", jdbc_url) \
-        .option("dbtable", "driving_records") \
+        .option("url", get_jdbc_url()) \
+        .option("dbtable", f"({query}) AS driving_records_subset") \
         .option("user", DB_PARAMS['user']) \
         .option("password", DB_PARAMS['password']) \
         .option("driver", "org.postgresql.Driver") \
-        .load()
+        .option("fetchsize", fetch_size)
     
+    bounds = None if predicates else get_id_bounds(query)
+    if bounds:
+        lower, upper = bounds
+        # Don't split tiny id ranges into more queries than there are ids
+        num_partitions = builtins.max(1, builtins.min(num_partitions, upper - lower + 1))
+        reader = reader \
+            .option("partitionColumn", "id") \
+            .option("lowerBound", lower) \
+            .option("upperBound", upper + 1) \
+            .option("numPartitions", num_partitions)
+    
+    if predicates:
+        driving_records_df = reader.jdbc(get_jdbc_url(), f"({query}) AS driving_records_subset",
+                                         predicates=predicates)
+    else:
+        driving_records_df = reader.load()
+    if columns:
+        driving_records_df = driving_records_df.select(*columns)
     return driving_records_df
 
-def save_to_postgres(df):
-    """Save the analysis results to PostgreSQL"""
-    # Convert to Pandas DataFrame for easier insertion
-    pandas_df = df.toPandas()
+def read_raw_records(spark, records_path):
+    """Read raw detail_record_* files into a DataFrame typed like driving_records"""
+    raw_df = spark.read \
+        .option("encoding", "UTF-8") \
+        .option("quote", "\u0000") \
+        .option("mode", "PERMISSIVE") \
+        .schema(RAW_RECORD_SCHEMA) \
+        .csv(records_path)
+    
+    typed_df = raw_df.select(
+        col("driver_id"),
+        col("car_plate_number"),
+        col("latitude").cast("double"),
+        col("longitude").cast("double"),
+        col("speed").cast("int"),
+        col("direction").cast("int"),
+        coalesce(col("site_name"), lit("")).alias("site_name"),
+        to_timestamp(col("record_time"), "yyyy-MM-dd HH:mm:ss").alias("record_time"),
+        *[when(col(name) == "1", 1).otherwise(0).alias(name) for name in FLAG_COLUMNS],
+        *[when(col(name).rlike("^[0-9]+$"), col(name).cast("int")).otherwise(0).alias(name)
+          for name in DURATION_COLUMNS],
+        monotonically_increasing_id().alias("line_order")
+    ).filter(col("driver_id").isNotNull() & col("record_time").isNotNull())
+    
+    # Keep the first reading per (driver_id, record_time), like the loader's unique key
+    first_reading = Window.partitionBy("driver_id", "record_time").orderBy("line_order")
+    return typed_df \
+        .withColumn("reading_number", row_number().over(first_reading)) \
+        .filter(col("reading_number") == 1) \
+        .withColumn("record_date", to_date(col("record_time"))) \
+        .select(*DRIVING_RECORD_COLUMNS)
+
+def write_parquet(df, output_path=PARQUET_PATH, compression="snappy"):
+    """Write driving records as Parquet partitioned by record_date, replacing only the dates present in df"""
+    df.select(*DRIVING_RECORD_COLUMNS) \
+        .repartition("record_date") \
+        .write \
+        .mode("overwrite") \
+        .option("partitionOverwriteMode", "dynamic") \
+        .option("compression", compression) \
+        .partitionBy("record_date") \
+        .parquet(output_path)
+
+def convert_records_to_parquet(spark, records_path, output_path=PARQUET_PATH, compression="snappy"):
+    """Convert raw detail_record_* files to the partitioned Parquet dataset"""
+    write_parquet(read_raw_records(spark, records_path), output_path, compression)
+
+def export_postgres_to_parquet(spark, output_path=PARQUET_PATH, compression="snappy"):
+    """Copy the driving_records table to the partitioned Parquet dataset"""
+    write_parquet(load_data_from_postgres(spark), output_path, compression)
+
+def load_data_from_parquet(spark, parquet_path=PARQUET_PATH, start_date=None, end_date=None, columns=None,
+                           dates=None):
+    """
+    Load driving records from the Parquet dataset
     
+    Args:
+        spark: Active SparkSession
+        parquet_path: Root of the record_date-partitioned dataset
+        start_date: First record_date to read, inclusive ('YYYY-MM-DD', None for no lower bound)
+        end_date: Last record_date to read, inclusive ('YYYY-MM-DD', None for no upper bound)
+        columns: Columns to read (None for all); only these are decoded from the files
+        dates: record_date values to read (None for every date in the range)
+    """
+    df = spark.read.parquet(parquet_path)
+    # Filters on the partition column prune whole record_date directories
+    if start_date:
+        df = df.filter(col("record_date") >= lit(start_date).cast("date"))
+    if end_date:
+        df = df.filter(col("record_date") <= lit(end_date).cast("date"))
+    if dates is not None:
+        df = df.filter(col("record_date").isin([date.fromisoformat(str(day)) for day in dates]))
+    if columns:
+        df = df.select(*columns)
+    return df
+
+# Rows per JDBC batch when executors write analysis results
+JDBC_WRITE_BATCH_SIZE = 10000
+
+ANALYSIS_COLUMNS = ["driver_id", "avg_speed", "avg_speed_rank", "top_speed", "top_speed_rank"]
+
+@contextmanager
+def staging_lock(conn, staging_table):
+    """
+    Hold a session advisory lock on staging_table on conn from filling it to publishing it
+
+    The staging tables are shared by every run, so two runs writing the same one at
+    once would truncate or publish each other's rows; the later run waits here instead.
+    """
+    with conn.cursor() as cursor:
+        # A run may wait for another's whole write
+        cursor.execute("SET LOCAL statement_timeout = 0")
+        cursor.execute("SELECT pg_advisory_lock(hashtext(%s))", (staging_table,))
+    conn.commit()
     try:
-        conn = psycopg2.connect(**DB_PARAMS)
-        
-        # Clear existing data
-        with conn.cursor() as cursor:
-            cursor.execute("TRUNCATE TABLE driver_speed_analysis")
-        
-        # Insert new data
-        insert_sql = """
-        INSERT INTO driver_speed_analysis (driver_id, avg_speed, avg_speed_rank, top_speed, top_speed_rank)
-        VALUES (%s, %s, %s, %s, %s)
-        """
-        
-        # Add progress bar for database insertion
-        with conn.cursor() as cursor:
-            for _, row in tqdm(pandas_df.iterrows(), total=len(pandas_df), desc="Saving to database", unit="record"):
-                cursor.execute(insert_sql, (
-                    row['driver_id'],
-                    float(row['avg_speed']),
-                    int(row['avg_speed_rank']),
-                    int(row['top_speed']),
-                    int(row['top_speed_rank'])
-                ))
-        
-        conn.commit()
-        print(f"Successfully saved {len(pandas_df)} records to driver_speed_analysis table")
+        yield
+    finally:
+        # A lost connection has already dropped the lock
+        try:
+            conn.rollback()
+            with conn.cursor() as cursor:
+                cursor.execute("SELECT pg_advisory_unlock(hashtext(%s))", (staging_table,))
+            conn.commit()
+        except psycopg2.Error:
+            pass
+
+def write_to_staging(conn, df, staging_table, columns):
+    """Empty staging_table, then fill it from the executors with batched JDBC inserts"""
+    with conn.cursor() as cursor:
+        cursor.execute(sql.SQL("TRUNCATE TABLE {}").format(sql.Identifier(staging_table)))
+    conn.commit()
+    
+    df.select(*columns).write \
+        .format("jdbc") \
+        .option("url", get_jdbc_url() + "?reWriteBatchedInserts=true") \
+        .option("dbtable", staging_table) \
+        .option("user", DB_PARAMS['user']) \
+        .option("password", DB_PARAMS['password']) \
+        .option("driver", "org.postgresql.Driver") \
+        .option("batchsize", JDBC_WRITE_BATCH_SIZE) \
+        .mode("append") \
+        .save()
+
+def publish_staging(conn, table, columns):
+    """Replace table's contents with its _staging table's in one transaction; returns the row count"""
+    staging_table = f"{table}_staging"
+    column_list = ", ".join(columns)
+    with conn.cursor() as cursor:
+        cursor.execute(sql.SQL("DELETE FROM {}").format(sql.Identifier(table)))
+        cursor.execute(sql.SQL("INSERT INTO {} ({}) SELECT {} FROM {}").format(
+            sql.Identifier(table), sql.SQL(column_list), sql.SQL(column_list), sql.Identifier(staging_table)
+        ))
+        saved = cursor.rowcount
+        cursor.execute(sql.SQL("TRUNCATE TABLE {}").format(sql.Identifier(staging_table)))
+    conn.commit()
+    metrics.increment(f"{table}_rows_saved", saved)
+    return saved
+
+def save_to_postgres(df, table="driver_speed_analysis", columns=ANALYSIS_COLUMNS):
+    """
+    Save the analysis results to PostgreSQL
+    
+    Executors write the rows straight into the unlogged {table}_staging table with
+    batched JDBC inserts; nothing is collected on the driver. The new results then
+    replace the live table's contents in a single transaction, so readers keep seeing
+    the previous results until the commit and never see an empty or partial table.
+    """
+    try:
+        conn = db.connect()
+        with staging_lock(conn, f"{table}_staging"):
+            write_to_staging(conn, df, f"{table}_staging", columns)
+            
+            # Publish: swap the contents in one transaction
+            saved = publish_staging(conn, table, columns)
+        print(f"Successfully saved {saved} records to {table} table")
         conn.close()
         return True
     except Exception as e:
         print(f"Error saving to PostgreSQL: {e}")
         return False
 
-def main():
+DAILY_SPEED_COLUMNS = ["driver_id", "record_date", "speed_sum", "speed_count", "top_speed"]
+
+def get_available_dates(spark, source="postgres", parquet_path=PARQUET_PATH):
+    """Return the sorted record_date values present in the source"""
+    if source == "parquet":
+        # Partition directories name the dates, so only the file listing is needed
+        files = spark.read.parquet(parquet_path).inputFiles()
+        found = {re.search(r"record_date=(\d{4}-\d{2}-\d{2})", path) for path in files}
+        return sorted(date.fromisoformat(match.group(1)) for match in found if match)
+    
+    conn = db.connect()
+    try:
+        partitions = get_record_partitions(conn)
+        with conn.cursor() as cursor:
+            if partitions:
+                # Daily partitions name the dates; probe each for at least one row
+                dated = sorted((day, name) for name, day in partitions.items() if day)
+                if not dated:
+                    return []
+                cursor.execute(sql.SQL(" UNION ALL ").join(
+                    sql.SQL("SELECT {} WHERE EXISTS (SELECT 1 FROM {})").format(sql.Literal(day), sql.Identifier(name))
+                    for day, name in dated
+                ))
+                return [row[0] for row in cursor.fetchall()]
+            
+            # Loose index scan: one record_date index probe per distinct date
+            cursor.execute("""
+            WITH RECURSIVE dates AS (
+                SELECT min(record_date) AS record_date FROM driving_records
+                UNION ALL
+                SELECT (SELECT min(record_date) FROM driving_records WHERE record_date > dates.record_date)
+                FROM dates WHERE dates.record_date IS NOT NULL
+            )
+            SELECT record_date FROM dates WHERE record_date IS NOT NULL
+            """)
+            return [row[0] for row in cursor.fetchall()]
+    finally:
+        conn.close()
+
+# Session settings switched for the footer-only count of get_date_record_counts()
+PARQUET_FOOTER_COUNT_CONF = ["spark.sql.parquet.aggregatePushdown", "spark.sql.sources.useV1SourceList"]
+
+def get_date_record_counts(spark, source="postgres", parquet_path=PARQUET_PATH):
+    """
+    Return {record_date: number of readings} of the source
+
+    Readings are only ever added to a day, so a changed count means rows arrived after
+    the day was last aggregated. Count first, read after: rows that land in between
+    only make the next run redo the day. Neither source is scanned: PostgreSQL counts
+    come from driving_record_days, kept by the loaders, and Parquet counts from the
+    file footers.
+    """
+    if source == "parquet":
+        # With aggregate pushdown, the DataSource V2 Parquet reader answers a count grouped
+        # by the partition column from the footers without decoding any rows
+        saved = {key: spark.conf.get(key) for key in PARQUET_FOOTER_COUNT_CONF}
+        spark.conf.set("spark.sql.parquet.aggregatePushdown", "true")
+        spark.conf.set("spark.sql.sources.useV1SourceList", ",".join(
+            name for name in saved["spark.sql.sources.useV1SourceList"].split(",") if name.strip() != "parquet"
+        ))
+        try:
+            counts = spark.read.parquet(parquet_path).groupBy("record_date").count().collect()
+        finally:
+            for key, value in saved.items():
+                spark.conf.set(key, value)
+        return {row["record_date"]: row["count"] for row in counts if row["record_date"] is not None}
+    
+    conn = db.connect()
+    try:
+        with conn.cursor() as cursor:
+            cursor.execute("SELECT record_date, readings FROM driving_record_days")
+            return dict(cursor.fetchall())
+    finally:
+        conn.close()
+
+def get_processed_dates():
+    """Return {record_date: readings counted} of the days already in driver_daily_speed_stats"""
+    conn = db.connect()
+    try:
+        with conn.cursor() as cursor:
+            cursor.execute("SELECT record_date, record_count FROM speed_analysis_watermark")
+            return dict(cursor.fetchall())
+    finally:
+        conn.close()
+
+def compute_daily_speed_stats(df):
+    """Per-driver, per-day partial aggregates that merge by summing sums and counts and taking the max"""
+    return df.groupBy("driver_id", "record_date").agg(
+        sum("speed").cast("long").alias("speed_sum"),
+        count("speed").alias("speed_count"),
+        max("speed").alias("top_speed")
+    )
+
+def merge_daily_speed_stats(daily_df, dates):
+    """
+    Store the partials of the given {record_date: readings counted} and mark those dates as processed
+    
+    A date that is processed again replaces its earlier partials, so re-running a day
+    never double counts it. Partials and watermark are committed together.
+    """
+    conn = db.connect()
+    try:
+        with staging_lock(conn, "driver_daily_speed_stats_staging"):
+            write_to_staging(conn, daily_df, "driver_daily_speed_stats_staging", DAILY_SPEED_COLUMNS)
+            with conn.cursor() as cursor:
+                cursor.execute("DELETE FROM driver_daily_speed_stats WHERE record_date = ANY(%s)", (list(dates),))
+                cursor.execute("""
+                INSERT INTO driver_daily_speed_stats (driver_id, record_date, speed_sum, speed_count, top_speed)
+                SELECT driver_id, record_date, speed_sum, speed_count, top_speed
+                FROM driver_daily_speed_stats_staging
+                """)
+                cursor.execute("""
+                INSERT INTO speed_analysis_watermark (record_date, record_count)
+                SELECT * FROM unnest(%s::date[], %s::bigint[])
+                ON CONFLICT (record_date) DO UPDATE SET record_count = EXCLUDED.record_count, processed_at = now()
+                """, (list(dates), list(dates.values())))
+                cursor.execute("TRUNCATE TABLE driver_daily_speed_stats_staging")
+            conn.commit()
+    finally:
+        conn.close()
+
+def load_total_speed_stats(spark):
+    """Merge all stored daily partials into per-driver avg_speed and top_speed"""
+    # The merge runs inside PostgreSQL; Spark receives one row per driver
+    query = """
+    SELECT driver_id,
+           sum(speed_sum)::float8 / NULLIF(sum(speed_count), 0) AS avg_speed,
+           max(top_speed) AS top_speed
+    FROM driver_daily_speed_stats
+    GROUP BY driver_id
+    """
+    return spark.read \
+        .format("jdbc") \
+        .option("url", get_jdbc_url()) \
+        .option("dbtable", f"({query}) AS driver_totals") \
+        .option("user", DB_PARAMS['user']) \
+        .option("password", DB_PARAMS['password']) \
+        .option("driver", "org.postgresql.Driver") \
+        .option("fetchsize", JDBC_FETCH_SIZE) \
+        .load()
+
+def rank_driver_speeds(totals_df):
+    """Add the global avg/top speed ranks to per-driver totals"""
+    # Ties are broken by driver_id so reruns rank identically
+    ranked_df = add_global_rank(totals_df, [desc("avg_speed"), col("driver_id")], "avg_speed_rank")
+    ranked_df = add_global_rank(ranked_df, [desc("top_speed"), col("driver_id")], "top_speed_rank")
+    return ranked_df.select(*ANALYSIS_COLUMNS)
+
+def run_incremental_analysis(spark, source="postgres", parquet_path=PARQUET_PATH,
+                             num_partitions=None, fetch_size=JDBC_FETCH_SIZE):
+    """
+    Fold record_date values not processed yet into the daily partials and re-rank all drivers
+    
+    Only the new days, and processed days that have gained readings since, are read from
+    the source; the full history is represented by driver_daily_speed_stats. Returns the
+    ranked analysis DataFrame.
+    """
+    processed = get_processed_dates()
+    counts = get_date_record_counts(spark, source, parquet_path)
+    new_dates = sorted(day for day, readings in counts.items() if processed.get(day) != readings)
+    
+    if new_dates:
+        print(f"Aggregating {len(new_dates)} new or changed day(s): {new_dates[0]} to {new_dates[-1]}")
+        columns = ["driver_id", "speed", "record_date"]
+        # Only the changed days are read, however far apart they are
+        if source == "parquet":
+            records_df = load_data_from_parquet(spark, parquet_path, columns=columns, dates=new_dates)
+        else:
+            records_df = load_data_from_postgres(spark, columns=columns, dates=new_dates,
+                                                 num_partitions=num_partitions, fetch_size=fetch_size)
+        merge_daily_speed_stats(compute_daily_speed_stats(records_df), {day: counts[day] for day in new_dates})
+    else:
+        print("No new days to aggregate")
+    
+    return rank_driver_speeds(load_total_speed_stats(spark))
+
+# Rollup column -> flag it counts, in the order of the dashboard's statistics query
+SAFETY_INCIDENT_COLUMNS = {
+    "neutral_slide_incidents": "is_neutral_slide",
+    "overspeed_incidents": "is_overspeed",
+    "rapidly_speedup_incidents": "is_rapidly_speedup",
+    "rapidly_slowdown_incidents": "is_rapidly_slowdown",
+    "fatigue_driving_incidents": "is_fatigue_driving",
+    "oil_leak_incidents": "is_oil_leak",
+    "throttle_stop_incidents": "is_throttle_stop"
+}
+
+# driving_events types counted as incidents, the same warnings as the rollup's
+INCIDENT_EVENT_TYPES = [EVENT_TYPES[flag] for flag in SAFETY_INCIDENT_COLUMNS.values()]
+
+DAILY_SAFETY_COLUMNS = [
+    "driver_id", "record_date", "record_count", "neutral_slide_incidents", "neutral_slide_duration",
+    "overspeed_incidents", "overspeed_duration", "rapidly_speedup_incidents", "rapidly_slowdown_incidents",
+    "fatigue_driving_incidents", "oil_leak_incidents", "throttle_stop_incidents", "max_speed"
+]
+
+def compute_daily_safety_stats(df):
+    """Per-driver, per-day warning counts, durations and top speed, as in getDriverStatistics"""
+    return df.groupBy("driver_id", "record_date").agg(
+        count(lit(1)).alias("record_count"),
+        *[count(when(col(flag) == 1, 1)).alias(name) for name, flag in SAFETY_INCIDENT_COLUMNS.items()],
+        sum("neutral_slide_time").cast("long").alias("neutral_slide_duration"),
+        sum("overspeed_time").cast("long").alias("overspeed_duration"),
+        max("speed").alias("max_speed")
+    ).select(*DAILY_SAFETY_COLUMNS)
+
+def get_rolled_up_dates():
+    """Return {record_date: readings rolled up} of the days in driver_daily_safety_stats"""
+    conn = db.connect()
+    try:
+        with conn.cursor() as cursor:
+            cursor.execute("SELECT record_date, record_count FROM safety_rollup_watermark")
+            return dict(cursor.fetchall())
+    finally:
+        conn.close()
+
+def replace_dates(df, table, columns, dates, watermark=None):
+    """
+    Replace table's rows of the given record_date values with df's, through {table}_staging, in one transaction
+
+    With watermark, the record_count sum of each new day is stored in that table too.
+    """
+    column_list = ", ".join(columns)
+    conn = db.connect()
+    try:
+        with staging_lock(conn, f"{table}_staging"):
+            write_to_staging(conn, df, f"{table}_staging", columns)
+            with conn.cursor() as cursor:
+                cursor.execute(sql.SQL("DELETE FROM {} WHERE record_date = ANY(%s)").format(sql.Identifier(table)),
+                               (list(dates),))
+                cursor.execute(sql.SQL("INSERT INTO {} ({}) SELECT {} FROM {}").format(
+                    sql.Identifier(table), sql.SQL(column_list), sql.SQL(column_list),
+                    sql.Identifier(f"{table}_staging")
+                ))
+                saved = cursor.rowcount
+                if watermark:
+                    cursor.execute(sql.SQL("DELETE FROM {} WHERE record_date = ANY(%s)").format(sql.Identifier(watermark)),
+                                   (list(dates),))
+                    cursor.execute(sql.SQL("""
+                    INSERT INTO {} (record_date, record_count)
+                    SELECT record_date, sum(record_count) FROM {} GROUP BY record_date
+                    """).format(sql.Identifier(watermark), sql.Identifier(f"{table}_staging")))
+                cursor.execute(sql.SQL("TRUNCATE TABLE {}").format(sql.Identifier(f"{table}_staging")))
+            conn.commit()
+        return saved
+    finally:
+        conn.close()
+
+def save_daily_safety_stats(daily_df, dates):
+    """Replace the rollup rows and watermark of the given dates in one transaction"""
+    return replace_dates(daily_df, "driver_daily_safety_stats", DAILY_SAFETY_COLUMNS, dates,
+                         watermark="safety_rollup_watermark")
+
+def select_dates(spark, source, parquet_path, start_date=None, end_date=None, done=None):
+    """Sorted record_date values of the source inside the range, leaving out those in done"""
+    dates = get_available_dates(spark, source, parquet_path)
+    if start_date:
+        dates = [day for day in dates if day >= date.fromisoformat(str(start_date))]
+    if end_date:
+        dates = [day for day in dates if day <= date.fromisoformat(str(end_date))]
+    if done:
+        dates = [day for day in dates if day not in done]
+    return dates
+
+def run_safety_rollup(spark, source="postgres", parquet_path=PARQUET_PATH, start_date=None, end_date=None,
+                      num_partitions=None, fetch_size=JDBC_FETCH_SIZE, incremental=False):
+    """
+    Rebuild the daily safety rollup for every record_date in the range
+    
+    With incremental set, only days missing from the rollup, or whose readings no longer
+    add up to the rolled-up record_count, are computed. Returns the number of days written.
+    """
+    done = None
+    if incremental:
+        rolled_up = get_rolled_up_dates()
+        done = {day for day, readings in get_date_record_counts(spark, source, parquet_path).items()
+                if rolled_up.get(day) == readings}
+    dates = select_dates(spark, source, parquet_path, start_date, end_date, done)
+    if not dates:
+        print("No days to roll up")
+        return 0
+    
+    print(f"Rolling up {len(dates)} day(s): {dates[0]} to {dates[-1]}")
+    columns = ["driver_id", "record_date", "speed", *SAFETY_INCIDENT_COLUMNS.values(), *DURATION_COLUMNS]
+    if source == "parquet":
+        records_df = load_data_from_parquet(spark, parquet_path, columns=columns, dates=dates)
+    else:
+        records_df = load_data_from_postgres(spark, columns=columns, dates=dates,
+                                             num_partitions=num_partitions, fetch_size=fetch_size)
+    
+    saved = save_daily_safety_stats(compute_daily_safety_stats(records_df), dates)
+    metrics.increment('driver_daily_safety_stats_rows_saved', saved)
+    print(f"Successfully saved {saved} records to driver_daily_safety_stats table")
+    return len(dates)
+
+def parse_spark_time(value):
+    """Parse a timestamp from Spark's REST API, e.g. 2017-01-01T08:00:00.123GMT"""
+    return datetime.strptime(value, "%Y-%m-%dT%H:%M:%S.%f%Z")
+
+def record_spark_stages(spark):
+    """
+    Add the session's completed Spark stages to the metrics registry
+    
+    Reads the driver's local monitoring REST API, so it works offline; stage wall times
+    go to the spark_stage timer and task, executor time and shuffle totals to counters.
+    """
+    ui_url = spark.sparkContext.uiWebUrl
+    if not ui_url:
+        return
+    url = f"{ui_url}/api/v1/applications/{spark.sparkContext.applicationId}/stages?status=complete"
+    try:
+        with urllib.request.urlopen(url, timeout=5) as response:
+            stages = json.load(response)
+    except Exception as e:
+        print(f"Could not read Spark stage metrics: {e}")
+        return
+    for stage in stages:
+        if stage.get("submissionTime") and stage.get("completionTime"):
+            duration = parse_spark_time(stage["completionTime"]) - parse_spark_time(stage["submissionTime"])
+            metrics.observe("spark_stage", duration.total_seconds())
+        metrics.increment("spark_stages")
+        metrics.increment("spark_tasks", stage.get("numCompleteTasks", 0))
+        metrics.increment("spark_executor_run_ms", stage.get("executorRunTime", 0))
+        metrics.increment("spark_input_bytes", stage.get("inputBytes", 0))
+        metrics.increment("spark_shuffle_read_bytes", stage.get("shuffleReadBytes", 0))
+        metrics.increment("spark_shuffle_write_bytes", stage.get("shuffleWriteBytes", 0))
+
+# Bucket widths, in seconds, of the precomputed speed timelines
+TIMELINE_RESOLUTIONS = [1, 10, 60]
+
+TIMELINE_COLUMNS = [
+    "driver_id", "record_date", "resolution", "bucket_start", "readings", "avg_speed", "max_speed",
+    "latitude", "longitude", "direction", "warnings"
+]
+
+def warning_mask():
+    """Column with bit (code - 1) set for each load_data.EVENT_TYPES event a reading raises"""
+    mask = lit(0)
+    for flag, code in EVENT_TYPES.items():
+        raised = col(flag) == 1
+        if flag in EVENT_DURATIONS:
+            raised = raised | (col(EVENT_DURATIONS[flag]) > 0)
+        mask = mask + when(raised, 1 << (code - 1)).otherwise(0)
+    return mask
+
+def compute_speed_timelines(df, resolutions=TIMELINE_RESOLUTIONS):
+    """
+    Time-bucketed speed and position series per driver and record_date
+    
+    Every reading is repeated once per resolution and all resolutions are aggregated in
+    one pass over the input. A bucket keeps its reading count, average and top speed,
+    the position and heading of its last reading, and the OR of its readings' warning
+    masks, so markers stay in place at every resolution.
+    """
+    buckets = df.filter(col("record_time").isNotNull()) \
+        .withColumn("_warnings", warning_mask()) \
+        .withColumn("resolution", explode(array(*[lit(resolution) for resolution in resolutions]))) \
+        .withColumn("bucket_start",
+                    (floor(col("record_time").cast("long") / col("resolution")) * col("resolution")).cast("timestamp"))
+    return buckets.groupBy("driver_id", "record_date", "resolution", "bucket_start").agg(
+        count(lit(1)).alias("readings"),
+        avg("speed").alias("avg_speed"),
+        max("speed").alias("max_speed"),
+        max(struct("record_time", "latitude", "longitude", "direction")).alias("_last"),
+        expr("bit_or(_warnings)").alias("warnings")
+    ).select(
+        "driver_id", "record_date", "resolution", "bucket_start", "readings", "avg_speed", "max_speed",
+        col("_last.latitude").alias("latitude"),
+        col("_last.longitude").alias("longitude"),
+        col("_last.direction").alias("direction"),
+        "warnings"
+    )
+
+def get_timeline_dates(resolutions):
+    """Return the set of record_date values that already have timelines at every resolution"""
+    conn = db.connect()
+    try:
+        with conn.cursor() as cursor:
+            cursor.execute("""
+            SELECT record_date FROM driver_speed_timelines
+            GROUP BY record_date
+            HAVING array_agg(DISTINCT resolution) @> %s
+            """, (list(resolutions),))
+            return {row[0] for row in cursor.fetchall()}
+    finally:
+        conn.close()
+
+def save_speed_timelines(timelines_df, dates, resolutions):
+    """Replace the timelines of the given dates and resolutions in one transaction"""
+    column_list = ", ".join(TIMELINE_COLUMNS)
+    conn = db.connect()
+    try:
+        with staging_lock(conn, "driver_speed_timelines_staging"):
+            write_to_staging(conn, timelines_df, "driver_speed_timelines_staging", TIMELINE_COLUMNS)
+            with conn.cursor() as cursor:
+                cursor.execute(
+                    "DELETE FROM driver_speed_timelines WHERE record_date = ANY(%s) AND resolution = ANY(%s)",
+                    (list(dates), list(resolutions))
+                )
+                cursor.execute(
+                    f"INSERT INTO driver_speed_timelines ({column_list}) "
+                    f"SELECT {column_list} FROM driver_speed_timelines_staging"
+                )
+                saved = cursor.rowcount
+                cursor.execute("TRUNCATE TABLE driver_speed_timelines_staging")
+            conn.commit()
+        return saved
+    finally:
+        conn.close()
+
+def run_speed_timelines(spark, source="postgres", parquet_path=PARQUET_PATH, start_date=None, end_date=None,
+                        num_partitions=None, fetch_size=JDBC_FETCH_SIZE, incremental=False,
+                        resolutions=TIMELINE_RESOLUTIONS):
+    """
+    Rebuild the speed timelines for every record_date in the range
+    
+    With incremental set, only days missing a resolution are computed. Returns the
+    number of days written.
+    """
+    dates = select_dates(spark, source, parquet_path, start_date, end_date,
+                         get_timeline_dates(resolutions) if incremental else None)
+    if not dates:
+        print("No days to build timelines for")
+        return 0
+    
+    print(f"Building {resolutions}s timelines for {len(dates)} day(s): {dates[0]} to {dates[-1]}")
+    columns = ["driver_id", "record_date", "record_time", "speed", "latitude", "longitude", "direction",
+               *EVENT_TYPES, *EVENT_DURATIONS.values()]
+    if source == "parquet":
+        records_df = load_data_from_parquet(spark, parquet_path, columns=columns, dates=dates)
+    else:
+        records_df = load_data_from_postgres(spark, columns=columns, dates=dates,
+                                             num_partitions=num_partitions, fetch_size=fetch_size)
+    
+    saved = save_speed_timelines(compute_speed_timelines(records_df, resolutions), dates, resolutions)
+    metrics.increment('driver_speed_timelines_rows_saved', saved)
+    print(f"Successfully saved {saved} records to driver_speed_timelines table")
+    return len(dates)
+
+GRID_TILE_COLUMNS = [
+    "record_date", "grid_cell", "latitude", "longitude", "readings", "speed_readings", "drivers", "avg_speed",
+    "max_speed",
+    *SAFETY_INCIDENT_COLUMNS
+]
+
+def grid_cell_column():
+    """Spark version of load_data.GRID_CELL_SQL, so Parquet and raw inputs get the same cells"""
+    return floor((col("latitude") + 90) * GRID_CELLS_PER_DEGREE) * GRID_COLUMNS \
+        + floor((col("longitude") + 180) * GRID_CELLS_PER_DEGREE)
+
+def compute_daily_grid_tiles(df):
+    """Per-cell, per-day reading and driver counts, speeds and warning counts of located readings"""
+    tiles = df.filter(col("latitude").isNotNull() & col("longitude").isNotNull()) \
+        .withColumn("grid_cell", grid_cell_column()) \
+        .groupBy("record_date", "grid_cell").agg(
+            count(lit(1)).alias("readings"),
+            count("speed").alias("speed_readings"),
+            countDistinct("driver_id").alias("drivers"),
+            avg("speed").alias("avg_speed"),
+            max("speed").alias("max_speed"),
+            *[count(when(col(flag) == 1, 1)).alias(name) for name, flag in SAFETY_INCIDENT_COLUMNS.items()]
+        )
+    row = floor(col("grid_cell") / GRID_COLUMNS)
+    return tiles \
+        .withColumn("latitude", (row + 0.5) / GRID_CELLS_PER_DEGREE - 90) \
+        .withColumn("longitude", (col("grid_cell") - row * GRID_COLUMNS + 0.5) / GRID_CELLS_PER_DEGREE - 180) \
+        .select(*GRID_TILE_COLUMNS)
+
+def get_tiled_dates():
+    """Return the set of record_date values already in driving_grid_tiles with speed_readings"""
+    conn = db.connect()
+    try:
+        with conn.cursor() as cursor:
+            cursor.execute("SELECT DISTINCT record_date FROM driving_grid_tiles WHERE speed_readings IS NOT NULL")
+            return {row[0] for row in cursor.fetchall()}
+    finally:
+        conn.close()
+
+def run_grid_tiles(spark, source="postgres", parquet_path=PARQUET_PATH, start_date=None, end_date=None,
+                   num_partitions=None, fetch_size=JDBC_FETCH_SIZE, incremental=False):
+    """
+    Rebuild the grid tiles for every record_date in the range
+    
+    With incremental set, only days missing from the tiles are computed. Returns the
+    number of days written.
+    """
+    dates = select_dates(spark, source, parquet_path, start_date, end_date,
+                         get_tiled_dates() if incremental else None)
+    if not dates:
+        print("No days to tile")
+        return 0
+    
+    print(f"Tiling {len(dates)} day(s): {dates[0]} to {dates[-1]}")
+    columns = ["driver_id", "record_date", "latitude", "longitude", "speed", *SAFETY_INCIDENT_COLUMNS.values()]
+    if source == "parquet":
+        records_df = load_data_from_parquet(spark, parquet_path, columns=columns, dates=dates)
+    else:
+        records_df = load_data_from_postgres(spark, columns=columns, dates=dates,
+                                             num_partitions=num_partitions, fetch_size=fetch_size)
+    
+    saved = replace_dates(compute_daily_grid_tiles(records_df), "driving_grid_tiles", GRID_TILE_COLUMNS, dates)
+    metrics.increment('driving_grid_tiles_rows_saved', saved)
+    print(f"Successfully saved {saved} records to driving_grid_tiles table")
+    return len(dates)
+
+# Width in km/h of the speed sketch buckets. A percentile read from the sketches is the
+# lower bound of the bucket holding the exact nearest-rank percentile, so it is at most
+# width - 1 km/h below it; at 1, integer speeds make it exact. Sketches built with
+# different widths do not merge, so changing it means rebuilding every day.
+SPEED_SKETCH_BUCKET_WIDTH = 1
+
+SPEED_SKETCH_COLUMNS = ["driver_id", "record_date", "readings", "speeds", "counts"]
+
+# Nearest-rank p50/p95/p99 per driver from the merged sketches of the days matching {conditions}
+SPEED_PERCENTILES_SQL = """
+WITH merged AS (
+    SELECT driver_id, speed, sum(n) AS n
+    FROM driver_daily_speed_sketches, unnest(speeds, counts) AS bucket(speed, n)
+    WHERE {conditions}
+    GROUP BY driver_id, speed
+),
+cumulative AS (
+    SELECT driver_id, speed,
+           sum(n) OVER (PARTITION BY driver_id ORDER BY speed) AS running,
+           sum(n) OVER (PARTITION BY driver_id) AS readings
+    FROM merged
+)
+SELECT driver_id, readings,
+       min(speed) FILTER (WHERE running >= ceil(0.50 * readings)) AS p50_speed,
+       min(speed) FILTER (WHERE running >= ceil(0.95 * readings)) AS p95_speed,
+       min(speed) FILTER (WHERE running >= ceil(0.99 * readings)) AS p99_speed
+FROM cumulative
+GROUP BY driver_id, readings
+"""
+
+def compute_daily_speed_sketches(df, bucket_width=SPEED_SKETCH_BUCKET_WIDTH):
+    """
+    Per-driver, per-day speed histograms in bucket_width km/h buckets
+    
+    A sketch has one entry per distinct bucket of the day, so its size is bounded by the
+    speed range rather than by the number of readings.
+    """
+    buckets = df.filter(col("speed").isNotNull()) \
+        .withColumn("speed", (floor(col("speed") / bucket_width) * bucket_width).cast("int")) \
+        .groupBy("driver_id", "record_date", "speed").agg(count(lit(1)).alias("n"))
+    return buckets.groupBy("driver_id", "record_date").agg(
+        sum("n").alias("readings"),
+        sort_array(collect_list(struct("speed", "n"))).alias("_buckets")
+    ).select(
+        "driver_id", "record_date", "readings",
+        col("_buckets.speed").alias("speeds"),
+        col("_buckets.n").alias("counts")
+    )
+
+def get_sketched_dates():
+    """Return the set of record_date values already in driver_daily_speed_sketches"""
+    conn = db.connect()
+    try:
+        with conn.cursor() as cursor:
+            cursor.execute("SELECT DISTINCT record_date FROM driver_daily_speed_sketches")
+            return {row[0] for row in cursor.fetchall()}
+    finally:
+        conn.close()
+
+def run_speed_sketches(spark, source="postgres", parquet_path=PARQUET_PATH, start_date=None, end_date=None,
+                       num_partitions=None, fetch_size=JDBC_FETCH_SIZE, incremental=False):
+    """
+    Rebuild the daily speed sketches for every record_date in the range
+    
+    With incremental set, only days missing from the sketches are computed. Returns the
+    number of days written.
+    """
+    dates = select_dates(spark, source, parquet_path, start_date, end_date,
+                         get_sketched_dates() if incremental else None)
+    if not dates:
+        print("No days to sketch")
+        return 0
+    
+    print(f"Sketching {len(dates)} day(s): {dates[0]} to {dates[-1]}")
+    columns = ["driver_id", "record_date", "speed"]
+    if source == "parquet":
+        records_df = load_data_from_parquet(spark, parquet_path, columns=columns, dates=dates)
+    else:
+        records_df = load_data_from_postgres(spark, columns=columns, dates=dates,
+                                             num_partitions=num_partitions, fetch_size=fetch_size)
+    
+    saved = replace_dates(compute_daily_speed_sketches(records_df), "driver_daily_speed_sketches",
+                          SPEED_SKETCH_COLUMNS, dates)
+    metrics.increment('driver_daily_speed_sketches_rows_saved', saved)
+    print(f"Successfully saved {saved} records to driver_daily_speed_sketches table")
+    return len(dates)
+
+def save_speed_percentile_ranking(start_date=None, end_date=None):
+    """
+    Rank drivers by p95 speed over the range and replace driver_speed_percentile_analysis
+    
+    Percentiles come from merging the stored daily sketches inside PostgreSQL, so no
+    readings are read or sorted. Returns the number of drivers ranked.
+    """
+    conditions = ["TRUE"]
+    params = []
+    if start_date:
+        conditions.append("record_date >= %s")
+        params.append(date.fromisoformat(str(start_date)))
+    if end_date:
+        conditions.append("record_date <= %s")
+        params.append(date.fromisoformat(str(end_date)))
+    percentiles_sql = SPEED_PERCENTILES_SQL.format(conditions=" AND ".join(conditions))
+    
+    conn = db.connect()
+    try:
+        with conn.cursor() as cursor:
+            cursor.execute("DELETE FROM driver_speed_percentile_analysis")
+            cursor.execute(f"""
+            INSERT INTO driver_speed_percentile_analysis
+                (driver_id, readings, p50_speed, p95_speed, p99_speed, p95_speed_rank)
+            SELECT driver_id, readings, p50_speed, p95_speed, p99_speed,
+                   row_number() OVER (ORDER BY p95_speed DESC, driver_id)
+            FROM ({percentiles_sql}) AS percentiles
+            """, params)
+            saved = cursor.rowcount
+        conn.commit()
+    finally:
+        conn.close()
+    metrics.increment('driver_speed_percentile_analysis_rows_saved', saved)
+    print(f"Successfully saved {saved} records to driver_speed_percentile_analysis table")
+    return saved
+
+def save_incident_ranking(start_date=None, end_date=None):
+    """
+    Rank drivers by incidents in driving_events and replace driver_incident_analysis
+    
+    driving_events only holds the readings that raised a warning, so the ranking runs
+    inside PostgreSQL without reading driving_records. Returns the number of drivers ranked.
+    """
+    conditions = ["event_type = ANY(%s)"]
+    params = [INCIDENT_EVENT_TYPES]
+    if start_date:
+        conditions.append("record_time >= %s")
+        params.append(date.fromisoformat(str(start_date)))
+    if end_date:
+        conditions.append("record_time < %s")
+        params.append(date.fromisoformat(str(end_date)) + timedelta(days=1))
+    
+    conn = db.connect()
+    try:
+        with conn.cursor() as cursor:
+            cursor.execute("DELETE FROM driver_incident_analysis")
+            cursor.execute(f"""
+            INSERT INTO driver_incident_analysis (driver_id, incidents, incident_rank)
+            SELECT driver_id, count(*), row_number() OVER (ORDER BY count(*) DESC, driver_id)
+            FROM driving_events
+            WHERE {' AND '.join(conditions)}
+            GROUP BY driver_id
+            """, params)
+            saved = cursor.rowcount
+        conn.commit()
+    finally:
+        conn.close()
+    metrics.increment('driver_incident_analysis_rows_saved', saved)
+    print(f"Successfully saved {saved} records to driver_incident_analysis table")
+    return saved
+
+def main(source="postgres", parquet_path=PARQUET_PATH, start_date=None, end_date=None,
+         num_partitions=None, fetch_size=JDBC_FETCH_SIZE, incremental=False, safety_rollup=False, engine="auto",
+         incident_ranking=False, timeline_resolutions=None, grid_tiles=False, speed_percentiles=False):
+    """
+    Run the driver speed analysis and store the rankings in PostgreSQL
+    
+    Args:
+        source: "postgres" to read driving_records over JDBC, "parquet" to read the Parquet dataset
+        parquet_path: Root of the Parquet dataset when source is "parquet"
+        start_date: First record_date to analyze (inclusive, None for no lower bound)
+        end_date: Last record_date to analyze (inclusive, None for no upper bound)
+        num_partitions: Number of parallel JDBC reads when source is "postgres"
+        fetch_size: JDBC fetch size when source is "postgres"
+        incremental: Only aggregate days not processed before and merge them into the
+            stored daily partials (the date range is ignored)
+        safety_rollup: Also rebuild driver_daily_safety_stats for the same days
+        engine: "spark", "local" (pandas, no JVM) or "auto" to pick local for small inputs.
+            "local" with incremental or a Spark-only stage raises ValueError
+        incident_ranking: Also rank drivers by incidents from driving_events (any engine)
+        timeline_resolutions: Also rebuild driver_speed_timelines at these bucket widths
+            in seconds for the same days (None to skip)
+        grid_tiles: Also rebuild driving_grid_tiles for the same days
+        speed_percentiles: Also rebuild driver_daily_speed_sketches for the same days and
+            rank drivers by p95 speed over the date range
+    """
+    from local_analysis import choose_engine, run_local_analysis
+    engine = choose_engine(engine, source, parquet_path, start_date, end_date, incremental,
+                           safety_rollup or bool(timeline_resolutions) or grid_tiles or speed_percentiles)
+    if engine == "local":
+        print("Running analysis with the local engine...")
+        with metrics.timer("local_analysis"):
+            run_local_analysis(source, parquet_path, start_date, end_date)
+        if incident_ranking:
+            print("Ranking drivers by incidents...")
+            with metrics.timer("incident_ranking"):
+                save_incident_ranking(start_date, end_date)
+        metrics.flush(job="spark_analysis", engine="local")
+        print("Analysis complete!")
+        return
+    
     # Set up Hadoop environment for Windows
     try:
         from setup_hadoop import setup_hadoop_for_windows
@@ -176,46 +1405,78 @@ def main():
     try:
         # Initialize Spark
         print("Initializing Spark...")
-        spark = initialize_spark()
+        with metrics.timer("spark_init"):
+            spark = initialize_spark()
         
-        # Load data from PostgreSQL
-        print("Loading data from PostgreSQL...")
         try:
-            driving_records_df = load_data_from_postgres(spark)
+            if incremental:
+                print("Running incremental analysis...")
+                with metrics.timer("incremental_merge"):
+                    analysis_df = run_incremental_analysis(spark, source, parquet_path, num_partitions, fetch_size)
+            else:
+                if source == "parquet":
+                    print(f"Loading data from Parquet at {parquet_path}...")
+                    driving_records_df = load_data_from_parquet(
+                        spark, parquet_path, start_date, end_date, columns=["driver_id", "speed"]
+                    )
+                else:
+                    # Load data from PostgreSQL
+                    print("Loading data from PostgreSQL...")
+                    driving_records_df = load_data_from_postgres(
+                        spark, start_date, end_date, columns=["driver_id", "speed"],
+                        num_partitions=num_partitions, fetch_size=fetch_size
+                    )
             
-            # Get count for progress tracking
-            total_records = driving_records_df.count()
-            print(f"Loaded {total_records} records from database")
+                # Get count for progress tracking
+                with metrics.timer("load_input"):
+                    total_records = driving_records_df.count()
+                metrics.increment("input_records", total_records)
+                print(f"Loaded {total_records} records from database")
             
-            # Analyze driver speeds
-            print("Analyzing driver speeds...")
-            # Add a simple progress indicator for Spark operations
-            print("[" + "="*10 + "] Calculating average speeds")
-            avg_speeds = driving_records_df.groupBy("driver_id").agg(avg("speed").alias("avg_speed"))
+                # Analyze driver speeds
+                print("Analyzing driver speeds...")
+                analysis_df = analyze_driver_speeds(driving_records_df)
             
-            print("[" + "="*20 + "] Calculating top speeds")
-            top_speeds = driving_records_df.groupBy("driver_id").agg(max("speed").alias("top_speed"))
+            # Show sample results
+            print("\nSample analysis results (top 10 by average speed):")
+            with metrics.timer("show_sample"):
+                analysis_df.orderBy("avg_speed_rank").show(10)
             
-            print("[" + "="*30 + "] Joining datasets")
-            combined_df = avg_speeds.join(top_speeds, "driver_id")
+            # Save results to PostgreSQL
+            print("Saving results to PostgreSQL...")
+            with metrics.timer("save_results"):
+                save_to_postgres(analysis_df)
             
-            print("[" + "="*40 + "] Calculating rankings")
-            window_avg = Window.orderBy(desc("avg_speed"))
-            window_top = Window.orderBy(desc("top_speed"))
+            if safety_rollup:
+                print("Building daily safety rollup...")
+                with metrics.timer("safety_rollup"):
+                    run_safety_rollup(spark, source, parquet_path, start_date, end_date,
+                                      num_partitions, fetch_size, incremental)
             
-            analysis_df = combined_df \
-                .withColumn("avg_speed_rank", row_number().over(window_avg)) \
-                .withColumn("top_speed_rank", row_number().over(window_top))
+            if timeline_resolutions:
+                print("Building speed timelines...")
+                with metrics.timer("speed_timelines"):
+                    run_speed_timelines(spark, source, parquet_path, start_date, end_date,
+                                        num_partitions, fetch_size, incremental, timeline_resolutions)
             
-            print("[" + "="*50 + "] Analysis complete!")
+            if grid_tiles:
+                print("Building grid tiles...")
+                with metrics.timer("grid_tiles"):
+                    run_grid_tiles(spark, source, parquet_path, start_date, end_date,
+                                   num_partitions, fetch_size, incremental)
             
-            # Show sample results
-            print("\nSample analysis results (top 10 by average speed):")
-            analysis_df.orderBy("avg_speed_rank").show(10)
+            if speed_percentiles:
+                print("Building speed sketches...")
+                with metrics.timer("speed_sketches"):
+                    run_speed_sketches(spark, source, parquet_path, start_date, end_date,
+                                       num_partitions, fetch_size, incremental)
+                with metrics.timer("speed_percentile_ranking"):
+                    save_speed_percentile_ranking(start_date, end_date)
             
-            # Save results to PostgreSQL
-            print("Saving results to PostgreSQL...")
-            save_to_postgres(analysis_df)
+            if incident_ranking:
+                print("Ranking drivers by incidents...")
+                with metrics.timer("incident_ranking"):
+                    save_incident_ranking(start_date, end_date)
             
             print("Analysis complete!")
         except Exception as e:
@@ -229,7 +1490,58 @@ def main():
     finally:
         # Stop Spark session if it was created
         if 'spark' in locals():
+            record_spark_stages(spark)
             spark.stop()
+        metrics.flush(job="spark_analysis", engine="spark")
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Driver speed analysis")
+    parser.add_argument('--source', choices=['postgres', 'parquet'], default='postgres')
+    parser.add_argument('--parquet-path', default=PARQUET_PATH)
+    parser.add_argument('--start-date', help="First record_date to analyze (YYYY-MM-DD)")
+    parser.add_argument('--end-date', help="Last record_date to analyze (YYYY-MM-DD)")
+    parser.add_argument('--jdbc-partitions', type=int, default=None, help="Parallel JDBC reads (default: Spark parallelism)")
+    parser.add_argument('--fetch-size', type=int, default=JDBC_FETCH_SIZE)
+    parser.add_argument('--incremental', action='store_true',
+                        help="Only aggregate record_date values not processed yet and merge them into the totals")
+    parser.add_argument('--safety-rollup', action='store_true',
+                        help="Also rebuild the per-driver daily safety rollup used by the dashboard")
+    parser.add_argument('--incident-ranking', action='store_true',
+                        help="Also rank drivers by incidents from the driving_events table")
+    parser.add_argument('--timelines', nargs='?', const=','.join(map(str, TIMELINE_RESOLUTIONS)),
+                        type=lambda value: [int(seconds) for seconds in value.split(',')], metavar='SECONDS',
+                        help="Also rebuild the downsampled speed timelines, at these comma-separated bucket "
+                             "widths (default: %(const)s)")
+    parser.add_argument('--grid-tiles', action='store_true',
+                        help="Also rebuild the per-cell, per-day grid tiles used for regional and heatmap queries")
+    parser.add_argument('--speed-percentiles', action='store_true',
+                        help="Also rebuild the daily speed sketches and rank drivers by p95 speed")
+    parser.add_argument('--engine', choices=['auto', 'spark', 'local'], default='auto',
+                        help="auto runs inputs up to LOCAL_ENGINE_MAX_ROWS rows without Spark")
+    parser.add_argument('--to-parquet', choices=['records', 'postgres'],
+                        help="Only build the Parquet dataset, from raw files or from the driving_records table")
+    parser.add_argument('--records-path', default='records', help="Raw detail_record_* files for --to-parquet records")
+    parser.add_argument('--compression', default='snappy')
+    parser.add_argument('--metrics-jsonl', help="Append run metrics as JSON lines to this file")
+    parser.add_argument('--metrics-prom', help="Write run metrics to this Prometheus textfile")
+    args = parser.parse_args()
+    metrics.configure(args.metrics_jsonl, args.metrics_prom)
+    if args.engine == 'local' and (args.incremental or args.safety_rollup or args.timelines or args.grid_tiles
+                                   or args.speed_percentiles):
+        parser.error("--incremental, --safety-rollup, --timelines, --grid-tiles and --speed-percentiles "
+                     "need Spark; use --engine spark or auto")
+    
+    if args.to_parquet:
+        spark = initialize_spark()
+        try:
+            if args.to_parquet == 'records':
+                convert_records_to_parquet(spark, args.records_path, args.parquet_path, args.compression)
+            else:
+                export_postgres_to_parquet(spark, args.parquet_path, args.compression)
+            print(f"Parquet dataset written to {args.parquet_path}")
+        finally:
+            spark.stop()
+    else:
+        main(args.source, args.parquet_path, args.start_date, args.end_date,
+             args.jdbc_partitions, args.fetch_size, args.incremental, args.safety_rollup, args.engine,
+             args.incident_ranking, args.timelines, args.grid_tiles, args.speed_percentiles)
\ No newline at end of file